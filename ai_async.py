@@ -0,0 +1,65 @@
+"""
+Mednitai — Async AI Worker
+==========================
+event loop אחד על thread רקע, עם httpx.AsyncClient משותף.
+כל דוח AI רץ כ-coroutine — מאות דוחות במקביל בלי thread לכל אחד.
+"""
+
+import asyncio
+import threading
+
+try:
+    import httpx
+except ImportError:  # בלי httpx — הדוחות רצים ב-threads (requests)
+    httpx = None
+
+ASYNC_MAX_CONNECTIONS = 100
+ASYNC_MAX_KEEPALIVE = 20
+ASYNC_MAX_REPORTS = 64  # דוחות שרצים במקביל על ה-loop
+
+
+class AsyncAIWorker:
+    """
+    event loop שרץ לתמיד על thread משלו. submit(coro) מחזיר concurrent.futures.Future
+    רגיל — כך שהקוד של Streamlit בודק done() / result() כמו קודם.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._client = None
+        self._thread = threading.Thread(target=self._run, name="ai_async_loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def client(self):
+        """ה-client המשותף — נוצר בתוך ה-loop ונשאר פתוח (keep-alive). רק מתוך coroutine."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=ASYNC_MAX_KEEPALIVE))
+        return self._client
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_async_worker():
+    """ה-worker של התהליך, או None אם httpx לא מותקן."""
+    global _worker
+    if httpx is None:
+        return None
+    with _worker_lock:
+        if _worker is None:
+            _worker = AsyncAIWorker()
+    return _worker
+
+
+def async_client():
+    return get_async_worker().client()
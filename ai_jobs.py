@@ -0,0 +1,351 @@
+"""
+Mednitai — AI Job Queue
+=======================
+טבלת עבודות AI מקומית (SQLite) — כל דוח נרשם כאן לפני שמתחיל להיכתב.
+עבודה שלא הסתיימה (האפליקציה נרדמה / הופעלה מחדש) נאספת ע"י worker —
+בתוך האפליקציה או בתהליך נפרד (python -m ai_worker) — והדוח נכתב למבחן.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from database import update_ai_report
+from gemini_ai import (
+    get_multi_ai_analysis, get_integrity_ai_analysis, get_combined_ai_analysis,
+    get_multi_ai_analysis_async, get_integrity_ai_analysis_async, get_combined_ai_analysis_async,
+)
+from save_journal import backoff_delay, decode_payload, encode_payload
+
+JOBS_FILE = "ai_jobs.sqlite3"
+AI_JOB_LEASE_SECONDS = 600      # עבודה שרצה יותר מזה בלי לסיים — נחשבת נטושה ונאספת מחדש
+AI_JOB_GRACE_SECONDS = 120      # ה-worker המובנה משאיר עבודה חדשה ל-scheduler של הסשן לפני שלוקח אותה
+AI_JOB_MAX_ATTEMPTS = 3
+AI_JOB_RETENTION_SECONDS = 7 * 24 * 3600
+# UPDATE ... RETURNING נתמך מ-SQLite 3.35; בגרסה ישנה יותר — SELECT ואז UPDATE בתוך BEGIN IMMEDIATE
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (status, next_attempt_at, created_at);
+"""
+
+# עבודה שאפשר לקחת: ממתינה שהגיע זמנה, או רצה שה-lease שלה פג
+_CLAIMABLE = ("((status = 'queued' AND next_attempt_at <= :now AND created_at <= :born_before) "
+              "OR (status = 'running' AND lease_until < :now))")
+
+
+def _default_data_dir():
+    return os.environ.get("MEDNITAI_DATA_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data"))
+
+
+class AIJobQueue:
+    """
+    id (doc_id של המבחן) → עבודה: queued → running → done / error.
+    claim מעדכן שורה אחת ב-UPDATE אחד (או SELECT+UPDATE תחת נעילת כתיבה) — בטוח גם בין
+    כמה תהליכים על אותו קובץ.
+    """
+
+    def __init__(self, path=None, lease=AI_JOB_LEASE_SECONDS, max_attempts=AI_JOB_MAX_ATTEMPTS):
+        if path is None:
+            data_dir = _default_data_dir()
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, JOBS_FILE)
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def enqueue(self, job_id, key, payload):
+        """רושם עבודה (אותו id פעמיים — נשארת הראשונה). מחזיר True אם נוספה."""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, key, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, key, encode_payload(payload), now, now))
+            self._conn.commit()
+            return cur.rowcount == 1
+
+    def claim(self, worker, job_id=None, min_age=0.0):
+        """
+        לוקח עבודה לריצה: job_id מסוים, או הוותיקה ביותר שממתינה לפחות min_age שניות.
+        מחזיר {'id', 'key', 'payload', 'attempts'} או None.
+        """
+        now = time.time()
+        params = {'now': now, 'born_before': now - min_age, 'worker': worker,
+                  'lease_until': now + self.lease}
+        if job_id is None:
+            target = f"(SELECT id FROM jobs WHERE {_CLAIMABLE} ORDER BY created_at LIMIT 1)"
+        else:
+            target, params['id'] = ":id", job_id
+        update = ("UPDATE jobs SET status = 'running', worker = :worker, lease_until = :lease_until, "
+                  "attempts = attempts + 1, updated_at = :now ")
+        with self._lock:
+            if _HAS_RETURNING:
+                row = self._conn.execute(
+                    f"{update} WHERE id = {target} AND {_CLAIMABLE} RETURNING id, key, payload, attempts",
+                    params).fetchone()
+                self._conn.commit()
+            else:
+                row = self._claim_locked(update, target, params)
+        if row is None:
+            return None
+        return {'id': row[0], 'key': row[1], 'payload': decode_payload(row[2]), 'attempts': row[3]}
+
+    def _claim_locked(self, update, target, params):
+        """claim בלי RETURNING: BEGIN IMMEDIATE נועל לכתיבה, כך שאין תהליך אחר בין ה-SELECT ל-UPDATE."""
+        self._conn.commit()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                f"SELECT id, key, payload, attempts + 1 FROM jobs WHERE id = {target} AND {_CLAIMABLE}",
+                params).fetchone()
+            if row is not None:
+                self._conn.execute(f"{update} WHERE id = :claimed", dict(params, claimed=row[0]))
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        return row
+
+    def finish(self, job_id, worker, result):
+        """
+        שומר את התוצאה של מי שמחזיק בעבודה. status 'error' בתוצאה — ניסיון נוסף
+        עם backoff, עד max_attempts. False אם העבודה כבר נלקחה ע"י worker אחר.
+        """
+        now = time.time()
+        failed = result.get('status') == 'error'
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'",
+                                     (job_id, worker)).fetchone()
+            if row is None:
+                return False
+            if failed and row[0] < self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, next_attempt_at = ?, error = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (now + backoff_delay(row[0]), str(result.get('error'))[:500], now, job_id))
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                    ('error' if failed else 'done', encode_payload(result),
+                     str(result.get('error'))[:500] if failed else None, now, job_id))
+            self._conn.commit()
+        return True
+
+    def get(self, job_id):
+        """{'status', 'result', 'error', 'attempts'} או None."""
+        with self._lock:
+            row = self._conn.execute("SELECT status, result, error, attempts FROM jobs WHERE id = ?",
+                                     (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'result': decode_payload(row[1]) if row[1] else None,
+                'error': row[2], 'attempts': row[3]}
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'error')}
+
+    def prune(self, older_than=AI_JOB_RETENTION_SECONDS):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND updated_at < ?",
+                               (time.time() - older_than,))
+            self._conn.commit()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+_queue_init_attempted = False
+
+
+def get_ai_job_queue():
+    """טבלת העבודות של התהליך — None אם אי אפשר לפתוח אותה (אז הדוח רץ רק בזיכרון)."""
+    global _queue, _queue_init_attempted
+    if _queue is not None or _queue_init_attempted:
+        return _queue
+    with _queue_lock:
+        if not _queue_init_attempted:
+            _queue_init_attempted = True
+            try:
+                _queue = AIJobQueue()
+            except Exception:
+                _queue = None
+    return _queue
+
+
+# ============================================================
+# הרצת דוח — משותף ל-scheduler של האפליקציה ול-worker החיצוני
+# ============================================================
+def _plain(data):
+    """DataFrame → dict עמודות ({'Trait': {...}, 'Mean': {...}}) — נקרא חזרה ע"י _parse_to_simple_dict."""
+    return data.to_dict() if isinstance(data, pd.DataFrame) else data
+
+
+def ai_payload(username, test_type, s_data, i_data, rel, cont, hes, hist, doc_key=None):
+    """כל מה שצריך כדי להפיק דוח — בלי st.session_state, נשמר כ-JSON בטבלה."""
+    return {
+        'username': username,
+        'test_type': test_type,
+        's_data': _plain(s_data),
+        'i_data': _plain(i_data),
+        'rel': rel,
+        'cont': cont,
+        'hes': hes,
+        'hist': hist,
+        'doc_key': list(doc_key) if doc_key else None,
+    }
+
+
+def ai_callbacks(partial):
+    """callbacks שכותבים ל-dict המשותף: טקסט מצטבר לכל ספק + סימון סיום."""
+    if partial is None:
+        return {'on_result': None, 'on_delta': None}
+
+    def on_delta(provider, text):
+        partial[provider] = text
+
+    def on_result(provider, text):
+        partial[provider] = text
+        partial[f'{provider}_done'] = True
+
+    return {'on_result': on_result, 'on_delta': on_delta}
+
+
+def _empty_result():
+    return {
+        'gemini': None,
+        'claude': None,
+        'status': 'done',
+        'error': None,
+        'saved_to_db': False,
+    }
+
+
+def run_ai_report(payload, partial=None):
+    """
+    פונקציה טהורה — לא נוגעת ב-st.session_state.
+    מקבלת payload (ai_payload), מחזירה dict עם התוצאה.
+    doc_key — (collection, doc_id) של המבחן שנשמר: הדוח נכתב אליו בסיום.
+    partial — dict משותף: הטקסט של כל ספק מתעדכן בו תוך כדי streaming,
+    ו-'<provider>_done' מסומן כשהספק סיים (לתצוגה חלקית).
+    """
+    result = _empty_result()
+    p = payload
+    callbacks = ai_callbacks(partial)
+    try:
+        g, c = None, None
+        if p['test_type'] in ('hexaco', 'quick', 'haifa'):
+            g, c = get_multi_ai_analysis(p['username'], p['s_data'], p['hist'], test_type=p['test_type'],
+                                         **callbacks)
+        elif p['test_type'] == 'integrity':
+            g, c = get_integrity_ai_analysis(p['username'], p['rel'], p['cont'], p['s_data'], p['hist'], **callbacks)
+        elif p['test_type'] == 'combined':
+            g, c = get_combined_ai_analysis(p['username'], p['s_data'], p['rel'], p['cont'], p['hist'], **callbacks)
+
+        result['gemini'] = g
+        result['claude'] = c
+        # הציונים נשמרו כבר ב-thread הראשי — כאן מחליפים את הודעת ה-"נשמר..." בדוח עצמו
+        doc_key = p.get('doc_key')
+        if doc_key and doc_key[0] and doc_key[1]:
+            result['saved_to_db'] = update_ai_report(doc_key[0], doc_key[1], [g, c])
+
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+        result['gemini'] = f"שגיאה בהפקת ניתוח AI: {str(e)}"
+
+    return result
+
+
+async def run_ai_report_async(payload, partial=None):
+    """
+    כמו run_ai_report — אבל coroutine שרץ על ה-event loop של ai_async (בלי thread לכל דוח).
+    רק הכתיבה ל-DB עוברת ל-thread קצר.
+    """
+    result = _empty_result()
+    p = payload
+    callbacks = ai_callbacks(partial)
+    try:
+        g, c = None, None
+        if p['test_type'] in ('hexaco', 'quick', 'haifa'):
+            g, c = await get_multi_ai_analysis_async(p['username'], p['s_data'], p['hist'],
+                                                     test_type=p['test_type'], **callbacks)
+        elif p['test_type'] == 'integrity':
+            g, c = await get_integrity_ai_analysis_async(p['username'], p['rel'], p['cont'], p['s_data'],
+                                                         p['hist'], **callbacks)
+        elif p['test_type'] == 'combined':
+            g, c = await get_combined_ai_analysis_async(p['username'], p['s_data'], p['rel'], p['cont'],
+                                                        p['hist'], **callbacks)
+
+        result['gemini'] = g
+        result['claude'] = c
+        doc_key = p.get('doc_key')
+        if doc_key and doc_key[0] and doc_key[1]:
+            result['saved_to_db'] = await asyncio.to_thread(update_ai_report, doc_key[0], doc_key[1], [g, c])
+
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+        result['gemini'] = f"שגיאה בהפקת ניתוח AI: {str(e)}"
+
+    return result
+
+
+# ============================================================
+# עבודה מהטבלה — claim, הרצה, שמירת התוצאה
+# ============================================================
+def _external_result():
+    """העבודה כבר נלקחה ע"י worker אחר — מסך התוצאות ימשיך לבדוק בטבלה."""
+    result = _empty_result()
+    result['status'] = 'external'
+    return result
+
+
+def run_ai_job(job_id, payload, worker, partial=None):
+    """מריץ עבודה אם הצלחנו לקחת אותה; בלי טבלה — מריץ את ה-payload ישירות."""
+    queue = get_ai_job_queue()
+    if queue is None:
+        return run_ai_report(payload, partial)
+    job = queue.claim(worker, job_id=job_id)
+    if job is None:
+        return _external_result()
+    result = run_ai_report(job['payload'], partial)
+    queue.finish(job_id, worker, result)
+    return result
+
+
+async def run_ai_job_async(job_id, payload, worker, partial=None):
+    queue = get_ai_job_queue()
+    if queue is None:
+        return await run_ai_report_async(payload, partial)
+    job = await asyncio.to_thread(queue.claim, worker, job_id)
+    if job is None:
+        return _external_result()
+    result = await run_ai_report_async(job['payload'], partial)
+    await asyncio.to_thread(queue.finish, job_id, worker, result)
+    return result
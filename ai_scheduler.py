@@ -0,0 +1,199 @@
+"""
+Mednitai — AI Job Scheduler
+===========================
+תור עבודות AI חסום ומתועדף, משותף לכל הסשנים.
+עבודה אחת בכל רגע לכל משתמש/מבחן, מיקום בתור למשתמש, ביטול כשעוזבים,
+ו-backpressure: כשהתור המיידי מלא — הדוח נדחה ומופק ברקע להיסטוריה.
+"""
+
+import heapq
+import inspect
+import itertools
+import threading
+from concurrent.futures import Future
+
+PRIORITY_INTERACTIVE = 0  # המשתמש מחכה במסך התוצאות
+PRIORITY_DEFERRED = 1     # הדוח נכתב להיסטוריה בלבד — רק כשיש worker פנוי
+
+AI_WORKERS = 4
+AI_EMBEDDED_WORKERS = 1   # ה-worker של ai_jobs בתוך תהליך האפליקציה (ai_worker.start_embedded_worker)
+AI_MAX_QUEUE = 8          # עבודות מיידיות שממתינות — מעבר לזה נדחות
+AI_MAX_DEFERRED = 100
+
+
+class AIJob(Future):
+    """Future רגיל (done / result) + פרטי התזמון."""
+
+    def __init__(self, key, tag, priority, fn, args, kwargs):
+        super().__init__()
+        self.key = key
+        self.tag = tag
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.seq = None
+
+    @property
+    def deferred(self):
+        return self.priority == PRIORITY_DEFERRED
+
+
+class AIScheduler:
+    """
+    workers קבועים שמושכים מתור עדיפויות (מיידי לפני נדחה, ואז לפי סדר הגעה).
+    key — משתמש + סוג מבחן; tag — המבחן עצמו (doc_id). submit עם אותו key+tag
+    מחזיר את העבודה הקיימת, ו-tag חדש מחליף עבודה ממתינה ישנה.
+    runner(coro) -> concurrent Future: עבודה שהיא coroutine נשלחת אליו (event loop)
+    וה-worker לא נתקע עליה — max_running קובע כמה עבודות רצות יחד.
+    """
+
+    def __init__(self, workers=AI_WORKERS, max_queue=AI_MAX_QUEUE, max_deferred=AI_MAX_DEFERRED,
+                 runner=None, max_running=None):
+        self.runner = runner
+        self.max_running = max_running or workers
+        self.max_queue = max_queue
+        self.max_deferred = max_deferred
+        self._heap = []
+        self._by_key = {}      # key -> עבודה ממתינה או רצה
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = [threading.Thread(target=self._worker, name=f"ai_worker_{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    # ---------- הגשה ----------
+    def submit(self, key, tag, fn, *args, **kwargs):
+        """
+        מגיש עבודה מיידית. אם התור המיידי מלא — היא נכנסת כנדחית (job.deferred).
+        מחזיר None אם גם תור הנדחות מלא.
+        """
+        with self._cond:
+            existing = self._by_key.get(key)
+            if existing is not None and existing.tag == tag and not existing.cancelled():
+                return existing
+            if existing is not None:
+                self._demote(existing)
+
+            job = AIJob(key, tag, PRIORITY_INTERACTIVE, fn, args, kwargs)
+            if self._count(PRIORITY_INTERACTIVE) >= self.max_queue:
+                job.priority = PRIORITY_DEFERRED
+                if self._count(PRIORITY_DEFERRED) >= self.max_deferred:
+                    return None
+            self._push(job)
+            self._by_key[key] = job
+            return job
+
+    def cancel(self, job, keep_deferred=True):
+        """
+        המשתמש עזב את מסך התוצאות. עבודה שעוד ממתינה מפנה את מקומה בתור המיידי:
+        עם keep_deferred היא ממשיכה כנדחית (הדוח עדיין יגיע להיסטוריה), אחרת מבוטלת.
+        עבודה שכבר רצה — ממשיכה עד הסוף.
+        """
+        with self._cond:
+            if job is None or job.done() or job in self._running:
+                return False
+            if not keep_deferred:
+                return self._drop(job)
+            if not job.deferred:
+                self._demote(job)
+            return True
+
+    def position(self, job):
+        """0 = רצה עכשיו, n = כמה עבודות לפניה בתור, None = הסתיימה/לא ידועה."""
+        with self._cond:
+            if job is None or job.done():
+                return None
+            if job in self._running:
+                return 0
+            rank = (job.priority, job.seq)
+            return 1 + sum(1 for p, s, j in self._heap
+                           if (p, s) < rank and not j.cancelled() and j.seq == s)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'running': len(self._running),
+                'queued': self._count(PRIORITY_INTERACTIVE),
+                'deferred': self._count(PRIORITY_DEFERRED),
+            }
+
+    # ---------- פנימי ----------
+    def _count(self, priority):
+        return sum(1 for p, s, j in self._heap if p == priority and not j.cancelled() and j.seq == s)
+
+    def _push(self, job):
+        job.seq = next(self._seq)
+        heapq.heappush(self._heap, (job.priority, job.seq, job))
+        self._cond.notify()
+
+    def _demote(self, job):
+        """מעביר עבודה ממתינה לתור הנדחות (רשומה ישנה ב-heap מדולגת לפי seq)."""
+        if job in self._running or job.done():
+            return
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        if job.deferred:
+            return
+        if self._count(PRIORITY_DEFERRED) >= self.max_deferred:
+            self._drop(job)
+            return
+        job.priority = PRIORITY_DEFERRED
+        self._push(job)
+
+    def _drop(self, job):
+        if self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        return job.cancel()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while self._heap and len(self._running) < self.max_running:
+                    priority, seq, job = heapq.heappop(self._heap)
+                    if job.seq != seq or job.priority != priority:
+                        continue  # רשומה ישנה של עבודה שהועברה
+                    if job.set_running_or_notify_cancel():
+                        self._running.add(job)
+                        return job
+                self._cond.wait()
+
+    def _finish(self, job, result=None, error=None):
+        if error is not None:
+            job.set_exception(error)
+        else:
+            job.set_result(result)
+        with self._cond:
+            self._running.discard(job)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            self._cond.notify_all()
+
+    def _finish_from(self, job, bridged):
+        try:
+            result = bridged.result()
+        except BaseException as e:
+            self._finish(job, error=e)
+        else:
+            self._finish(job, result)
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if self.runner is not None and inspect.iscoroutinefunction(job.fn):
+                # רצה על ה-event loop — ה-worker חוזר מיד לתור
+                try:
+                    bridged = self.runner(job.fn(*job.args, **job.kwargs))
+                except BaseException as e:
+                    self._finish(job, error=e)
+                    continue
+                bridged.add_done_callback(lambda f, job=job: self._finish_from(job, f))
+                continue
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                self._finish(job, error=e)
+            else:
+                self._finish(job, result)
@@ -0,0 +1,142 @@
+"""
+Mednitai — AI Worker
+====================
+מרוקן את טבלת עבודות ה-AI (ai_jobs) וכותב את הדוחות למבחנים ב-Firestore.
+רץ כ-thread בתוך האפליקציה (עבודות שנשארו מהפעלה קודמת), או כתהליך נפרד:
+
+    python -m ai_worker --threads 4 --secrets /path/to/secrets.toml
+
+המפתחות — מ---secrets (או MEDNITAI_SECRETS_FILE), מ-.streamlit/secrets.toml, או ממשתני סביבה.
+
+כשיש worker חיצוני — MEDNITAI_AI_WORKER=external, והאפליקציה רק רושמת עבודות ובודקת אותן.
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+
+from ai_jobs import AI_JOB_GRACE_SECONDS, get_ai_job_queue, run_ai_report
+from ai_scheduler import AI_EMBEDDED_WORKERS
+from database import start_save_flusher
+from gemini_ai import set_report_threads
+from secrets_config import load_secrets_file
+
+AI_WORKER_IDLE_SECONDS = 2.0   # המתנה כשאין עבודות
+AI_WORKER_MODE_ENV = "MEDNITAI_AI_WORKER"
+
+
+def external_worker_enabled():
+    """האם הדוחות מופקים ע"י תהליך worker נפרד (ולא ע"י ה-scheduler של האפליקציה)."""
+    return os.environ.get(AI_WORKER_MODE_ENV, "").strip().lower() == "external"
+
+
+def worker_id(suffix=""):
+    """מזהה ייחודי ל-worker: host + pid (+ thread) — כך finish לא דורס עבודה שעברה למישהו אחר."""
+    return f"{socket.gethostname()}:{os.getpid()}{':' + suffix if suffix else ''}"
+
+
+class AIJobWorker:
+    """
+    לולאה שלוקחת עבודה אחת בכל פעם (claim), מריצה את הדוח ושומרת את התוצאה.
+    min_age — עבודות צעירות מזה נשארות ל-scheduler של הסשן שרשם אותן.
+    """
+
+    def __init__(self, queue, name="", min_age=0.0, idle=AI_WORKER_IDLE_SECONDS):
+        self.queue = queue
+        self.worker = worker_id(name)
+        self.min_age = min_age
+        self.idle = idle
+        self.processed = 0
+
+    def run_once(self):
+        """מריץ עבודה אחת אם יש. מחזיר True אם רצה עבודה."""
+        job = self.queue.claim(self.worker, min_age=self.min_age)
+        if job is None:
+            return False
+        result = run_ai_report(job['payload'])
+        self.queue.finish(job['id'], self.worker, result)
+        self.processed += 1
+        return True
+
+    def run_forever(self, stop=None):
+        while stop is None or not stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                pass
+            time.sleep(self.idle)
+
+
+_embedded = None
+_embedded_lock = threading.Lock()
+
+
+def start_embedded_worker():
+    """
+    AI_EMBEDDED_WORKERS workers בתוך תהליך האפליקציה (פעם אחת לתהליך): אוספים עבודות שנשארו
+    אחרי הפעלה מחדש או שחיכו יותר מדי בתור. לא רץ כשיש worker חיצוני.
+    """
+    global _embedded
+    queue = get_ai_job_queue()
+    if queue is None or _embedded is not None or external_worker_enabled():
+        return _embedded
+    with _embedded_lock:
+        if _embedded is None:
+            _embedded = [AIJobWorker(queue, name=f"embedded{i}", min_age=AI_JOB_GRACE_SECONDS)
+                         for i in range(AI_EMBEDDED_WORKERS)]
+            for i, w in enumerate(_embedded):
+                threading.Thread(target=w.run_forever, name=f"ai_job_worker_{i}", daemon=True).start()
+    return _embedded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mednitai AI report worker")
+    parser.add_argument("--threads", type=int, default=2, help="כמה דוחות במקביל")
+    parser.add_argument("--once", action="store_true", help="לרוקן את מה שממתין עכשיו ולצאת")
+    parser.add_argument("--secrets", help="קובץ secrets.toml (ברירת מחדל: st.secrets / משתני סביבה)")
+    args = parser.parse_args(argv)
+
+    if args.secrets:
+        try:
+            load_secrets_file(args.secrets)
+        except (OSError, ValueError) as e:
+            print(f"ai_worker: cannot read secrets file {args.secrets}: {e}")
+            return 1
+
+    queue = get_ai_job_queue()
+    if queue is None:
+        print("ai_worker: cannot open the AI job table")
+        return 1
+    queue.prune()
+    # הדוחות נכתבים דרך יומן השמירות — ה-flusher של התהליך הזה מעביר אותם ל-Firestore
+    flusher = start_save_flusher()
+
+    set_report_threads(max(1, args.threads))
+    workers = [AIJobWorker(queue, name=f"t{i}") for i in range(max(1, args.threads))]
+    if args.once:
+        for w in workers:
+            while w.run_once():
+                pass
+        if flusher is not None:
+            while flusher.flush_once():
+                pass
+        print(f"ai_worker: processed {sum(w.processed for w in workers)} job(s)")
+        return 0
+
+    print(f"ai_worker: {len(workers)} thread(s) on {queue.path}")
+    threads = [threading.Thread(target=w.run_forever, name=f"ai_job_worker_{i}", daemon=True)
+               for i, w in enumerate(workers)]
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
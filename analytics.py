@@ -0,0 +1,342 @@
+"""
+Mednitai — Live Analytics
+=========================
+מצב ניתוח מצטבר — מתעדכן בכל תשובה (ב-_handle_answer), כך שבסוף המבחן
+רק קוראים את הערכים הסופיים במקום לחשב הכל מחדש.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from integrity_logic import integrity_frames
+from logic import results_frames
+from scoring import (count_gap_pairs, effective_score, fatigue_score, integrity_reliability_score,
+                     moments_std, parse_answer, parse_time, smart_reliability_score,
+                     std_above, std_below, summary_columns)
+from similarity import jaccard, trigrams
+
+HEXACO_TRAITS = frozenset({'Conscientiousness', 'Honesty-Humility', 'Agreeableness',
+                           'Emotionality', 'Extraversion', 'Openness to Experience'})
+
+# ערכי reverse לזיהוי הסתירות החכמות (בלי ערכי העברית)
+_SMART_REVERSE = ('true', '1', '1.0', 'yes', 't')
+_CONTROL_TRUE = ('1', '1.0', 'true')
+_SCORE_VALUES = np.arange(6)
+
+# תת-קבוצות של תשובות לפי (is_video, is_hexaco)
+SUBSETS = {
+    'all': lambda video, hexaco: True,
+    'hexaco': lambda video, hexaco: hexaco,
+    'other': lambda video, hexaco: not hexaco,
+    'hexaco_text': lambda video, hexaco: hexaco and not video,
+    'other_text': lambda video, hexaco: not hexaco and not video,
+}
+
+
+def _is_missing(key):
+    try:
+        return bool(pd.isna(key))
+    except (TypeError, ValueError):
+        return False
+
+
+class _Moments:
+    """סכומים רצים לקבוצה אחת (תכונה/קטגוריה)."""
+    __slots__ = ('n', 's1', 's2', 't_n', 't_sum', 'hist', 'fast5', 'meta_n', 'meta_s1', 'meta_s2')
+
+    def __init__(self):
+        self.n = self.s1 = self.s2 = 0
+        self.t_n = 0
+        self.t_sum = 0.0
+        self.hist = [0] * 6
+        self.fast5 = 0
+        self.meta_n = self.meta_s1 = self.meta_s2 = 0
+
+    def add(self, entry, sign):
+        s = entry.score
+        self.n += sign
+        self.s1 += sign * s
+        self.s2 += sign * s * s
+        self.hist[s] += sign
+        if not math.isnan(entry.time32):
+            self.t_n += sign
+            self.t_sum += sign * entry.time32
+        if entry.time < 5:
+            self.fast5 += sign
+        if entry.is_meta:
+            self.meta_n += sign
+            self.meta_s1 += sign * s
+            self.meta_s2 += sign * s * s
+
+
+def _same_response(a, b):
+    """אותה תשובה — אותו אובייקט, או אותה שורה ביומן (ResponseLog מחזיר תצוגה חדשה בכל קריאה)."""
+    return a is b or a == b
+
+
+class _Entry:
+    """תשובה אחת כפי שנכנסה למצב המצטבר."""
+    __slots__ = ('response', 'question', 'answer', 'score', 'time', 'time32', 'trait', 'category',
+                 'is_video', 'is_hexaco', 'is_meta', 'smart_score', 'smart_trait', 'raw_answer',
+                 'qid', 'grams', 'n_candidates', 'fast14')
+
+
+class LiveAnalytics:
+    """
+    מצב מצטבר של מבחן אחד:
+    - סכומים/ריבועים/ספירות לכל תכונה וקטגוריה (לסיכומים ולאמינות)
+    - ספירת תשובות מהירות
+    - סט ה-trigrams של כל שאלה + מועמדי סתירה שנמצאו עד עכשיו
+    - סכומים מצטברים (prefix) לחלונות העייפות
+
+    sync(responses) מיישר את המצב לרשימת התשובות — כולל pop של כפתור "חזור".
+    """
+
+    def __init__(self, bank=None, similarity_threshold=0.30, min_score_gap=2.5):
+        self.similarity_threshold = similarity_threshold
+        self.min_score_gap = min_score_gap
+        # טבלת הדמיון של המאגר שימושית רק אם הסף שלה לא גבוה משלנו
+        self.bank = bank if bank is not None and bank.threshold <= similarity_threshold else None
+        self.entries = []
+        self._traits = {}       # (video, hexaco, trait) -> _Moments
+        self._categories = {}   # (video, hexaco, category) -> _Moments
+        self._by_smart_score = {s: [] for s in range(1, 6)}
+        self._answers = {}      # תשובה (int) -> ספירה; תשובות שלא ניתנות לפירוש לא נספרות
+        self._fast14 = 0
+        self._candidates = []   # (i, j, record, involves_video)
+        self._grams_cache = {}
+        # prefix sums לחלונות העייפות
+        self._p_time = [0.0]
+        self._p_time_n = [0]
+        self._p_ans = [0]
+        self._p_ans2 = [0]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # ============================================================
+    # Push / Pop
+    # ============================================================
+    def sync(self, responses):
+        """מיישר את המצב לרשימה — מוריד תשובות שהוסרו/הוחלפו ומוסיף חדשות."""
+        entries = self.entries
+        while entries and (len(entries) > len(responses)
+                           or not _same_response(entries[-1].response, responses[len(entries) - 1])):
+            self.pop()
+        for r in responses[len(entries):]:
+            self.push(r)
+        return self
+
+    def _grams(self, text, qid):
+        if qid is not None:
+            return self.bank.sets[qid]
+        grams = self._grams_cache.get(text)
+        if grams is None:
+            grams = self._grams_cache[text] = trigrams(text)
+        return grams
+
+    def _similarity(self, a, b):
+        if a.qid is not None and b.qid is not None:
+            if a.qid == b.qid:
+                return 1.0 if a.grams else 0.0
+            return self.bank.neighbors.get(a.qid, {}).get(b.qid, 0.0)
+        return jaccard(a.grams, b.grams)
+
+    def push(self, r):
+        e = _Entry()
+        pos = len(self.entries)
+        e.response = r
+        e.question = str(r.get('question', ''))
+        e.answer = r.get('answer', 3)
+        e.score = effective_score(e.answer, r.get('reverse', False))
+        e.time = parse_time(r.get('response_time', 0))
+        e.time32 = float(np.float32(e.time))
+        e.trait = r.get('trait', '')
+        e.category = r.get('category', r.get('trait', ''))
+        e.is_video = bool(r.get('is_video', False))
+        e.is_hexaco = r.get('trait') in HEXACO_TRAITS
+        e.is_meta = str(r.get('is_stress_meta', 0)).strip().lower() in _CONTROL_TRUE
+        e.smart_trait = r.get('trait', r.get('category', ''))
+        e.raw_answer = parse_answer(e.answer)
+        e.qid = self.bank.question_id(e.question) if self.bank is not None else None
+        e.grams = self._grams(e.question, e.qid)
+        e.n_candidates = len(self._candidates)
+
+        tag = (e.is_video, e.is_hexaco)
+        self._traits.setdefault(tag + (e.trait,), _Moments()).add(e, 1)
+        self._categories.setdefault(tag + (e.category,), _Moments()).add(e, 1)
+        if e.raw_answer is not None:
+            self._answers[e.raw_answer] = self._answers.get(e.raw_answer, 0) + 1
+        e.fast14 = parse_time(r.get('response_time', 99)) < 1.4
+        self._fast14 += e.fast14
+
+        # חלונות עייפות
+        t = e.time if e.time > 0 else 0
+        a = e.answer if isinstance(e.answer, (int, float)) else 0
+        self._p_time.append(self._p_time[-1] + t)
+        self._p_time_n.append(self._p_time_n[-1] + (1 if t > 0 else 0))
+        self._p_ans.append(self._p_ans[-1] + a)
+        self._p_ans2.append(self._p_ans2[-1] + a * a)
+
+        # מועמדי סתירה — רק מול תשובות קודמות עם פער מספיק
+        e.smart_score = None
+        if e.raw_answer is not None:
+            is_rev = str(r.get('reverse', False)).strip().lower() in _SMART_REVERSE
+            e.smart_score = max(1, min(5, (6 - e.raw_answer) if is_rev else e.raw_answer))
+            for s, positions in self._by_smart_score.items():
+                if abs(s - e.smart_score) < self.min_score_gap:
+                    continue
+                for i in positions:
+                    self._add_candidate(i, pos, e)
+            self._by_smart_score[e.smart_score].append(pos)
+
+        self.entries.append(e)
+
+    def _add_candidate(self, i, j, b):
+        a = self.entries[i]
+        sim = self._similarity(a, b)
+        if sim < self.similarity_threshold:
+            return
+        gap = abs(a.smart_score - b.smart_score)
+        severity = 'critical' if (gap >= 3.5 and sim >= 0.45) else 'high'
+        self._candidates.append((i, j, {
+            'q1': a.question,
+            'q2': b.question,
+            'ans1': a.raw_answer,
+            'ans2': b.raw_answer,
+            'score1': a.smart_score,
+            'score2': b.smart_score,
+            'gap': round(gap, 1),
+            'similarity': round(sim, 2),
+            'trait': a.smart_trait,
+            'severity': severity,
+            'message': f"שתי שאלות דומות עם תשובות הפוכות — דמיון {int(sim*100)}%, פער {int(gap)}"
+        }, a.is_video or b.is_video))
+
+    def pop(self):
+        """מבטל את התשובה האחרונה (כפתור "חזור")."""
+        e = self.entries.pop()
+        tag = (e.is_video, e.is_hexaco)
+        self._traits[tag + (e.trait,)].add(e, -1)
+        self._categories[tag + (e.category,)].add(e, -1)
+        if e.raw_answer is not None:
+            self._answers[e.raw_answer] -= 1
+            if not self._answers[e.raw_answer]:
+                del self._answers[e.raw_answer]
+        self._fast14 -= e.fast14
+        for prefix in (self._p_time, self._p_time_n, self._p_ans, self._p_ans2):
+            prefix.pop()
+        if e.smart_score is not None:
+            self._by_smart_score[e.smart_score].pop()
+        del self._candidates[e.n_candidates:]
+        return e.response
+
+    # ============================================================
+    # Read-off — ערכים סופיים
+    # ============================================================
+    def _select(self, table, subset):
+        keep = SUBSETS[subset]
+        merged = {}
+        for (video, hexaco, key), m in table.items():
+            if m.n and keep(video, hexaco):
+                merged.setdefault(key, []).append(m)
+        return merged
+
+    def _entries(self, subset):
+        keep = SUBSETS[subset]
+        return [e for e in self.entries if keep(e.is_video, e.is_hexaco)]
+
+    def _aggregates(self, table, subset):
+        """סכומי התכונות/קטגוריות של תת-הקבוצה — כמו ResponseBatch.trait_aggregates."""
+        groups = {k: ms for k, ms in self._select(table, subset).items() if not _is_missing(k)}
+        names = sorted(groups)
+        sums = [[sum(getattr(m, field) for m in groups[name]) for name in names]
+                for field in ('n', 's1', 's2', 't_n', 't_sum')]
+        return summary_columns(names, *sums)
+
+    def hexaco_frames(self, subset='all'):
+        """(df_raw, summary) — כמו process_results על תת-הקבוצה."""
+        entries = self._entries(subset)
+        if not entries:
+            return pd.DataFrame(), pd.DataFrame()
+        return results_frames([e.response for e in entries], [e.score for e in entries],
+                              self._aggregates(self._traits, subset))
+
+    def integrity_frames(self, subset='all'):
+        """(df_raw, summary) — כמו process_integrity_results על תת-הקבוצה."""
+        entries = self._entries(subset)
+        if not entries:
+            return pd.DataFrame(), pd.DataFrame()
+        return integrity_frames([e.response for e in entries], [e.score for e in entries],
+                                self._aggregates(self._categories, subset))
+
+    def integrity_reliability(self, subset='all'):
+        """כמו calculate_reliability_score על df_raw של תת-הקבוצה — מתוך ההיסטוגרמות."""
+        groups = self._select(self._categories, subset)
+        moments = [m for ms in groups.values() for m in ms]
+        n = sum(m.n for m in moments)
+        if not n:
+            return 100
+
+        # סתירות בקטגוריה (פער >= 3) + חוסר עקביות בשאלות מטא
+        hist = np.array([[sum(m.hist[v] for m in ms) for v in _SCORE_VALUES]
+                         for key, ms in groups.items() if not _is_missing(key)], dtype=np.int64)
+        high = int(count_gap_pairs(_SCORE_VALUES, hist.reshape(-1, len(_SCORE_VALUES)), 3).sum())
+        meta_n = sum(m.meta_n for m in moments)
+        if meta_n > 1 and std_above(meta_n, sum(m.meta_s1 for m in moments),
+                                    sum(m.meta_s2 for m in moments), 0.8):
+            high += 1
+
+        poly = groups.get('polygraph')
+        return integrity_reliability_score(
+            n, high=high,
+            fast_count=sum(m.fast5 for m in moments),
+            monotone=std_below(n, sum(m.s1 for m in moments), sum(m.s2 for m in moments), 0.3),
+            extreme_count=sum(m.hist[1] + m.hist[5] for m in moments),
+            polygraph_mean=sum(m.s1 for m in poly) / sum(m.n for m in poly) if poly else None)
+
+    def smart_contradictions(self, include_video=True, limit=10):
+        """
+        סתירות חכמות: זוגות שאלות דומות (דמיון trigram) שקיבלו תשובות רחוקות —
+        מתוך המועמדים שנאספו בכל תשובה, מהדומות ביותר.
+        """
+        candidates = [c for c in self._candidates if include_video or not c[3]]
+        candidates.sort(key=lambda c: (c[0], c[1]))
+        records = [c[2] for c in candidates]
+        records.sort(key=lambda x: (-x['similarity'], -x['gap']))
+        return records[:limit]
+
+    def smart_reliability(self, contradictions, is_binary=False):
+        """אמינות מותאמת (scoring.smart_reliability_score) — מתוך הספירות."""
+        if not self.entries:
+            return 100
+        return smart_reliability_score(contradictions, self._fast14, self._answers, is_binary=is_binary)
+
+    def fatigue_index(self):
+        """כמו calculate_fatigue_index — חלונות שליש ראשון/אחרון מתוך ה-prefix sums."""
+        n = len(self.entries)
+        if n < 9:
+            return 0
+        try:
+            third = n // 3
+            p_t, p_tn, p_a, p_a2 = self._p_time, self._p_time_n, self._p_ans, self._p_ans2
+
+            def avg_time(start):
+                count = p_tn[n] - p_tn[start]
+                return (p_t[n] - p_t[start]) / count if count else None
+
+            first_n = p_tn[third]
+            last = self.entries[n - min(10, third):]
+            return fatigue_score(
+                third,
+                avg_first=p_t[third] / first_n if first_n else None,
+                avg_last=avg_time(n - third),
+                avg_tail=avg_time(n - max(1, n // 10)),
+                first_std=moments_std(third, p_a[third], p_a2[third], ddof=0),
+                last_std=moments_std(third, p_a[n] - p_a[n - third], p_a2[n] - p_a2[n - third], ddof=0),
+                tail_unique=len(set(e.answer for e in last)),
+            )
+        except Exception:
+            return 0
@@ -14,7 +14,6 @@ Mednitai HEXACO System — Main Application (v2.0)
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from streamlit_autorefresh import st_autorefresh
 import html
 import uuid
 import time
@@ -22,29 +21,44 @@ import random
 import math
 import threading
 import os
+from functools import lru_cache
+from streamlit.errors import StreamlitAPIException
 from streamlit.runtime.scriptrunner import add_script_run_ctx
 
 from logic import (
-    process_results, calculate_medical_fit, calculate_reliability_index,
+    calculate_medical_fit, calculate_reliability_index,
     get_inconsistent_questions, analyze_consistency, create_pdf_report,
-    create_excel_download, get_balanced_questions, calculate_fatigue_index,
-    calculate_dynamic_wpm_threshold
+    create_excel_download
 )
 from integrity_logic import (
-    get_integrity_questions, process_integrity_results,
-    detect_contradictions, calculate_reliability_score,
+    get_integrity_questions,
+    detect_contradictions,
     get_integrity_interpretation, get_category_risk_level
 )
 from gemini_ai import (
-    get_multi_ai_analysis, get_integrity_ai_analysis,
-    get_combined_ai_analysis, get_radar_chart,
-    get_comparison_chart, create_token_gauge
+    get_radar_chart, get_comparison_chart, create_token_gauge, get_http_pool_stats, get_prompt_token_stats,
+    async_ai_available,
+    get_report_cache_stats, get_gemini_key_health, get_claude_model_resolution
 )
+from scoring import effective_score, parse_reverse
+from similarity import load_bank_index
+from question_timer import countdown_timer, measured_response_time, question_timer
+from analytics import LiveAnalytics
+from session_store import QuestionList, ResponseLog
+from question_catalog import QUESTION_META_CACHE_SIZE, QuestionCatalog, question_meta
+from ai_scheduler import AIScheduler
+from ai_async import ASYNC_MAX_REPORTS, get_async_worker
+from ai_jobs import ai_payload, get_ai_job_queue, run_ai_job, run_ai_job_async
+from ai_worker import external_worker_enabled, start_embedded_worker, worker_id
 from database import (
     save_to_db, save_integrity_test_to_db, save_combined_test_to_db,
     save_haifa_test_to_db, get_haifa_history,
     get_db_history, get_integrity_history, get_combined_history,
-    get_all_tests, get_db_status
+    get_admin_summaries, get_admin_candidate_tests,
+    refresh_admin_cache, get_admin_stats, compute_admin_stats,
+    get_admin_user_names, get_admin_user_summaries, rebuild_admin_stats,
+    TEST_TYPE_COLLECTIONS, get_db_status,
+    start_save_flusher, get_save_state, get_save_journal_stats
 )
 
 # ============================================================
@@ -550,11 +564,6 @@ TRAIT_DIRECTIONS = {
 }
 
 
-# מילון מילות-מפתח שמרמזות על "מתחייב" או "נשלל" בהיגד
-NEGATION_HINTS = ['לא ', 'אין ', 'אינני', 'אינו ', 'אינה ', 'נמנע', 'מתקשה',
-                  'מתרחק', 'מסרב', 'בורח', 'אסור']
-
-
 # ============================================================
 # Haifa Simulation — תרגול חיפה
 # ============================================================
@@ -969,70 +978,46 @@ def get_haifa_questions(count=80, video_count=4):
     meta_pool = []
     meta_categories = {'polygraph', 'regret', 'honesty_meta'}
     
+    catalog = _get_question_catalog()
+    
     # ~45% HEXACO
     hex_count = int(count * 0.45)
-    try:
-        hex_df = load_hexaco_questions()
-        if not hex_df.empty:
-            hex_sample = pd.DataFrame(get_balanced_questions(hex_df, total_limit=hex_count))
-            for _, row in hex_sample.iterrows():
-                q_dict = row.to_dict()
-                q_dict['quiz_format'] = 'haifa_text'
-                q_dict['source'] = 'hexaco'
-                questions.append(q_dict)
-    except Exception:
-        pass
+    hexaco = catalog.hexaco
+    if len(hexaco):
+        questions.extend(hexaco.rows(hexaco.balanced(hex_count), quiz_format='haifa_text', source='hexaco'))
     
     # ~45% אמינות (תרחישים בלבד — מטא נשמר בנפרד)
     int_count = int(count * 0.45)
-    if int_count > 0:
-        try:
-            int_df = load_integrity_questions_csv()
-            if not int_df.empty:
-                cat_col = 'category' if 'category' in int_df.columns else 'trait'
-                if cat_col in int_df.columns:
-                    # תרחישים רגילים
-                    int_filtered = int_df[~int_df[cat_col].isin(meta_categories)]
-                    if not int_filtered.empty:
-                        int_sample = int_filtered.sample(n=min(int_count, len(int_filtered)))
-                        for _, row in int_sample.iterrows():
-                            q_dict = row.to_dict()
-                            qtype = str(q_dict.get('question_type', '')).strip().lower()
-                            
-                            if qtype in ('multi_attitude', 'multi_state', 'quantity'):
-                                # שאלה שנכתבה כבר בפורמט חדש — שומרים כמו שהיא
-                                q_dict['quiz_format'] = qtype
-                            else:
-                                # שאלת סולם רגילה — נגוון את פורמט התשובה אקראית!
-                                # זה מדמה את מה שראית במבחן: אותה שאלה במהות
-                                # מופיעה בכל פעם בפורמט תשובה אחר.
-                                # 40% סולם הסכמה / 30% כן-לא / 30% תדירות
-                                format_choice = random.random()
-                                if format_choice < 0.4:
-                                    q_dict['quiz_format'] = 'haifa_text'  # סולם 1-5
-                                elif format_choice < 0.7:
-                                    q_dict['quiz_format'] = 'auto_yesno'  # כן/לא
-                                else:
-                                    q_dict['quiz_format'] = 'auto_frequency'  # תדירות
-                            
-                            q_dict['source'] = 'integrity'
-                            q_dict['is_scenario'] = True
-                            if 'trait' not in q_dict and 'category' in q_dict:
-                                q_dict['trait'] = q_dict['category']
-                            questions.append(q_dict)
-                    
-                    # שאלות מטא — נשמרות בנפרד להזרקה אקראית
-                    meta_df = int_df[int_df[cat_col].isin(meta_categories)]
-                    for _, row in meta_df.iterrows():
-                        q_dict = row.to_dict()
-                        q_dict['quiz_format'] = 'haifa_text'
-                        q_dict['source'] = 'meta'
-                        q_dict['is_meta_question'] = True
-                        if 'trait' not in q_dict and 'category' in q_dict:
-                            q_dict['trait'] = q_dict['category']
-                        meta_pool.append(q_dict)
-        except Exception:
-            pass
+    integrity = catalog.integrity
+    if int_count > 0 and len(integrity) and integrity.group_column is not None:
+        meta_mask = integrity.group_mask(meta_categories)
+        
+        # תרחישים רגילים
+        for i in integrity.sample(int_count, ~meta_mask):
+            qtype = str(integrity.row(i).get('question_type', '')).strip().lower()
+            
+            if qtype in ('multi_attitude', 'multi_state', 'quantity'):
+                # שאלה שנכתבה כבר בפורמט חדש — שומרים כמו שהיא
+                quiz_format = qtype
+            else:
+                # שאלת סולם רגילה — נגוון את פורמט התשובה אקראית!
+                # זה מדמה את מה שראית במבחן: אותה שאלה במהות
+                # מופיעה בכל פעם בפורמט תשובה אחר.
+                # 40% סולם הסכמה / 30% כן-לא / 30% תדירות
+                format_choice = random.random()
+                if format_choice < 0.4:
+                    quiz_format = 'haifa_text'  # סולם 1-5
+                elif format_choice < 0.7:
+                    quiz_format = 'auto_yesno'  # כן/לא
+                else:
+                    quiz_format = 'auto_frequency'  # תדירות
+            
+            questions.extend(_scenario_rows(integrity, [i], quiz_format=quiz_format,
+                                            source='integrity', is_scenario=True))
+        
+        # שאלות מטא — נשמרות בנפרד להזרקה אקראית
+        meta_pool = _scenario_rows(integrity, integrity.indices(meta_mask), quiz_format='haifa_text',
+                                   source='meta', is_meta_question=True)
     
     random.shuffle(questions)
     
@@ -1170,21 +1155,6 @@ def should_inject_followup_video(responses, current_q, already_injected_categori
 
 
 
-def detect_statement_polarity(question_text):
-    """
-    מזהה האם ההיגד "מתחייב" את התכונה (חיובי) או "שולל" אותה (בעל שלילה).
-    מחזיר: 'affirms' (מתחייב) / 'negates' (שולל) / 'neutral'
-    """
-    text = str(question_text).lower()
-    
-    # סופרים מילות שלילה
-    negation_count = sum(1 for hint in NEGATION_HINTS if hint in text)
-    
-    if negation_count >= 1:
-        return 'negates'
-    return 'affirms'
-
-
 def get_decision_tree_analysis(question_data):
     """
     מבצע את עץ ההחלטה של מכון נועם:
@@ -1193,12 +1163,21 @@ def get_decision_tree_analysis(question_data):
     3. מתחייב/שולל בהיגד
     4. תשובה מומלצת
     
-    מחזיר dict עם כל השלבים — לתצוגה למשתמש.
+    מחזיר dict עם כל השלבים — לתצוגה למשתמש (משותף בין הקריאות — לקריאה בלבד).
     """
-    trait = question_data.get('trait', question_data.get('category', ''))
-    text = str(question_data.get('q', question_data.get('question', '')))
-    is_reverse = str(question_data.get('reverse', False)).strip().lower() in ['true', '1', '1.0', 'yes']
-    
+    return _decision_tree_analysis(*_question_key(question_data))
+
+
+def _question_key(question_data):
+    """השדות הסטטיים של השאלה שמהם נגזרים עץ ההחלטה והטיפ: (תכונה, קטגוריה, טקסט, הפוכה)."""
+    return (question_data.get('trait', question_data.get('category', '')),
+            question_data.get('category', ''),
+            str(question_data.get('q', question_data.get('question', ''))),
+            parse_reverse(question_data.get('reverse', False)))
+
+
+@lru_cache(maxsize=QUESTION_META_CACHE_SIZE)
+def _decision_tree_analysis(trait, category, text, is_reverse):
     trait_info = TRAIT_DIRECTIONS.get(trait)
     trait_he = TRAIT_DICT.get(trait, trait)
     
@@ -1207,7 +1186,6 @@ def get_decision_tree_analysis(question_data):
         # תרחישים שליליים
         negative_cats = {'theft', 'drugs', 'gambling', 'unethical', 'termination', 'academic'}
         positive_cats = {'whistleblowing', 'feedback', 'teamwork'}
-        category = question_data.get('category', '')
         
         if category in negative_cats:
             return {
@@ -1215,14 +1193,14 @@ def get_decision_tree_analysis(question_data):
                 'trait_he': category,
                 'direction': 'negative',
                 'direction_label': '🔴 התנהגות שלילית מובהקת',
-                'polarity': detect_statement_polarity(text),
+                'polarity': _question_meta(text).polarity,
                 'recommended': 'לא נכון',
                 'recommended_value': 2,
                 'why': 'התנהגויות כאלה (גניבה, סמים, וכו\') לא יכולות לאפיין רופא.',
                 'reasoning_chain': [
                     f"1️⃣ סוג ההיגד: תרחיש אמינות (קטגוריה: {category})",
                     f"2️⃣ זה תיאור של התנהגות שלילית מובהקת",
-                    f"3️⃣ לכן: {'נכון' if detect_statement_polarity(text) == 'negates' else 'לא נכון'}"
+                    f"3️⃣ לכן: {'נכון' if _question_meta(text).polarity == 'negates' else 'לא נכון'}"
                 ]
             }
         elif category in positive_cats:
@@ -1231,7 +1209,7 @@ def get_decision_tree_analysis(question_data):
                 'trait_he': category,
                 'direction': 'positive',
                 'direction_label': '🟢 התנהגות חיובית',
-                'polarity': detect_statement_polarity(text),
+                'polarity': _question_meta(text).polarity,
                 'recommended': 'נכון',
                 'recommended_value': 4,
                 'why': 'אלה התנהגויות שמתאימות לרופא — שיתוף פעולה, יושרה, אחריות.',
@@ -1245,7 +1223,7 @@ def get_decision_tree_analysis(question_data):
     
     # שאלת HEXACO רגילה
     direction = trait_info['direction']
-    polarity = detect_statement_polarity(text)
+    polarity = _question_meta(text).polarity
     
     # מטריצת ההחלטה של מכון נועם:
     # תכונה חיובית + מתחייבת = נכון
@@ -1340,102 +1318,6 @@ def get_decision_tree_analysis(question_data):
     }
 
 
-# ============================================================
-# Smart Contradiction Detection — Trigram-Based Hebrew Similarity
-# ============================================================
-def _clean_for_trigrams(text):
-    """ניקוי טקסט לפני יצירת trigrams — שומרים על אותיות ורווחים בלבד."""
-    import re
-    text = str(text).lower()
-    # רק אותיות עברית/אנגלית + רווח
-    text = re.sub(r'[^\u05D0-\u05EA\u05F0-\u05F4a-z\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
-
-def _trigrams(text, n=3):
-    """יוצר סט של תת-מחרוזות באורך n מהטקסט.
-    שיטה עמידה למורפולוגיה עברית — מתעלם מקידומות וסיומות.
-    """
-    text = _clean_for_trigrams(text)
-    if len(text) < n:
-        return set()
-    return set(text[i:i+n] for i in range(len(text) - n + 1))
-
-
-def _text_similarity(text1, text2):
-    """דמיון Jaccard על trigrams — מתאים מאוד לעברית.
-    מחזיר 0.0 - 1.0.
-    """
-    t1 = _trigrams(text1, n=3)
-    t2 = _trigrams(text2, n=3)
-    if not t1 or not t2:
-        return 0.0
-    intersection = t1 & t2
-    union = t1 | t2
-    return len(intersection) / len(union) if union else 0.0
-
-
-def find_smart_contradictions(responses, similarity_threshold=0.30, min_score_gap=2.5):
-    """
-    מזהה סתירות אמיתיות:
-    שאלות שאומרות דברים דומים (לפי דמיון trigram) — אבל קיבלו תשובות שונות מאוד.
-    
-    threshold=0.30: מעל זה נחשב "דומה" (מתאים לעברית).
-    min_score_gap=2.5: לפחות פער 2.5 בציונים נחשב סתירה.
-    """
-    contradictions = []
-    if not responses or len(responses) < 2:
-        return contradictions
-    
-    # חישוב הציון בפועל (אחרי reverse) לכל תשובה
-    items = []
-    for i, r in enumerate(responses):
-        try:
-            answer = int(r.get('answer', 3))
-            is_reverse = str(r.get('reverse', False)).strip().lower() in ['true', '1', '1.0', 'yes', 't']
-            score = (6 - answer) if is_reverse else answer
-            score = max(1, min(5, score))
-            items.append({
-                'idx': i,
-                'question': str(r.get('question', '')),
-                'raw_answer': answer,
-                'score': score,
-                'trait': r.get('trait', r.get('category', '')),
-                'reverse': is_reverse,
-            })
-        except Exception:
-            continue
-    
-    # השוואה בין כל זוג שאלות
-    for i in range(len(items)):
-        for j in range(i + 1, len(items)):
-            a, b = items[i], items[j]
-            
-            sim = _text_similarity(a['question'], b['question'])
-            
-            if sim >= similarity_threshold:
-                gap = abs(a['score'] - b['score'])
-                if gap >= min_score_gap:
-                    severity = 'critical' if (gap >= 3.5 and sim >= 0.45) else 'high'
-                    contradictions.append({
-                        'q1': a['question'],
-                        'q2': b['question'],
-                        'ans1': a['raw_answer'],
-                        'ans2': b['raw_answer'],
-                        'score1': a['score'],
-                        'score2': b['score'],
-                        'gap': round(gap, 1),
-                        'similarity': round(sim, 2),
-                        'trait': a['trait'],
-                        'severity': severity,
-                        'message': f"שתי שאלות דומות עם תשובות הפוכות — דמיון {int(sim*100)}%, פער {int(gap)}"
-                    })
-    
-    contradictions.sort(key=lambda x: (-x['similarity'], -x['gap']))
-    return contradictions[:10]
-
-
 def calculate_pressure_stability(responses):
     """
     מחשב מדד יציבות תחת לחץ.
@@ -1569,68 +1451,7 @@ def calculate_pressure_stability(responses):
 
 def _calc_effective(response):
     """ציון אפקטיבי בתכונה (אחרי reverse)."""
-    try:
-        ans = int(response.get('answer', 3))
-        is_rev = str(response.get('reverse', False)).strip().lower() in ['true', '1', '1.0', 'yes', 't']
-        score = (6 - ans) if is_rev else ans
-        return max(1, min(5, score))
-    except Exception:
-        return 3
-
-
-def calculate_smart_reliability(responses, contradictions, is_binary=False):
-    """
-    מחשב אמינות מותאם — עם תיקונים:
-    1. במבחן בינארי, לא מענישים על "תשובות קיצוניות" (כולן בינאריות)
-    2. סופר רק סתירות אמיתיות (מהפונקציה החכמה)
-    """
-    if not responses:
-        return 100
-    
-    score = 100.0
-    
-    # סתירות חכמות — קנס לפי חומרה
-    for c in contradictions:
-        if c.get('severity') == 'critical':
-            score -= 12  # פחות אגרסיבי מהמקור
-        else:
-            score -= 6
-    
-    # תשובות מהירות מדי
-    fast_count = sum(1 for r in responses if r.get('response_time', 99) < 1.4)
-    score -= fast_count * 2
-    
-    # מונוטוניות (תשובות זהות)
-    answers = [int(r.get('answer', 3)) for r in responses]
-    if len(answers) > 5:
-        unique = len(set(answers))
-        if is_binary:
-            # במבחן בינארי, מינימום 2 ערכים זה נורמלי
-            if unique == 1:
-                score -= 30  # רק 1 ערך = רק "כן" או רק "לא" → דגל גדול
-        else:
-            # במבחן רגיל
-            if unique <= 1:
-                score -= 30
-            elif unique == 2:
-                score -= 15
-        
-        # פיזור (std)
-        try:
-            import statistics
-            std = statistics.stdev(answers)
-            if not is_binary and std < 0.3:
-                score -= 15
-        except Exception:
-            pass
-    
-    # קיצוניות — *לא* בודקים במבחן בינארי
-    if not is_binary and len(answers) > 0:
-        extreme_ratio = sum(1 for a in answers if a in (1, 5)) / len(answers)
-        if extreme_ratio > 0.7:
-            score -= 20
-    
-    return max(0, min(100, round(score)))
+    return effective_score(response.get('answer', 3), response.get('reverse', False))
 
 
 # ============================================================
@@ -1650,24 +1471,70 @@ def _find_csv(filename):
     return filename  # יחזיר את המקורי גם אם לא נמצא, נטפל בשגיאה במקום אחר
 
 
-@st.cache_data
-def load_hexaco_questions():
-    try:
-        path = _find_csv("questions.csv")
-        return pd.read_csv(path)
-    except Exception as e:
-        st.error(f"שגיאה בטעינת שאלות HEXACO: {e}")
-        return pd.DataFrame()
+def _bank_files_signature():
+    """(נתיב, mtime, גודל) לכל CSV — מפתח ה-cache בזיכרון מתעדכן כשקובץ משתנה."""
+    sig = []
+    for filename in ("questions.csv", "integrity_questions.csv"):
+        path = _find_csv(filename)
+        try:
+            stat = os.stat(path)
+            sig.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            sig.append((path, 0, 0))
+    return tuple(sig)
 
 
-@st.cache_data
-def load_integrity_questions_csv():
+@st.cache_resource(show_spinner=False)
+def _load_bank_index_cached(signature):
     try:
-        path = _find_csv("integrity_questions.csv")
-        return pd.read_csv(path)
-    except Exception as e:
-        st.error(f"שגיאה בטעינת שאלות אמינות: {e}")
-        return pd.DataFrame()
+        return load_bank_index(tuple(path for path, _, _ in signature))
+    except Exception:
+        return None
+
+
+def _get_bank_index():
+    """טבלת הדמיון של מאגרי השאלות — נבנית פעם אחת (ונשמרת בדיסק לפי hash התוכן)."""
+    return _load_bank_index_cached(_bank_files_signature())
+
+
+def _get_live_analytics():
+    """המצב המצטבר של המבחן הנוכחי — מתעדכן בכל תשובה, נקרא ב-finish_test_fast."""
+    acc = st.session_state.get('live_analytics')
+    if acc is None:
+        acc = LiveAnalytics(bank=_get_bank_index())
+        st.session_state.live_analytics = acc
+    return acc
+
+
+@st.cache_resource(show_spinner=False)
+def _load_question_catalog_cached(signature):
+    hexaco_path, integrity_path = (path for path, _, _ in signature)
+    return QuestionCatalog.from_csv(hexaco_path, integrity_path)
+
+
+def _get_question_catalog():
+    """מאגרי השאלות — נטענים פעם אחת לתהליך (ומחדש רק כשקובץ CSV משתנה)."""
+    catalog = _load_question_catalog_cached(_bank_files_signature())
+    for error in catalog.errors:
+        st.error(error)
+    return catalog
+
+
+def _question_meta(text):
+    """סף WPM וקוטביות — מהקטלוג לשאלות המאגרים, ו-question_meta (LRU) לטקסטים אחרים.
+    הקטלוג נלקח מהסשן (render_quiz שם אותו פעם אחת בכל rerun) — בלי os.stat על ה-CSV בכל תשובה."""
+    catalog = st.session_state.get('question_catalog')
+    if catalog is None:
+        catalog = _load_question_catalog_cached(_bank_files_signature())
+    meta = catalog.meta(text)
+    return meta if meta is not None else question_meta(text)
+
+
+def _scenario_rows(bank, indices, **extra):
+    """שאלות תרחיש מהמאגר — עם 'trait' = הקטגוריה (לתאימות עם הקוד הקיים) אם אין עמודת trait."""
+    if 'trait' in bank.columns:
+        return bank.rows(indices, **extra)
+    return [bank.row(i, trait=bank.group_name(i), **extra) for i in indices]
 
 
 # ============================================================
@@ -1682,50 +1549,33 @@ def get_quick_quiz_questions(count=50, focus_trait=None):
     הסולם: 2 ערכים בלבד (1 = לא נכון לגביי, 5 = נכון לגביי)
     """
     questions = []
+    catalog = _get_question_catalog()
     
     # שאלות HEXACO
-    hexaco_df = load_hexaco_questions()
-    if not hexaco_df.empty:
+    hexaco = catalog.hexaco
+    if len(hexaco):
         if focus_trait and focus_trait != 'all':
             # סינון לפי תכונה
-            trait_col = 'trait' if 'trait' in hexaco_df.columns else 'Trait'
-            filtered = hexaco_df[hexaco_df[trait_col] == focus_trait]
-            if not filtered.empty:
-                hexaco_count = min(count, len(filtered))
-                hexaco_sample = filtered.sample(n=hexaco_count)
+            focus_mask = hexaco.group_mask([focus_trait])
+            if focus_mask.any():
+                hexaco_idx = hexaco.sample(count, focus_mask)
             else:
-                hexaco_sample = hexaco_df.sample(n=min(count // 2, len(hexaco_df)))
+                hexaco_idx = hexaco.sample(count // 2)
         else:
             # שאלון מאוזן בין כל התכונות
             hexaco_count = int(count * 0.7)  # 70% HEXACO
-            hexaco_sample = pd.DataFrame(get_balanced_questions(hexaco_df, total_limit=hexaco_count))
-        
-        for _, row in hexaco_sample.iterrows() if hasattr(hexaco_sample, 'iterrows') else []:
-            q_dict = row.to_dict() if hasattr(row, 'to_dict') else dict(row)
-            q_dict['quiz_format'] = 'binary'
-            questions.append(q_dict)
+            hexaco_idx = hexaco.balanced(hexaco_count)
+        questions.extend(hexaco.rows(hexaco_idx, quiz_format='binary'))
     
     # שאלות תרחיש מאמינות (רק אם לא במצב focus)
     if not focus_trait or focus_trait == 'all':
         integrity_count = count - len(questions)
-        if integrity_count > 0:
-            int_df = load_integrity_questions_csv()
-            if not int_df.empty:
-                # מסננים החוצה את שאלות הלחץ והבקרה — רוצים רק תרחישים
-                exclude_cats = {'polygraph', 'regret', 'honesty_meta'}
-                cat_col = 'category' if 'category' in int_df.columns else 'trait'
-                if cat_col in int_df.columns:
-                    int_filtered = int_df[~int_df[cat_col].isin(exclude_cats)]
-                    if not int_filtered.empty:
-                        int_sample = int_filtered.sample(n=min(integrity_count, len(int_filtered)))
-                        for _, row in int_sample.iterrows():
-                            q_dict = row.to_dict()
-                            q_dict['quiz_format'] = 'binary'
-                            q_dict['is_scenario'] = True
-                            # נוודא שיש 'trait' (לתאימות עם הקוד הקיים)
-                            if 'trait' not in q_dict and 'category' in q_dict:
-                                q_dict['trait'] = q_dict['category']
-                            questions.append(q_dict)
+        integrity = catalog.integrity
+        if integrity_count > 0 and len(integrity) and integrity.group_column is not None:
+            # מסננים החוצה את שאלות הלחץ והבקרה — רוצים רק תרחישים
+            scenario_mask = ~integrity.group_mask(['polygraph', 'regret', 'honesty_meta'])
+            int_idx = integrity.sample(integrity_count, scenario_mask)
+            questions.extend(_scenario_rows(integrity, int_idx, quiz_format='binary', is_scenario=True))
     
     random.shuffle(questions)
     return questions[:count]
@@ -1733,13 +1583,7 @@ def get_quick_quiz_questions(count=50, focus_trait=None):
 
 def _calculate_effective_score(user_answer, is_reverse):
     """מחשב את הציון האפקטיבי בתכונה (אחרי reverse)."""
-    try:
-        score = int(user_answer)
-        if is_reverse:
-            score = 6 - score
-        return max(1, min(5, score))
-    except Exception:
-        return 3
+    return effective_score(user_answer, bool(is_reverse))
 
 
 def get_instant_tip(question_data, user_answer):
@@ -1747,14 +1591,16 @@ def get_instant_tip(question_data, user_answer):
     טיפ מיידי אחרי תשובה — מותאם לסולם המבחן (1-5 או בינארי).
     מסביר איך התשובה משפיעה על הציון, מה הטווח האידיאלי, ולמה.
     """
-    analysis = get_decision_tree_analysis(question_data)
+    is_binary = (st.session_state.get('test_type') == 'quick')
+    return _instant_tip(*_question_key(question_data), user_answer, is_binary)
+
+
+@lru_cache(maxsize=QUESTION_META_CACHE_SIZE)
+def _instant_tip(trait, category, text, is_reverse, user_answer, is_binary):
+    analysis = _decision_tree_analysis(trait, category, text, is_reverse)
     if not analysis:
         return None
     
-    trait = question_data.get('trait', question_data.get('category', ''))
-    is_reverse = str(question_data.get('reverse', False)).strip().lower() in ['true', '1', '1.0', 'yes']
-    is_binary = (st.session_state.get('test_type') == 'quick')
-    
     trait_info = TRAIT_DIRECTIONS.get(trait)
     is_scenario = analysis.get('is_scenario', False)
     
@@ -1932,6 +1778,7 @@ def init_session_state():
         'int_summary_data': None,
         'medical_fit': None,
         'fatigue_index': None,
+        'live_analytics': None,
         'practice_mode': False,
         'ai_ready': False,
         'user_id': str(uuid.uuid4()),
@@ -1941,6 +1788,8 @@ def init_session_state():
         'last_tip': None,
         'last_tip_time': 0,
         'ai_future': None,
+        'ai_job_id': None,
+        'ai_partial': None,
         'ai_submitted_at': 0,
         'decision_tree_mode': False,
         'tree_step': 1,
@@ -1955,6 +1804,7 @@ def init_session_state():
         'video_start_time': 0,
         'db_save_status': None,
         'db_save_error': None,
+        'test_doc_id': None,
         'test_finalized': False,
     }
     for key, val in defaults.items():
@@ -2143,55 +1993,7 @@ def render_home():
         
         # ===== Tab 3: היסטוריה =====
         with tab_archive:
-            history = get_db_history(name)
-            if history:
-                st.markdown(f"### 📂 ההיסטוריה של {name}")
-                for i, entry in enumerate(reversed(history)):
-                    test_date = entry.get('test_date', 'N/A')
-                    test_time = entry.get('test_time', '')
-                    test_type_lbl = entry.get('test_type', 'HEXACO')
-                    
-                    with st.expander(f"📅 מבדק {test_type_lbl} — {test_date} {test_time}"):
-                        results = entry.get('results', {})
-                        if results:
-                            try:
-                                fig = get_radar_chart(results)
-                                if fig:
-                                    st.plotly_chart(fig, use_container_width=True, 
-                                                  key=f"hist_chart_{i}_{uuid.uuid4().hex[:8]}")
-                            except Exception:
-                                pass
-                        report = entry.get('ai_report', '')
-                        if isinstance(report, list):
-                            t_gem, t_cld = st.tabs(["🤖 Gemini", "🩺 Claude"])
-                            with t_gem:
-                                st.markdown(html.escape(str(report[0])) if len(report) > 0 else "אין נתונים")
-                            with t_cld:
-                                st.markdown(html.escape(str(report[1])) if len(report) > 1 else "אין נתונים")
-                        elif report:
-                            st.markdown(html.escape(str(report)))
-                        
-                        # ===== תשובות וידאו (רק בתרגול חיפה) =====
-                        video_responses = entry.get('video_responses', [])
-                        if video_responses and isinstance(video_responses, list):
-                            st.markdown("#### 🎥 תשובות הווידאו שלך")
-                            for vidx, vr in enumerate(video_responses, 1):
-                                if not isinstance(vr, dict):
-                                    continue
-                                vq = vr.get('question', 'שאלת וידאו')
-                                va = vr.get('answer_text', '')
-                                st.markdown(f"**🎬 שאלה {vidx}:** {html.escape(str(vq))}")
-                                if va and va != '(דולג)':
-                                    st.markdown(f"""
-                                    <div style="background: #ccfbf1; padding: 10px; border-radius: 8px; 
-                                                margin: 4px 0 12px 0; border-right: 3px solid #0d9488;">
-                                        <span style="color: #134e4a;">{html.escape(str(va))}</span>
-                                    </div>
-                                    """, unsafe_allow_html=True)
-                                else:
-                                    st.caption("(לא נכתב סיכום / דולג)")
-            else:
-                st.info("עדיין לא ביצעת מבדקים. עשה את הראשון כדי לראות את ההיסטוריה כאן!")
+            _render_history_tab(name)
 
     st.markdown("---")
     with st.expander("🔐 גישת מנהל"):
@@ -2207,6 +2009,71 @@ def render_home():
                 st.error("שגיאה בגישה למערכת")
 
 
+@st.fragment
+def _render_history_tab(name):
+    """ההיסטוריה של המשתמש — fragment עם rerun scope משלו."""
+    history = get_db_history(name)
+    if history:
+        st.markdown(f"### 📂 ההיסטוריה של {name}")
+        for i, entry in enumerate(reversed(history)):
+            test_date = entry.get('test_date', 'N/A')
+            test_time = entry.get('test_time', '')
+            test_type_lbl = entry.get('test_type', 'HEXACO')
+
+            with st.expander(f"📅 מבדק {test_type_lbl} — {test_date} {test_time}"):
+                results = entry.get('results', {})
+                if results:
+                    try:
+                        fig = get_radar_chart(results)
+                        if fig:
+                            st.plotly_chart(fig, use_container_width=True, 
+                                          key=f"hist_chart_{i}")
+                    except Exception:
+                        pass
+                report = entry.get('ai_report', '')
+                if isinstance(report, list):
+                    t_gem, t_cld = st.tabs(["🤖 Gemini", "🩺 Claude"])
+                    with t_gem:
+                        st.markdown(html.escape(str(report[0])) if len(report) > 0 else "אין נתונים")
+                    with t_cld:
+                        st.markdown(html.escape(str(report[1])) if len(report) > 1 else "אין נתונים")
+                elif report:
+                    st.markdown(html.escape(str(report)))
+
+                # ===== תשובות וידאו (רק בתרגול חיפה) =====
+                video_responses = entry.get('video_responses', [])
+                if video_responses and isinstance(video_responses, list):
+                    st.markdown("#### 🎥 תשובות הווידאו שלך")
+                    for vidx, vr in enumerate(video_responses, 1):
+                        if not isinstance(vr, dict):
+                            continue
+                        vq = vr.get('question', 'שאלת וידאו')
+                        va = vr.get('answer_text', '')
+                        st.markdown(f"**🎬 שאלה {vidx}:** {html.escape(str(vq))}")
+                        if va and va != '(דולג)':
+                            st.markdown(f"""
+                            <div style="background: #ccfbf1; padding: 10px; border-radius: 8px; 
+                                        margin: 4px 0 12px 0; border-right: 3px solid #0d9488;">
+                                <span style="color: #134e4a;">{html.escape(str(va))}</span>
+                            </div>
+                            """, unsafe_allow_html=True)
+                        else:
+                            st.caption("(לא נכתב סיכום / דולג)")
+    else:
+        st.info("עדיין לא ביצעת מבדקים. עשה את הראשון כדי לראות את ההיסטוריה כאן!")
+
+
+def _start_quiz(questions):
+    """
+    מעבר לשאלון: ב-session נשמרים רק מזהי השאלות (בטבלה המשותפת לכל התהליך)
+    ויומן תשובות עמודתי שמוקצה מראש לפי מספר השאלות.
+    """
+    st.session_state.questions = QuestionList(questions)
+    st.session_state.responses = ResponseLog(capacity=len(questions))
+    st.session_state.step = 'QUIZ'
+    st.rerun()
+
+
 def start_haifa_test(length_label, is_simulation, include_video=False):
     """
     התחלת תרגול חיפה — שאלון מעורב + (אופציונלי) שאלות וידאו + מסכי "אינך דובר אמת".
@@ -2241,6 +2108,7 @@ def start_haifa_test(length_label, is_simulation, include_video=False):
     st.session_state.q_start_time = time.time()
     st.session_state.user_id = str(uuid.uuid4())
     st.session_state.fatigue_index = None
+    st.session_state.live_analytics = None
     st.session_state.ai_status = 'pending'
     st.session_state.balloons_shown = False
     st.session_state.test_finalized = False
@@ -2251,9 +2119,7 @@ def start_haifa_test(length_label, is_simulation, include_video=False):
         if not questions:
             st.error("לא נמצאו שאלות. בדוק שקבצי ה-CSV נמצאים בתיקיה.")
             return
-        st.session_state.questions = questions
-        st.session_state.step = 'QUIZ'
-        st.rerun()
+        _start_quiz(questions)
     except Exception as e:
         st.error(f"שגיאה בטעינת שאלות: {e}")
 
@@ -2276,6 +2142,7 @@ def start_quick_test(length_label, focus_trait):
     st.session_state.q_start_time = time.time()
     st.session_state.user_id = str(uuid.uuid4())
     st.session_state.fatigue_index = None
+    st.session_state.live_analytics = None
     st.session_state.ai_ready = False
     st.session_state.ai_status = 'pending'
     st.session_state.balloons_shown = False
@@ -2287,9 +2154,7 @@ def start_quick_test(length_label, focus_trait):
         if not questions:
             st.error("לא נמצאו שאלות. בדוק שקבצי ה-CSV נמצאים בתיקיה.")
             return
-        st.session_state.questions = questions
-        st.session_state.step = 'QUIZ'
-        st.rerun()
+        _start_quiz(questions)
     except Exception as e:
         st.error(f"שגיאה בטעינת שאלות: {e}")
 
@@ -2305,6 +2170,7 @@ def start_test(test_type, test_length):
     st.session_state.q_start_time = time.time()
     st.session_state.user_id = str(uuid.uuid4())
     st.session_state.fatigue_index = None
+    st.session_state.live_analytics = None
     st.session_state.ai_ready = False
     st.session_state.ai_status = 'pending'
     st.session_state.balloons_shown = False
@@ -2312,33 +2178,31 @@ def start_test(test_type, test_length):
     st.session_state.last_tip = None
 
     try:
+        catalog = _get_question_catalog()
         if test_type == 'hexaco':
-            df = load_hexaco_questions()
             if "קצר" in test_length: count = 36
             elif "רגיל" in test_length: count = 60
             else: count = 120
-            st.session_state.questions = get_balanced_questions(df, total_limit=count)
+            questions = catalog.hexaco.rows(catalog.hexaco.balanced(count))
 
         elif test_type == 'integrity':
             if "קצר" in test_length: count = 60
             elif "רגיל" in test_length: count = 100
             else: count = 140
-            st.session_state.questions = get_integrity_questions(count=count)
+            questions = get_integrity_questions(catalog.integrity, count=count)
 
         elif test_type == 'combined':
-            df = load_hexaco_questions()
             if "קצר" in test_length: hex_c, int_c = 36, 40
             elif "רגיל" in test_length: hex_c, int_c = 60, 80
             else: hex_c, int_c = 120, 140
 
-            hexaco_q = get_balanced_questions(df, total_limit=hex_c)
-            integrity_q = get_integrity_questions(count=int_c)
+            hexaco_q = catalog.hexaco.rows(catalog.hexaco.balanced(hex_c))
+            integrity_q = get_integrity_questions(catalog.integrity, count=int_c)
             combined = hexaco_q + integrity_q
             random.shuffle(combined)
-            st.session_state.questions = combined
+            questions = combined
 
-        st.session_state.step = 'QUIZ'
-        st.rerun()
+        _start_quiz(questions)
     except Exception as e:
         st.error(f"שגיאה בטעינת שאלות: {e}")
 
@@ -2379,30 +2243,19 @@ def _render_auto_format_question(q_data, current, is_stress):
     if is_reverse:
         options = [(label, 6 - score) for label, score in options]
     
-    # תצוגת השאלה
+    # השאלה והכפתורים — ברכיב הטיימר (הזמן נמדד בדפדפן)
+    # כן/לא — 2 כפתורים בשורה; תדירות — כפתור לכל אפשרות, אחד מתחת לשני
     category = q_data.get('category', q_data.get('trait', ''))
-    st.markdown(f"""
-    <div class="question-card">
-        <div class="question-category">{type_label} • {html.escape(str(category))}</div>
-        <div class="question-text">{html.escape(str(q_text))}</div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # כפתורים
-    if qfmt == 'auto_yesno':
-        # 2 כפתורים בשורה
-        col_no, col_yes = st.columns(2)
-        for col, (label, score) in zip([col_no, col_yes], options):
-            if col.button(label, key=f"af_{current}_{score}",
-                          use_container_width=True, type="secondary"):
-                _handle_answer(q_data, score, current, is_stress)
-    else:
-        # תדירות — כפתור לכל אפשרות, אחד מתחת לשני
-        st.caption("👇 בחר תשובה:")
-        for i, (label, score) in enumerate(options):
-            if st.button(label, key=f"af_{current}_{i}",
-                         use_container_width=True, type="secondary"):
-                _handle_answer(q_data, score, current, is_stress)
+    answer = question_timer(
+        _timer_key("af", current),
+        options=options,
+        card={'category': f"{type_label} • {category}", 'text': q_text},
+        columns=2 if qfmt == 'auto_yesno' else 1,
+        caption=None if qfmt == 'auto_yesno' else "👇 בחר תשובה:",
+        show_timer=False,
+        elapsed=time.time() - st.session_state.q_start_time,
+    )
+    _answer_from_timer(q_data, answer, current, is_stress)
     
     # טיפ במצב תרגול
     if st.session_state.practice_mode and st.session_state.get('last_tip'):
@@ -2417,7 +2270,7 @@ def _render_auto_format_question(q_data, current, is_stress):
                 st.session_state.responses.pop()
             st.session_state.q_start_time = time.time()
             st.session_state.last_tip = None
-            st.rerun()
+            _rerun_quiz()
 
 
 def _render_multi_choice_question(q_data, current, is_stress):
@@ -2450,26 +2303,18 @@ def _render_multi_choice_question(q_data, current, is_stress):
         st.error(f"אין אפשרויות תשובה לשאלה: {q_text}")
         return
     
-    # תצוגת השאלה
+    # השאלה + כפתור לכל אפשרות (אחד מתחת לשני, רוחב מלא) — ברכיב הטיימר
+    # התשובה עוברת ללוגיקת התשובה הקיימת — עם הציון של האפשרות
     category = q_data.get('category', q_data.get('trait', ''))
-    st.markdown(f"""
-    <div class="question-card">
-        <div class="question-category">{type_label} • {html.escape(str(category))}</div>
-        <div class="question-text">{html.escape(str(q_text))}</div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # כפתור לכל אפשרות (אחד מתחת לשני, רוחב מלא)
-    st.caption("👇 בחר תשובה אחת:")
-    for i, opt in enumerate(options):
-        opt_text = opt.get('text', '')
-        opt_score = opt.get('score', 3)
-        
-        if st.button(f"{opt_text}",
-                     key=f"mc_{current}_{i}",
-                     use_container_width=True, type="secondary"):
-            # משתמש בלוגיקת התשובה הקיימת — אבל מעביר את הציון של האפשרות
-            _handle_answer(q_data, opt_score, current, is_stress)
+    answer = question_timer(
+        _timer_key("mc", current),
+        options=[(opt.get('text', ''), opt.get('score', 3)) for opt in options],
+        card={'category': f"{type_label} • {category}", 'text': q_text},
+        caption="👇 בחר תשובה אחת:",
+        show_timer=False,
+        elapsed=time.time() - st.session_state.q_start_time,
+    )
+    _answer_from_timer(q_data, answer, current, is_stress)
     
     # טיפ במצב תרגול
     if st.session_state.practice_mode and st.session_state.get('last_tip'):
@@ -2484,7 +2329,7 @@ def _render_multi_choice_question(q_data, current, is_stress):
                 st.session_state.responses.pop()
             st.session_state.q_start_time = time.time()
             st.session_state.last_tip = None
-            st.rerun()
+            _rerun_quiz()
 
 
 def _render_haifa_video_question(q_data, current):
@@ -2499,10 +2344,6 @@ def _render_haifa_video_question(q_data, current):
         st.session_state.video_start_time = time.time()
     
     elapsed = time.time() - st.session_state.video_start_time
-    remaining = max(0, duration - int(elapsed))
-    
-    # רענון כל שנייה לעדכון הטיימר
-    st_autorefresh(interval=1000, limit=int(duration) + 10, key=f"video_timer_{current}")
     
     # מציג כותרת מודגשת — עם דגש על שההקלטה צריכה להתחיל מיד
     st.markdown(f"""
@@ -2522,29 +2363,9 @@ def _render_haifa_video_question(q_data, current):
     </div>
     """, unsafe_allow_html=True)
     
-    # טיימר גדול
-    minutes = remaining // 60
-    seconds = remaining % 60
-    
-    # צבע לפי הזמן
-    progress = 1 - (remaining / duration)
-    if progress < 0.5:
-        timer_color = "#10b981"
-    elif progress < 0.8:
-        timer_color = "#f59e0b"
-    else:
-        timer_color = "#dc2626"
-    
-    st.markdown(f"""
-    <div style="background: #f9fafb; border: 2px solid {timer_color};
-                border-radius: 14px; padding: 20px; margin: 15px 0;
-                text-align: center;">
-        <div style="font-size: 0.9rem; color: #6b7280; margin-bottom: 5px;">⏱️ זמן נותר להקלטה</div>
-        <div style="font-size: 3rem; font-weight: 800; color: {timer_color}; font-family: 'Rubik', sans-serif;">
-            {minutes:02d}:{seconds:02d}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    # טיימר גדול — סופר לאחור בדפדפן (ירוק → כתום → אדום), בלי rerun כל שנייה
+    countdown_timer(f"video_timer_{current}_{int(st.session_state.video_start_time * 1000)}",
+                    duration, view="video", elapsed=elapsed, notify=False)
     
     # השאלה
     st.markdown(f"""
@@ -2627,10 +2448,11 @@ def _render_haifa_video_question(q_data, current):
                 'video_response_text': user_response,
                 'video_filename': saved_filename,  # שם הקובץ ששמר אצלו
             })
+            _get_live_analytics().sync(st.session_state.responses)
             st.session_state.current_q += 1
             st.session_state.video_start_time = 0
             st.session_state.q_start_time = time.time()
-            st.rerun()
+            _rerun_quiz()
     
     with col_skip:
         if st.button("⏭️ דלג", key=f"video_skip_{current}",
@@ -2645,10 +2467,11 @@ def _render_haifa_video_question(q_data, current):
                 'trait': q_data.get('category', 'video'),
                 'category': q_data.get('category', 'video'),
             })
+            _get_live_analytics().sync(st.session_state.responses)
             st.session_state.current_q += 1
             st.session_state.video_start_time = 0
             st.session_state.q_start_time = time.time()
-            st.rerun()
+            _rerun_quiz()
 
 
 def _render_fake_detection_screen(current_q, ack_key):
@@ -2678,94 +2501,23 @@ def _render_fake_detection_screen(current_q, ack_key):
                  use_container_width=True, type="primary"):
         st.session_state.fake_alert_acknowledged[ack_key] = True
         st.session_state.q_start_time = time.time()  # מאפסים טיימר
-        st.rerun()
+        _rerun_quiz()
 
 
-def _render_timer_visual(elapsed_seconds, show_warning=True):
+def _rerun_quiz():
     """
-    מצייר שעון חול SVG שמתרוקן עם הזמן.
-    מציג גם הודעת אזהרה אחרי 8 שניות (אם show_warning=True).
+    rerun לכרטיס השאלה בלבד (render_quiz הוא fragment) — בלי ה-CSS, הכותרות ושאר הדף.
+    כשהמבחן נגמר (או בהרצה מלאה של הסקריפט) — rerun לכל האפליקציה.
     """
-    THRESHOLD_WARN = 8
-    THRESHOLD_MAX = 15
-    
-    progress = min(1.0, elapsed_seconds / THRESHOLD_MAX)
-    top_fill = max(0, 1 - progress)
-    bottom_fill = progress
-    
-    # צבע לפי הזמן
-    if elapsed_seconds < 3:
-        sand_color = "#10b981"
-        bg_color = "#d1fae5"
-        status_text = "✅ קח את הזמן שלך"
-        status_color = "#065f46"
-    elif elapsed_seconds < 6:
-        sand_color = "#f59e0b"
-        bg_color = "#fef3c7"
-        status_text = "⏱️ מתקרב לסיום זמן הקריאה"
-        status_color = "#92400e"
-    elif elapsed_seconds < THRESHOLD_WARN:
-        sand_color = "#f97316"
-        bg_color = "#ffedd5"
-        status_text = "⚠️ קצת איטי — תכף יסומן כהיסוס"
-        status_color = "#9a3412"
-    else:
-        sand_color = "#ef4444"
-        bg_color = "#fee2e2"
-        status_text = f"🔴 איחור! ({elapsed_seconds}s) — נרשם כהיסוס"
-        status_color = "#991b1b"
-    
-    top_height = 60 * top_fill
-    bottom_height = 60 * bottom_fill
-    shake_class = "shake-animation" if elapsed_seconds >= THRESHOLD_WARN else ""
-    
-    # ID יחיד לכל clipPath כדי למנוע התנגשויות
-    cid = f"hg{elapsed_seconds}"
-    
-    # מציג טפטוף רק אם החול עדיין נופל (בערך באמצע)
-    drop_visible = "1" if 0.05 < progress < 0.95 else "0"
-    
-    # SVG נקי בלבד — בלי <style> מוטמע!
-    svg_html = (
-        f'<div class="hourglass-container {shake_class}" style="background: {bg_color};">'
-        f'<svg width="80" height="120" viewBox="0 0 100 150" xmlns="http://www.w3.org/2000/svg">'
-        f'<path d="M 15 10 L 85 10 L 85 25 L 55 70 L 55 80 L 85 125 L 85 140 L 15 140 L 15 125 L 45 80 L 45 70 L 15 25 Z" '
-        f'fill="none" stroke="#374151" stroke-width="3" stroke-linejoin="round"/>'
-        f'<defs>'
-        f'<clipPath id="top-{cid}"><path d="M 18 13 L 82 13 L 82 25 L 52 68 L 48 68 L 18 25 Z"/></clipPath>'
-        f'<clipPath id="bot-{cid}"><path d="M 48 82 L 52 82 L 82 125 L 82 137 L 18 137 L 18 125 Z"/></clipPath>'
-        f'</defs>'
-        f'<rect x="15" y="{13 + 60 * progress}" width="70" height="{top_height}" '
-        f'fill="{sand_color}" clip-path="url(#top-{cid})"/>'
-        f'<rect x="15" y="{137 - bottom_height}" width="70" height="{bottom_height}" '
-        f'fill="{sand_color}" clip-path="url(#bot-{cid})"/>'
-        f'<circle cx="50" cy="80" r="2" fill="{sand_color}" opacity="{drop_visible}">'
-        f'<animate attributeName="cy" from="72" to="88" dur="0.6s" repeatCount="indefinite"/>'
-        f'</circle>'
-        f'<line x1="10" y1="142" x2="90" y2="142" stroke="#374151" stroke-width="3" stroke-linecap="round"/>'
-        f'<line x1="10" y1="8" x2="90" y2="8" stroke="#374151" stroke-width="3" stroke-linecap="round"/>'
-        f'</svg>'
-        f'<div class="hourglass-info">'
-        f'<div class="hourglass-num" style="color: {status_color};">'
-        f'{elapsed_seconds}<span class="hourglass-num-unit"> שניות</span>'
-        f'</div>'
-        f'<div class="hourglass-status" style="color: {status_color};">{status_text}</div>'
-        f'</div>'
-        f'</div>'
-    )
-    
-    st.markdown(svg_html, unsafe_allow_html=True)
-    
-    # הודעת אזהרה אחרי 8 שניות
-    if show_warning and elapsed_seconds >= THRESHOLD_WARN:
-        st.markdown(
-            '<div class="timer-warning-box">'
-            '⚠️ <strong>שים לב:</strong> עליך לענות מהר יותר! היסוס יתר נרשם במערכת.'
-            '</div>',
-            unsafe_allow_html=True
-        )
+    if st.session_state.current_q >= len(st.session_state.questions):
+        st.rerun()
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 
+@st.fragment
 def render_quiz():
     questions = st.session_state.questions
     current = st.session_state.current_q
@@ -2775,6 +2527,8 @@ def render_quiz():
         finish_test_fast()
         return
 
+    # הקטלוג פעם אחת ל-rerun — _question_meta משתמש בו לכל תשובה ולעץ ההחלטה
+    st.session_state.question_catalog = _load_question_catalog_cached(_bank_files_signature())
     q_data = questions[current]
     is_stress = str(q_data.get('is_stress_meta', '')).strip().lower() in ["1", "1.0", "true"]
     is_quick = (st.session_state.test_type == 'quick')
@@ -2802,7 +2556,7 @@ def render_quiz():
             
             # מזריקים את שאלת הפולו-אפ למיקום הנוכחי
             st.session_state.questions.insert(current, video_q)
-            st.rerun()
+            _rerun_quiz()
     
     # ===== Haifa: שאלת וידאו =====
     if is_haifa and q_data.get('quiz_format') == 'haifa_video':
@@ -2830,9 +2584,6 @@ def render_quiz():
 
     # ===== מסך לחץ — רק במבחנים מלאים, לא במהיר =====
     if is_stress and not st.session_state.practice_mode and not is_quick and not is_haifa:
-        # רענון אוטומטי רק במסך הלחץ — חכם!
-        st_autorefresh(interval=1000, limit=20, key=f"stress_timer_{current}")
-        
         if st.session_state.get('stress_completed_q') != current:
             if not st.session_state.stress_active:
                 st.session_state.stress_active = True
@@ -2843,32 +2594,22 @@ def render_quiz():
             remaining = max(0, 15 - int(stress_elapsed))
 
             if remaining > 0:
+                # הספירה לאחור רצה בדפדפן — הרכיב מחזיר expired (rerun אחד) כשהיא נגמרת
                 msg = STRESS_MESSAGES[st.session_state.stress_msg_index]
-                st.markdown(f"""
-                <div class="stress-screen">
-                    <div class="stress-icon">{msg['icon']}</div>
-                    <div class="stress-title">{msg['title']}</div>
-                    <div class="stress-detail">{msg['detail']}</div>
-                    <div class="stress-timer">{remaining}</div>
-                    <div class="stress-warning-bar">🔒 {msg['bar']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-                return
+                done = countdown_timer(f"stress_timer_{current}_{int(st.session_state.stress_start * 1000)}",
+                                       15, view="stress", message=msg, elapsed=stress_elapsed)
+                if not (done and done.get('expired')):
+                    return
+                st.session_state.stress_active = False
+                st.session_state.stress_completed_q = current
+                st.session_state.q_start_time = time.time()
             else:
                 st.session_state.stress_active = False
                 st.session_state.stress_completed_q = current
                 st.session_state.q_start_time = time.time()
 
-    # ===== Smart Auto-Refresh — רק כשממתינים לתשובה =====
-    # רענון כל 1.5 שניות (במקום כל שנייה) — מקל על העומס משמעותית.
-    # limit=60 כי אין סיבה לרענן שאלה אחת יותר מ-90 שניות.
-    # במצב תרגול (ללא לחץ זמן) — אין צורך ברענון בכלל!
-    if not st.session_state.practice_mode:
-        st_autorefresh(interval=1500, limit=60, key=f"quiz_timer_{current}")
-    
-    # מחושב פעם אחת — נשתמש בו לתצוגה ולהתראה
+    # השעון רץ בדפדפן (question_timer) — השרת מתרענן רק כשהמשתמש עונה
     elapsed = time.time() - st.session_state.q_start_time
-    elapsed_int = int(elapsed)
     
     # ===== Progress & Header =====
     st.progress(current / total)
@@ -2879,50 +2620,33 @@ def render_quiz():
         if not st.session_state.practice_mode:
             st.caption(f"⚡ {st.session_state.hesitation_count} היסוסים | 🏎️ {st.session_state.speed_flag_count} מהירים")
     
-    # ===== Hourglass Timer + Warning =====
-    # מציג את שעון החול רק כשיש לחץ זמן (לא במצב תרגול).
-    # במצב תרגול אין רענון אוטומטי, אז השעון ממילא לא יזוז — מסתירים אותו.
-    if not st.session_state.practice_mode:
-        _render_timer_visual(elapsed_int, show_warning=True)
-
-    # ===== Question Card =====
+    # ===== Hourglass Timer + Question Card + Answer Buttons =====
+    # שעון החול (ואזהרת ההיסוס אחרי 8 שניות) רק כשיש לחץ זמן — לא במצב תרגול.
     q_text = q_data.get('q', q_data.get('question', q_data.get('text', 'שאלה חסרה')))
     q_category = q_data.get('trait', q_data.get('category', ''))
     
     # תרגום שם התכונה לעברית להצגה
     q_category_display = TRAIT_DICT.get(str(q_category), str(q_category))
+    card = {'category': q_category_display, 'text': q_text}
+    show_timer = not st.session_state.practice_mode
 
-    st.markdown(f"""
-    <div class="question-card">
-        <div class="question-category">{html.escape(str(q_category_display))}</div>
-        <div class="question-text">{html.escape(str(q_text))}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-    # ===== Answer Buttons =====
-    if is_quick:
+    if is_quick and st.session_state.get('decision_tree_mode', False):
         # === Mode C: Decision Tree Practice ===
         # אם הופעל מצב עץ ההחלטה — מציג את שלבי החשיבה לפני התשובה הסופית
-        if st.session_state.get('decision_tree_mode', False):
-            _render_decision_tree_ui(q_data, current, is_stress)
-        else:
+        question_timer(_timer_key("tree", current), card=card, show_timer=show_timer, elapsed=elapsed)
+        _render_decision_tree_ui(q_data, current, is_stress)
+    else:
+        if is_quick:
             # מצב רגיל: 2 כפתורים
             # FIXED: מיפוי לא-קיצוני — נכון=4, לא נכון=2 (לא 5/1!)
-            col_no, col_yes = st.columns(2)
-            if col_no.button("❌ לא נכון לגביי", key=f"ans_no_{current}",
-                             use_container_width=True, type="secondary"):
-                _handle_answer(q_data, 2, current, is_stress)
-            if col_yes.button("✅ נכון לגביי", key=f"ans_yes_{current}",
-                              use_container_width=True, type="secondary"):
-                _handle_answer(q_data, 4, current, is_stress)
-    else:
-        # 5 כפתורים רגילים
-        options = [("בכלל לא", 1), ("לא מסכים", 2), ("נייטרלי", 3), ("מסכים", 4), ("מסכים מאוד", 5)]
-        cols = st.columns(5)
-        for i, (label, val) in enumerate(options):
-            if cols[i].button(f"{val} — {label}", key=f"ans_{current}_{val}",
-                              use_container_width=True, type="secondary"):
-                _handle_answer(q_data, val, current, is_stress)
+            options, columns = [("❌ לא נכון לגביי", 2), ("✅ נכון לגביי", 4)], 2
+        else:
+            # 5 כפתורים רגילים
+            labels = [("בכלל לא", 1), ("לא מסכים", 2), ("נייטרלי", 3), ("מסכים", 4), ("מסכים מאוד", 5)]
+            options, columns = [(f"{val} — {label}", val) for label, val in labels], 5
+        answer = question_timer(_timer_key("ans", current), options=options, card=card, columns=columns,
+                                show_timer=show_timer, elapsed=elapsed)
+        _answer_from_timer(q_data, answer, current, is_stress)
 
     # ===== Instant Tip (רק במצב תרגול) =====
     if st.session_state.practice_mode and st.session_state.last_tip:
@@ -2939,7 +2663,7 @@ def render_quiz():
             st.session_state.q_start_time = time.time()
             st.session_state.last_tip = None
             _reset_tree_state()
-            st.rerun()
+            _rerun_quiz()
 
 
 def _reset_tree_state():
@@ -3010,7 +2734,7 @@ def _render_decision_tree_ui(q_data, current, is_stress):
             if st.button("➡️ המשך לשלב 2", key=f"tree_next1_{current}", type="primary"):
                 st.session_state.tree_answer_trait = chosen_key
                 st.session_state.tree_step = 2
-                st.rerun()
+                _rerun_quiz()
         else:
             # HEXACO
             options = list(TRAIT_DICT.values())
@@ -3024,7 +2748,7 @@ def _render_decision_tree_ui(q_data, current, is_stress):
             if st.button("➡️ המשך לשלב 2", key=f"tree_next1_{current}", type="primary"):
                 st.session_state.tree_answer_trait = chosen_key
                 st.session_state.tree_step = 2
-                st.rerun()
+                _rerun_quiz()
         
         # אפשרות לדלג ולענות ישר
         st.caption("💡 לא בטוח? ענה לפי האינסטינקט שלך:")
@@ -3065,11 +2789,11 @@ def _render_decision_tree_ui(q_data, current, is_stress):
         if st.button("➡️ המשך לשלב 3", key=f"tree_next2_{current}", type="primary"):
             st.session_state.tree_answer_direction = chosen_dir
             st.session_state.tree_step = 3
-            st.rerun()
+            _rerun_quiz()
         
         if st.button("⬅️ חזור לשלב 1", key=f"tree_back2_{current}", type="secondary"):
             st.session_state.tree_step = 1
-            st.rerun()
+            _rerun_quiz()
     
     # ===== שלב 3: מתחייב או נשלל =====
     elif step == 3:
@@ -3098,11 +2822,11 @@ def _render_decision_tree_ui(q_data, current, is_stress):
         if st.button("➡️ המשך לתשובה הסופית", key=f"tree_next3_{current}", type="primary"):
             st.session_state.tree_answer_polarity = chosen_pol
             st.session_state.tree_step = 4
-            st.rerun()
+            _rerun_quiz()
         
         if st.button("⬅️ חזור לשלב 2", key=f"tree_back3_{current}", type="secondary"):
             st.session_state.tree_step = 2
-            st.rerun()
+            _rerun_quiz()
     
     # ===== שלב 4: התשובה הסופית (לפי המטריצה של מכון נועם) =====
     elif step == 4:
@@ -3152,15 +2876,30 @@ def _render_decision_tree_ui(q_data, current, is_stress):
         
         if st.button("⬅️ חזור לשלב 3", key=f"tree_back4_{current}", type="secondary"):
             st.session_state.tree_step = 3
-            st.rerun()
+            _rerun_quiz()
+
+
+def _timer_key(prefix, current):
+    """key לרכיב הטיימר — חדש בכל הצגה של שאלה (q_start_time מתאפס), כך שתשובה ישנה לא חוזרת."""
+    return f"{prefix}_{current}_{int(st.session_state.q_start_time * 1000)}"
 
 
-def _handle_answer(q_data, val, current, is_stress):
-    """מטפל בלחיצה על תשובה."""
-    response_time = time.time() - st.session_state.q_start_time
+def _answer_from_timer(q_data, answer, current, is_stress):
+    """תשובה שחזרה מרכיב הטיימר — עם זמן התגובה שנמדד בדפדפן."""
+    if not answer or 'value' not in answer:
+        return
+    server_elapsed = time.time() - st.session_state.q_start_time
+    _handle_answer(q_data, answer['value'], current, is_stress,
+                   response_time=measured_response_time(answer, server_elapsed))
+
+
+def _handle_answer(q_data, val, current, is_stress, response_time=None):
+    """מטפל בלחיצה על תשובה. response_time — שנמדד בדפדפן; אחרת לפי שעון השרת."""
+    if response_time is None:
+        response_time = time.time() - st.session_state.q_start_time
     q_text = q_data.get('q', q_data.get('question', ''))
     
-    wpm_threshold = calculate_dynamic_wpm_threshold(str(q_text))
+    wpm_threshold = _question_meta(q_text).wpm_threshold
     is_too_fast = response_time < wpm_threshold
     is_hesitation = response_time > (wpm_threshold * 4)
 
@@ -3183,6 +2922,8 @@ def _handle_answer(q_data, val, current, is_stress):
         'is_stress_meta': is_stress,
         'category': q_data.get('category', q_data.get('trait', '')),
     })
+    # עדכון מצטבר של הניתוח (גם מיישר אחרי "חזור")
+    _get_live_analytics().sync(st.session_state.responses)
     
     # יצירת טיפ מיידי במצב תרגול
     if st.session_state.practice_mode:
@@ -3199,77 +2940,111 @@ def _handle_answer(q_data, val, current, is_stress):
     st.session_state.tree_answer_trait = None
     st.session_state.tree_answer_direction = None
     st.session_state.tree_answer_polarity = None
-    st.rerun()
+    _rerun_quiz()
 
 
 # ============================================================
 # Background AI — FIXED: Future-based pattern (100% reliable)
 # ============================================================
-from concurrent.futures import ThreadPoolExecutor
+AI_POLL_INTERVALS = {'processing': 1, 'deferred': 10}  # שניות בין בדיקות של fragments ה-AI, לפי סטטוס
+AI_POLL_MAX_SECONDS = 600                               # אחרי 10 דקות מפסיקים לבדוק אוטומטית
 
 
 @st.cache_resource
-def _get_executor():
-    """Singleton ThreadPoolExecutor — נשאר חי בין reruns."""
-    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai_worker")
+def _get_ai_scheduler():
+    """
+    Singleton AIScheduler — נשאר חי בין reruns, משותף לכל הסשנים.
+    עם httpx הדוחות רצים כ-coroutines על event loop אחד, ואז הרבה יותר דוחות במקביל.
+    """
+    worker = get_async_worker()
+    if worker is None:
+        return AIScheduler()
+    return AIScheduler(runner=worker.submit, max_running=ASYNC_MAX_REPORTS)
+
+
+def _ai_job_fn():
+    return run_ai_job_async if async_ai_available() else run_ai_job
 
 
-def _run_ai_pure(username, test_type, s_data, i_data, rel, cont, hes, hist,
-                 firebase_creds=None):
+def _load_ai_job():
     """
-    פונקציה טהורה — לא נוגעת ב-st.session_state.
-    מקבלת את כל הקלט כפרמטרים, מחזירה dict עם התוצאה.
-    זו המפתח לתיקון: ה-thread לא מנסה לכתוב ל-session state יותר.
+    הדוח מטבלת העבודות — כשה-worker החיצוני / המובנה הוא שמפיק אותו,
+    או כשה-Future אבד (הפעלה מחדש). מעדכן את ה-session כשהעבודה הסתיימה.
     """
-    result = {
-        'gemini': None,
-        'claude': None,
-        'status': 'done',
-        'error': None,
-        'saved_to_db': False,
-    }
-    
+    queue = get_ai_job_queue()
+    job_id = st.session_state.get('ai_job_id')
+    if queue is None or not job_id:
+        return
     try:
-        g, c = None, None
-        if test_type in ('hexaco', 'quick', 'haifa'):
-            g, c = get_multi_ai_analysis(username, s_data, hist)
-        elif test_type == 'integrity':
-            g, c = get_integrity_ai_analysis(username, rel, cont, s_data, hist)
-        elif test_type == 'combined':
-            g, c = get_combined_ai_analysis(username, s_data, rel, cont, hist)
-        
-        result['gemini'] = g
-        result['claude'] = c
-        result['saved_to_db'] = True  # נשמר כבר ב-thread הראשי, לפני קריאת AI
-        
-    except Exception as e:
-        result['status'] = 'error'
-        result['error'] = str(e)
-        result['gemini'] = f"שגיאה בהפקת ניתוח AI: {str(e)}"
-    
-    return result
+        job = queue.get(job_id)
+    except Exception:
+        return
+    if job is None or job['status'] not in ('done', 'error'):
+        return
+    result = job['result'] or {}
+    st.session_state.gemini_report = result.get('gemini') or (f"שגיאה: {job['error']}" if job['error'] else None)
+    st.session_state.claude_report = result.get('claude')
+    st.session_state.ai_status = 'done' if job['status'] == 'done' else 'error'
+    st.session_state.ai_job_id = None
+
+
+def _ai_job_retrying():
+    """האם העבודה של הסשן חזרה לתור (ניסיון נוסף עם backoff) — אז הדוח עוד יגיע מהטבלה."""
+    queue = get_ai_job_queue()
+    job_id = st.session_state.get('ai_job_id')
+    if queue is None or not job_id:
+        return False
+    try:
+        job = queue.get(job_id)
+    except Exception:
+        return False
+    return job is not None and job['status'] in ('queued', 'running')
 
 
 def _check_ai_future():
     """
     בודק את ה-Future ב-session state — אם הוא מוכן, שולף את התוצאה.
+    עד אז מעתיק את הטקסט שכבר הגיע מכל ספק (streaming / ספק אחד שסיים).
     נקרא בכל rerun במסך התוצאות.
     """
     future = st.session_state.get('ai_future')
     if future is None:
+        if st.session_state.get('ai_status') in ('processing', 'deferred'):
+            _load_ai_job()
         return
     
+    if not future.done():
+        if getattr(future, 'deferred', False) and st.session_state.ai_status == 'processing':
+            st.session_state.ai_status = 'deferred'
+        partial = st.session_state.get('ai_partial') or {}
+        if partial.get('gemini'):
+            st.session_state.gemini_report = partial['gemini']
+        if partial.get('claude'):
+            st.session_state.claude_report = partial['claude']
+        return
+
     if future.done():
         try:
             result = future.result(timeout=0.1)
+            st.session_state.ai_future = None  # ניקוי
+            if result.get('status') == 'external':
+                _load_ai_job()  # worker אחר לקח את העבודה — ממשיכים לבדוק בטבלה
+                return
+            if result.get('status') == 'error' and _ai_job_retrying():
+                # הניסיון נכשל אבל העבודה חזרה לתור — ממשיכים לבדוק בטבלה עד שהיא סופית
+                if st.session_state.get('ai_status') not in ('processing', 'deferred'):
+                    st.session_state.ai_status = 'processing'
+                return
             st.session_state.gemini_report = result.get('gemini')
             st.session_state.claude_report = result.get('claude')
             st.session_state.ai_status = result.get('status', 'done')
-            st.session_state.ai_future = None  # ניקוי
+            st.session_state.ai_job_id = None
         except Exception as e:
+            st.session_state.ai_future = None
+            if _ai_job_retrying():
+                return
             st.session_state.gemini_report = f"שגיאה: {e}"
             st.session_state.ai_status = 'error'
-            st.session_state.ai_future = None
 
 
 def finish_test_fast():
@@ -3281,90 +3056,76 @@ def finish_test_fast():
     
     test_type = st.session_state.test_type
     responses = st.session_state.responses
-    st.session_state.fatigue_index = calculate_fatigue_index(responses)
+    # כל החישובים כבר נצברו בכל תשובה — כאן רק קוראים את הערכים הסופיים
+    acc = _get_live_analytics().sync(responses)
+    st.session_state.fatigue_index = acc.fatigue_index()
     
     is_binary = (test_type == 'quick')
 
     if test_type in ('hexaco', 'quick'):
-        df_raw, summary_df = process_results(responses)
+        df_raw, summary_df = acc.hexaco_frames()
         st.session_state.results_data = df_raw
         st.session_state.summary_data = summary_df
         st.session_state.medical_fit = calculate_medical_fit(summary_df)
         
         # FIXED: שימוש בזיהוי סתירות חכם — לפי דמיון טקסט, לא לפי קטגוריה
-        smart_contradictions = find_smart_contradictions(responses)
+        smart_contradictions = acc.smart_contradictions()
         st.session_state.contradictions = smart_contradictions
         
         # FIXED: חישוב אמינות חכם — לא מעניש על קיצוניות במבחן בינארי
-        st.session_state.reliability_score = calculate_smart_reliability(
-            responses, smart_contradictions, is_binary=is_binary
+        st.session_state.reliability_score = acc.smart_reliability(
+            smart_contradictions, is_binary=is_binary
         )
 
     elif test_type == 'integrity':
-        df_raw, summary_df = process_integrity_results(responses)
+        df_raw, summary_df = acc.integrity_frames()
         st.session_state.results_data = df_raw
         st.session_state.summary_data = summary_df
-        st.session_state.reliability_score = calculate_reliability_score(df_raw)
+        st.session_state.reliability_score = acc.integrity_reliability()
         # גם כאן — סתירות חכמות במקום הרגילות
-        st.session_state.contradictions = find_smart_contradictions(responses)
+        st.session_state.contradictions = acc.smart_contradictions()
 
     elif test_type == 'haifa':
         # תרגול חיפה — דומה ל-combined, מחלקים את התשובות:
         # 1. שאלות וידאו — מסכמים בנפרד (לא נכנסות לציון מספרי)
         # 2. שאלות HEXACO — מחושבות בקוד הסטנדרטי
         # 3. שאלות אמינות — מחושבות בקוד האמינות
-        video_resp = [r for r in responses if r.get('is_video', False)]
-        non_video = [r for r in responses if not r.get('is_video', False)]
+        video_count = sum(1 for r in responses if r.get('is_video', False))
         
-        hexaco_traits = {'Conscientiousness', 'Honesty-Humility', 'Agreeableness',
-                         'Emotionality', 'Extraversion', 'Openness to Experience'}
-        hexaco_resp = [r for r in non_video if r.get('trait') in hexaco_traits]
-        integrity_resp = [r for r in non_video if r.get('trait') not in hexaco_traits]
-        
-        summary_hex = pd.DataFrame()
-        summary_int = pd.DataFrame()
         reliability = 0
         
-        if hexaco_resp:
-            _, summary_hex = process_results(hexaco_resp)
+        df_hex, summary_hex = acc.hexaco_frames('hexaco_text')
+        if not df_hex.empty:
             st.session_state.medical_fit = calculate_medical_fit(summary_hex)
-        if integrity_resp:
-            df_int, summary_int = process_integrity_results(integrity_resp)
-            reliability = calculate_reliability_score(df_int)
+        df_int, summary_int = acc.integrity_frames('other_text')
+        if not df_int.empty:
+            reliability = acc.integrity_reliability('other_text')
         
         # סתירות חכמות על כל התשובות הטקסטואליות (לא וידאו)
-        contradictions = find_smart_contradictions(non_video)
+        contradictions = acc.smart_contradictions(include_video=False)
         
         st.session_state.summary_data = summary_hex
         st.session_state.int_summary_data = summary_int
         st.session_state.reliability_score = reliability
         st.session_state.contradictions = contradictions
-        st.session_state.video_count = len(video_resp)
+        st.session_state.video_count = video_count
         
-        # חישוב מדד יציבות תחת לחץ (חדש!)
+        # חישוב מדד יציבות תחת לחץ (חדש!) — חלונות קטנים סביב כל אירוע
         stability = calculate_pressure_stability(responses)
         st.session_state.pressure_stability = stability
 
     elif test_type == 'combined':
-        hexaco_traits = {'Conscientiousness', 'Honesty-Humility', 'Agreeableness',
-                         'Emotionality', 'Extraversion', 'Openness to Experience'}
-        hexaco_resp = [r for r in responses if r.get('trait') in hexaco_traits]
-        integrity_resp = [r for r in responses if r not in hexaco_resp]
-
-        summary_hex = pd.DataFrame()
-        summary_int = pd.DataFrame()
         reliability = 0
-        contradictions = []
 
-        if hexaco_resp:
-            _, summary_hex = process_results(hexaco_resp)
+        df_hex, summary_hex = acc.hexaco_frames('hexaco')
+        if not df_hex.empty:
             st.session_state.medical_fit = calculate_medical_fit(summary_hex)
-        if integrity_resp:
-            df_int, summary_int = process_integrity_results(integrity_resp)
-            reliability = calculate_reliability_score(df_int)
+        df_int, summary_int = acc.integrity_frames('other')
+        if not df_int.empty:
+            reliability = acc.integrity_reliability('other')
         
         # סתירות חכמות על כל התשובות יחד
-        contradictions = find_smart_contradictions(responses)
+        contradictions = acc.smart_contradictions()
 
         st.session_state.summary_data = summary_hex
         st.session_state.int_summary_data = summary_int
@@ -3385,6 +3146,8 @@ def finish_test_fast():
         
         # ניתוח ראשוני — "Pending AI"
         initial_report = "המבחן נשמר. הניתוח המעמיק יופיע ברגע שה-AI יסיים..."
+        # מזהה המסמך נוצר מראש — ה-AI יעדכן בו את הדוח, ושמירה חוזרת לא תשכפל
+        doc_id = st.session_state.test_doc_id = uuid.uuid4().hex
         
         if test_type == 'haifa':
             video_count = st.session_state.get('video_count', 0)
@@ -3400,13 +3163,15 @@ def finish_test_fast():
             ]
             save_success = save_haifa_test_to_db(username, s_dict, initial_report,
                                                   hesitation=hes, video_count=video_count,
-                                                  video_data=video_data)
+                                                  video_data=video_data, doc_id=doc_id)
         elif test_type in ('hexaco', 'quick'):
-            save_success = save_to_db(username, s_dict, initial_report, hesitation=hes)
+            save_success = save_to_db(username, s_dict, initial_report, hesitation=hes, doc_id=doc_id)
         elif test_type == 'integrity':
-            save_success = save_integrity_test_to_db(username, s_dict, rel, initial_report, hesitation=hes)
+            save_success = save_integrity_test_to_db(username, s_dict, rel, initial_report, hesitation=hes,
+                                                     doc_id=doc_id)
         elif test_type == 'combined':
-            save_success = save_combined_test_to_db(username, s_dict, i_dict, rel, initial_report, hesitation=hes)
+            save_success = save_combined_test_to_db(username, s_dict, i_dict, rel, initial_report,
+                                                    hesitation=hes, doc_id=doc_id)
     except Exception as e:
         save_error_msg = str(e)
     
@@ -3415,6 +3180,9 @@ def finish_test_fast():
     st.session_state.db_save_error = save_error_msg
 
     st.session_state.ai_status = 'processing'
+    st.session_state.ai_partial = {}
+    st.session_state.gemini_report = None
+    st.session_state.claude_report = None
     hist = []
     try:
         if test_type in ('hexaco', 'quick', 'haifa'):
@@ -3426,11 +3194,13 @@ def finish_test_fast():
     except Exception:
         pass
 
-    # FIXED: שולח לעבודה דרך executor — לא thread גולמי
+    # העבודה נרשמת קודם בטבלת העבודות (שורדת הפעלה מחדש / worker חיצוני),
+    # ואז נשלחת ל-scheduler של התהליך — מי שלוקח אותה ראשון (claim) מריץ אותה.
     # ה-Future נשמר ב-session state, ובכל rerun נבדוק אם הוא מוכן
-    executor = _get_executor()
-    future = executor.submit(
-        _run_ai_pure,
+    # עבודה אחת לכל משתמש+סוג מבחן; אם התור מלא — הדוח נדחה ויגיע להיסטוריה
+    job_key = f"{st.session_state.user_name}|{test_type}"
+    job_id = st.session_state.test_doc_id
+    payload = ai_payload(
         st.session_state.user_name,
         test_type,
         st.session_state.summary_data,
@@ -3439,9 +3209,32 @@ def finish_test_fast():
         st.session_state.contradictions,
         st.session_state.hesitation_count,
         hist,
+        doc_key=(TEST_TYPE_COLLECTIONS.get(test_type), job_id),
     )
+    queue = get_ai_job_queue()
+    queued = False
+    if queue is not None:
+        try:
+            queue.enqueue(job_id, job_key, payload)
+            queued = True
+        except Exception:
+            pass
+    st.session_state.ai_job_id = job_id if queued else None
+
+    future = None
+    if not (queued and external_worker_enabled()):
+        future = _get_ai_scheduler().submit(
+            job_key, job_id, _ai_job_fn(), job_id, payload, worker_id(),
+            partial=st.session_state.ai_partial,
+        )
     st.session_state.ai_future = future
     st.session_state.ai_submitted_at = time.time()
+    if future is None and not queued:
+        st.session_state.ai_status = 'busy'
+    elif future is None and not external_worker_enabled():
+        st.session_state.ai_status = 'deferred'  # התור מלא — ה-worker המובנה יפיק אותו מהטבלה
+    elif future is not None and future.deferred:
+        st.session_state.ai_status = 'deferred'
 
     # ===== מסמנים שהמבחן הזה כבר עובד ונשמר — מונע כפילות =====
     st.session_state.test_finalized = True
@@ -3539,6 +3332,11 @@ def _retry_save():
         test_type = st.session_state.test_type
         
         report = "המבחן נשמר. הניתוח המעמיק יופיע ברגע שה-AI יסיים..."
+        # אם ה-AI כבר סיים — שומרים ישר עם הדוח
+        if st.session_state.get('ai_status') == 'done' and st.session_state.get('gemini_report'):
+            report = [st.session_state.gemini_report, st.session_state.get('claude_report')]
+        # אותו מזהה כמו בניסיון הראשון — כך שהדוח של ה-AI יגיע לאותו מסמך
+        doc_id = st.session_state.get('test_doc_id')
         
         success = False
         if test_type == 'haifa':
@@ -3555,13 +3353,15 @@ def _retry_save():
             ]
             success = save_haifa_test_to_db(username, s_dict, report,
                                              hesitation=hes, video_count=video_count,
-                                             video_data=video_data)
+                                             video_data=video_data, doc_id=doc_id)
         elif test_type in ('hexaco', 'quick'):
-            success = save_to_db(username, s_dict, report, hesitation=hes)
+            success = save_to_db(username, s_dict, report, hesitation=hes, doc_id=doc_id)
         elif test_type == 'integrity':
-            success = save_integrity_test_to_db(username, s_dict, rel, report, hesitation=hes)
+            success = save_integrity_test_to_db(username, s_dict, rel, report, hesitation=hes,
+                                                doc_id=doc_id)
         elif test_type == 'combined':
-            success = save_combined_test_to_db(username, s_dict, i_dict, rel, report, hesitation=hes)
+            success = save_combined_test_to_db(username, s_dict, i_dict, rel, report, hesitation=hes,
+                                               doc_id=doc_id)
         
         if success:
             st.session_state.db_save_status = 'success'
@@ -3589,7 +3389,15 @@ def render_results():
     
     # ===== משוב על שמירה ל-DB =====
     db_status = st.session_state.get('db_save_status')
-    if db_status == 'success':
+    save_state = get_save_state(st.session_state.get('test_doc_id')) if db_status == 'success' else None
+    if save_state == 'pending':
+        st.info("💾 **המבחן נשמר מקומית** — מסתנכרן להיסטוריה שלך ברקע (גם אם החיבור למסד הנתונים נפל)")
+    elif save_state == 'dead':
+        st.error("⚠️ **המבחן לא הגיע להיסטוריה** — הסנכרון למסד הנתונים נכשל שוב ושוב. "
+                 "התוצאות עדיין מוצגות כאן.")
+        if st.button("🔄 נסה לשמור שוב", key="retry_save_dead"):
+            _retry_save()
+    elif db_status == 'success':
         st.success("✅ **המבחן נשמר בהיסטוריה שלך** — תוכל לחזור אליו בכל זמן מטאב 'ההיסטוריה שלי'")
     elif db_status == 'error':
         err = st.session_state.get('db_save_error', 'שגיאה לא ידועה')
@@ -3723,31 +3531,10 @@ def render_results():
         st.balloons()
         st.session_state.balloons_shown = True
 
-    # FIXED: רענון רק כשמחכים ל-AI, וגם הצגת התקדמות יפה
-    if st.session_state.ai_status == 'processing':
-        elapsed = int(time.time() - st.session_state.get('ai_submitted_at', time.time()))
-        # רענון אגרסיבי יותר כדי לתפוס את הסיום מהר
-        st_autorefresh(interval=2000, limit=300, key="ai_polling")
-        
-        # מחוון התקדמות חזותי
-        progress_pct = min(95, elapsed * 2)  # 50 שניות = 100%
-        st.markdown(f"""
-        <div style="background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%); 
-                    padding: 16px; border-radius: 12px; margin: 10px 0;
-                    border-right: 4px solid #1976d2;">
-            <div style="font-weight: 600; color: #0d47a1;">
-                🤖 מנועי ה-AI מנתחים את התוצאות שלך... ({elapsed} שניות)
-            </div>
-            <div style="background: #fff; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
-                <div style="background: linear-gradient(90deg, #1976d2, #42a5f5); 
-                            height: 100%; width: {progress_pct}%; 
-                            transition: width 0.5s ease;"></div>
-            </div>
-            <div style="font-size: 0.85rem; color: #555; margin-top: 8px;">
-                💡 בינתיים אתה יכול לעיין בתוצאות, בלמידה ובהורדות. הניתוח יופיע אוטומטית.
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    # ה-AI מתעדכן ב-fragments משלו (באנר + לשונית) — בזמן ההמתנה רק הם מתרעננים, לא כל הדף
+    st.session_state.ai_status_rendered = st.session_state.ai_status
+    interval = _ai_poll_interval()
+    st.fragment(_render_ai_banner, run_every=interval if st.session_state.ai_status == 'processing' else None)()
 
     tab1, tab2, tab3, tab4 = st.tabs(["📊 תוצאות", "🤖 ניתוח AI", "📚 למידה", "📥 הורדות"])
 
@@ -3758,29 +3545,19 @@ def render_results():
     with tab4:
         _render_downloads_tab()
     with tab2:
-        if st.session_state.ai_status == 'processing':
-            elapsed = int(time.time() - st.session_state.get('ai_submitted_at', time.time()))
-            st.info(f"🤖 **ה-AI מנתח את התוצאות שלך ברקע... ({elapsed} שניות עברו)**\n\n"
-                    f"זה לוקח בדרך כלל 30-90 שניות. הדוח יופיע כאן אוטומטית כשיהיה מוכן.\n\n"
-                    f"💡 בינתיים תוכל לעיין בלשוניות אחרות — התוצאות, מדריך הלמידה, וההורדות זמינות עכשיו.")
-        elif st.session_state.ai_status == 'error':
-            st.error("❌ הייתה בעיה בהפקת הניתוח. כנראה שגיאה בחיבור ל-AI. בדוק את ה-API keys.")
-            if st.session_state.get('gemini_report'):
-                st.code(str(st.session_state.gemini_report))
-        else:
-            _render_ai_tab()
+        st.fragment(_render_ai_panel, run_every=interval)()
 
     st.markdown("---")
     if st.button("🏠 חזרה לדף הבית", use_container_width=True, type="primary"):
         # ביטול Future אם עדיין רץ
         f = st.session_state.get('ai_future')
         if f and not f.done():
-            # לא מבטלים — נותנים לו להמשיך כדי שהתוצאה תישמר ב-DB
-            pass
+            # מפנים את המקום בתור המיידי — אם עוד לא התחיל, ימשיך כנדחה כדי שהדוח יישמר ב-DB
+            _get_ai_scheduler().cancel(f)
         for key in ['responses', 'results_data', 'summary_data', 'int_summary_data',
-                    'gemini_report', 'claude_report', 'last_tip', 'ai_future']:
+                    'gemini_report', 'claude_report', 'last_tip', 'ai_future', 'ai_partial', 'ai_job_id']:
             if key in st.session_state:
-                st.session_state[key] = None if 'data' in key or 'report' in key or 'tip' in key or 'future' in key else []
+                st.session_state[key] = None if 'data' in key or 'report' in key or 'tip' in key or 'future' in key or 'partial' in key or 'job' in key else []
         st.session_state.ai_status = 'pending'
         st.session_state.balloons_shown = False
         st.session_state.test_finalized = False
@@ -3788,6 +3565,92 @@ def render_results():
         st.rerun()
 
 
+def _ai_poll_interval():
+    """כל כמה שניות ה-fragments של ה-AI מתרעננים (None — לא מתרעננים)."""
+    interval = AI_POLL_INTERVALS.get(st.session_state.get('ai_status'))
+    if interval and time.time() - st.session_state.get('ai_submitted_at', time.time()) > AI_POLL_MAX_SECONDS:
+        return None
+    return interval
+
+
+def _refresh_ai_status():
+    """
+    בתוך fragment של ה-AI: שולף את מה שהגיע מה-Future. אם הסטטוס השתנה מאז ההרצה המלאה
+    (הדוח מוכן / שגיאה) — rerun לכל הדף, כדי שהבאנר, הבלונים והלשונית יתעדכנו יחד.
+    """
+    _check_ai_future()
+    if st.session_state.ai_status != st.session_state.get('ai_status_rendered'):
+        st.rerun()
+
+
+def _render_ai_banner():
+    """באנר ההתקדמות מעל הלשוניות — מתרענן כל שנייה בזמן שה-AI רץ."""
+    _refresh_ai_status()
+    if st.session_state.ai_status != 'processing':
+        return
+    elapsed = int(time.time() - st.session_state.get('ai_submitted_at', time.time()))
+    # מיקום בתור — אם כל ה-workers תפוסים
+    queue_pos = _get_ai_scheduler().position(st.session_state.get('ai_future'))
+    if queue_pos:
+        ai_headline = f"⏳ ממתין בתור לניתוח AI — מקום {queue_pos} ({elapsed} שניות)"
+    else:
+        ai_headline = f"🤖 מנועי ה-AI מנתחים את התוצאות שלך... ({elapsed} שניות)"
+
+    # מחוון התקדמות חזותי
+    progress_pct = min(95, elapsed * 2)  # 50 שניות = 100%
+    st.markdown(f"""
+    <div style="background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%); 
+                padding: 16px; border-radius: 12px; margin: 10px 0;
+                border-right: 4px solid #1976d2;">
+        <div style="font-weight: 600; color: #0d47a1;">
+            {ai_headline}
+        </div>
+        <div style="background: #fff; height: 8px; border-radius: 4px; margin-top: 8px; overflow: hidden;">
+            <div style="background: linear-gradient(90deg, #1976d2, #42a5f5); 
+                        height: 100%; width: {progress_pct}%; 
+                        transition: width 0.5s ease;"></div>
+        </div>
+        <div style="font-size: 0.85rem; color: #555; margin-top: 8px;">
+            💡 בינתיים אתה יכול לעיין בתוצאות, בלמידה ובהורדות. הניתוח יופיע אוטומטית.
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+def _render_ai_panel():
+    """לשונית ה-AI — הטקסט מגיע ב-streaming, והלשונית מתרעננת לבד עד שהדוח מוכן."""
+    _refresh_ai_status()
+    if st.session_state.ai_status == 'processing':
+        elapsed = int(time.time() - st.session_state.get('ai_submitted_at', time.time()))
+        if st.session_state.get('gemini_report') or st.session_state.get('claude_report'):
+            # הטקסט מגיע ב-streaming — מציגים מה שיש, וממשיכים לרענן
+            partial = st.session_state.get('ai_partial') or {}
+            waiting = " ו-".join(name for key, name in (('gemini', "Gemini"), ('claude', "Claude"))
+                                 if not partial.get(f'{key}_done'))
+            if waiting:
+                st.info(f"⏳ **{waiting} עדיין כותב... ({elapsed} שניות עברו)** — הטקסט מתעדכן כאן אוטומטית.")
+            else:
+                st.info("💾 **הניתוח הושלם** — שומרים את הדוח בהיסטוריה שלך...")
+            _render_ai_tab()
+        else:
+            st.info(f"🤖 **ה-AI מנתח את התוצאות שלך ברקע... ({elapsed} שניות עברו)**\n\n"
+                    f"זה לוקח בדרך כלל 30-90 שניות. הדוח יופיע כאן אוטומטית כשיהיה מוכן.\n\n"
+                    f"💡 בינתיים תוכל לעיין בלשוניות אחרות — התוצאות, מדריך הלמידה, וההורדות זמינות עכשיו.")
+    elif st.session_state.ai_status == 'deferred':
+        st.info("🕒 **המערכת עמוסה כרגע** — ניתוח ה-AI יופק ברקע כשיתפנה מקום, "
+                "וישמר אוטומטית בהיסטוריה שלך. אפשר לחזור אליו מטאב 'ההיסטוריה שלי'.")
+    elif st.session_state.ai_status == 'busy':
+        st.warning("⚠️ **המערכת עמוסה מאוד** — לא ניתן להפיק ניתוח AI כרגע. "
+                   "התוצאות נשמרו; נסה מבחן נוסף מאוחר יותר לקבלת ניתוח.")
+    elif st.session_state.ai_status == 'error':
+        st.error("❌ הייתה בעיה בהפקת הניתוח. כנראה שגיאה בחיבור ל-AI. בדוק את ה-API keys.")
+        if st.session_state.get('gemini_report'):
+            st.code(str(st.session_state.gemini_report))
+    else:
+        _render_ai_tab()
+
+
+@st.fragment
 def _render_results_tab():
     summary = st.session_state.get('summary_data')
     if summary is not None and hasattr(summary, 'empty') and not summary.empty:
@@ -3992,13 +3855,19 @@ def _render_learning_tab():
         st.info("נתוני HEXACO מוצגים רק במבדקי HEXACO, מהיר ומשולב.")
 
 
+def _response_dicts():
+    """התשובות כ-dicts רגילים — לייצוא (pandas / PDF / Excel)."""
+    responses = st.session_state.get('responses') or []
+    return responses.to_dicts() if isinstance(responses, ResponseLog) else list(responses)
+
+
 def _render_downloads_tab():
     st.markdown("### 📥 הורדת דוחות")
     col1, col2 = st.columns(2)
     with col1:
         try:
             summary = st.session_state.get('summary_data')
-            responses = st.session_state.get('responses', [])
+            responses = _response_dicts()
             if summary is not None:
                 pdf = create_pdf_report(summary, responses)
                 if isinstance(pdf, bytes):
@@ -4009,7 +3878,7 @@ def _render_downloads_tab():
             st.warning(f"שגיאה ב-PDF: {e}")
     with col2:
         try:
-            responses = st.session_state.get('responses', [])
+            responses = _response_dicts()
             if responses:
                 excel = create_excel_download(responses)
                 if isinstance(excel, bytes):
@@ -4036,7 +3905,7 @@ def _render_downloads_tab():
             # fallback ל-CSV גם במקרה של חריגה
             try:
                 import io
-                responses = st.session_state.get('responses', [])
+                responses = _response_dicts()
                 if responses:
                     df = pd.DataFrame(responses).fillna('')
                     csv_bytes = df.to_csv(index=False).encode('utf-8-sig')
@@ -4055,26 +3924,73 @@ def render_admin():
     if st.button("🏠 חזרה לדף הבית", type="primary"):
         st.session_state.step = 'HOME'
         st.rerun()
+    if st.button("🔄 רענון נתונים", type="secondary"):
+        refresh_admin_cache()
+    if st.button("🧮 בניית מדדים מחדש", type="secondary"):
+        with st.spinner("סופר את כל המבדקים..."):
+            st.success(f"המדדים נבנו מחדש מ-{rebuild_admin_stats()} מבדקים")
+    with st.expander("🛠️ אבחון חיבורים"):
+        http_stats = get_http_pool_stats()
+        hc1, hc2, hc3 = st.columns(3)
+        hc1.metric("בקשות ל-AI", http_stats['requests'])
+        hc2.metric("חיבורים שנפתחו", http_stats['connections'])
+        hc3.metric("חיבורים שמוחזרו", http_stats['reused'])
+        queue_stats = _get_ai_scheduler().stats()
+        qc1, qc2, qc3 = st.columns(3)
+        qc1.metric("דוחות AI בהפקה", queue_stats['running'])
+        qc2.metric("ממתינים בתור", queue_stats['queued'])
+        qc3.metric("דוחות נדחים", queue_stats['deferred'])
+        job_queue = get_ai_job_queue()
+        if job_queue is not None:
+            job_stats = job_queue.stats()
+            jc1, jc2, jc3 = st.columns(3)
+            jc1.metric("עבודות בטבלה — ממתינות", job_stats['queued'])
+            jc2.metric("עבודות בטבלה — רצות", job_stats['running'])
+            jc3.metric("עבודות שנכשלו", job_stats['error'])
+            if external_worker_enabled():
+                st.caption("הדוחות מופקים ע\"י worker חיצוני (python -m ai_worker)")
+        journal_stats = get_save_journal_stats()
+        if journal_stats is not None:
+            sj1, sj2 = st.columns(2)
+            sj1.metric("שמירות ממתינות ביומן", journal_stats['pending'])
+            sj2.metric("שמירות שנכשלו סופית", journal_stats['dead'])
+        cache_stats = get_report_cache_stats()
+        rc1, rc2, rc3 = st.columns(3)
+        rc1.metric("דוחות ב-cache", cache_stats['entries'])
+        rc2.metric("פגיעות ב-cache", cache_stats['hits'])
+        rc3.metric("אחוז פגיעה", f"{cache_stats['hit_rate']:.1f}%")
+        key_health = get_gemini_key_health()
+        if key_health:
+            st.caption("מצב מפתחות Gemini")
+            st.dataframe(pd.DataFrame(key_health).set_index('key'), use_container_width=True)
+        claude_models = get_claude_model_resolution()
+        if claude_models:
+            st.caption("מודל Claude שנבחר לכל מפתח")
+            st.dataframe(pd.DataFrame(claude_models).set_index('key'), use_container_width=True)
+        token_stats = get_prompt_token_stats()
+        if token_stats:
+            st.caption("גודל prompts ודוחות (tokens) מאז עליית השרת")
+            st.dataframe(pd.DataFrame(token_stats).set_index('provider'), use_container_width=True)
     st.markdown("---")
 
     try:
-        all_tests = get_all_tests()
-        if not all_tests:
+        # מדדים מהמונים המצטברים (כמה קריאות קטנות) — סריקה עד שהמונים נבנו מכל המבדקים
+        stats = get_admin_stats()
+        all_tests = None
+        if stats is None:
+            all_tests = get_admin_summaries()
+            stats = compute_admin_stats(all_tests)
+            st.caption("המדדים מחושבים מסריקת כל המבדקים — לחצו 🧮 כדי לבנות את המונים המצטברים")
+        if not stats['total_tests']:
             st.info("אין מבדקים במערכת")
             return
 
         st.markdown("### 📊 מדדי רוחב — כלל המערכת")
-        total_tests = len(all_tests)
-        unique_users = len(set(t.get('user_name', '') for t in all_tests))
-        hesitation_vals = [t.get('hesitation_count', 0) for t in all_tests if t.get('hesitation_count') is not None]
-        reliability_vals = [t.get('reliability_score', 0) for t in all_tests if t.get('reliability_score') is not None]
-        avg_hesitation = sum(hesitation_vals) / len(hesitation_vals) if hesitation_vals else 0
-        avg_reliability = sum(reliability_vals) / len(reliability_vals) if reliability_vals else 0
-
-        type_counts = {}
-        for t in all_tests:
-            tt = t.get('test_type', 'unknown')
-            type_counts[tt] = type_counts.get(tt, 0) + 1
+        total_tests = stats['total_tests']
+        unique_users = stats['unique_users']
+        avg_hesitation = stats['avg_hesitation']
+        avg_reliability = stats['avg_reliability']
+        type_counts = stats['type_counts']
 
         sc1, sc2, sc3, sc4 = st.columns(4)
         sc1.markdown(f"""<div class="admin-stat-card"><div class="admin-stat-value">{total_tests}</div><div class="admin-stat-label">סה״כ מבדקים</div></div>""", unsafe_allow_html=True)
@@ -4092,11 +4008,19 @@ def render_admin():
 
         st.markdown("---")
         st.markdown("### 👤 תיק מועמד")
-        all_names = sorted(set(t.get('user_name', '') for t in all_tests if t.get('user_name')))
+        if all_tests is None:
+            all_names = get_admin_user_names()
+        else:
+            all_names = sorted(set(t.get('user_name', '') for t in all_tests if t.get('user_name')))
         selected_name = st.selectbox("בחר מועמד:", ["— בחר —"] + all_names)
 
         if selected_name and selected_name != "— בחר —":
-            candidate_tests = [t for t in all_tests if t.get('user_name') == selected_name]
+            if all_tests is None:
+                summaries = get_admin_user_summaries(selected_name)
+            else:
+                summaries = [t for t in all_tests if t.get('user_name') == selected_name]
+            # המסמכים המלאים (דוח AI, תוצאות) — רק של המועמד שנבחר
+            candidate_tests = get_admin_candidate_tests(summaries)
             candidate_tests.sort(key=lambda x: x.get('test_date', ''))
             st.markdown(f"### 📋 {html.escape(selected_name)} — {len(candidate_tests)} מבדקים")
 
@@ -4119,6 +4043,9 @@ def render_admin():
 # ============================================================
 def main():
     init_session_state()
+    # שמירות שממתינות ביומן (גם מהפעלה קודמת) עוברות ל-Firestore ברקע
+    start_save_flusher()
+    start_embedded_worker()
     step = st.session_state.step
     if step == 'HOME':
         render_home()
@@ -6,10 +6,18 @@ Firebase Firestore: save, fetch, admin.
 
 import streamlit as st
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import copy
 import json
+import random
 import threading
+import time
 import re
 import hashlib
+import uuid
+
+from save_journal import FinalError, JournalFlusher, SaveJournal
+from secrets_config import get_secret
 
 
 # ============================================================
@@ -44,11 +52,11 @@ def _init_firebase_safe():
             from google.cloud import firestore
             from google.oauth2 import service_account
             
-            try:
-                firebase_config = dict(st.secrets["firebase"])
-            except Exception as e:
-                _db_init_error = f"Cannot read st.secrets: {e}"
+            firebase_config = get_secret("firebase")
+            if not firebase_config:
+                _db_init_error = "Cannot read the firebase secret (st.secrets / secrets file / env)"
                 return None
+            firebase_config = dict(firebase_config)
             
             if 'private_key' in firebase_config:
                 firebase_config['private_key'] = firebase_config['private_key'].replace('\\n', '\n')
@@ -115,8 +123,14 @@ class DB_Manager:
             return None
 
     def save_test(self, user_name, results, report, collection,
-                  hesitation_count=0, extra_data=None):
-        """Save test results to Firestore."""
+                  hesitation_count=0, extra_data=None, doc_id=None):
+        """
+        Save test results to Firestore.
+        doc_id — מזהה שנוצר מראש (לעדכון הדוח אחר כך). שמירה חוזרת עם אותו
+        מזהה לא יוצרת כפילות: create נכשל אם המסמך כבר קיים.
+        השמירה נרשמת קודם ביומן המקומי, וה-flusher מעביר אותה ל-Firestore ברקע.
+        """
+        # גם עם יומן — בלי Firebase מוגדר השמירה לא תגיע לעולם, אז לא רושמים אותה
         db = self._get_db()
         if not db:
             try:
@@ -124,6 +138,7 @@ class DB_Manager:
             except Exception:
                 pass
             return False
+        journal = _get_journal()
 
         # ולידציה של שם משתמש
         if not user_name or not str(user_name).strip():
@@ -163,10 +178,17 @@ class DB_Manager:
                     if k and isinstance(k, str):
                         doc[k] = self._safe_serialize(v)
 
-            doc_ref = db.collection(collection).add(doc)
-            if doc_ref:
-                return True
-            return False
+            doc_id = doc_id or uuid.uuid4().hex
+            if journal is not None:
+                try:
+                    journal.append('create', collection, doc_id, doc)
+                    _wake_flusher()
+                    return True
+                except Exception:
+                    pass  # היומן לא זמין (דיסק) — כתיבה ישירה
+
+            self.write_tests(db, [(collection, doc_id, doc)])
+            return True
         except Exception as e:
             global _db_init_error
             _db_init_error = f"Save failed: {type(e).__name__}: {e}"
@@ -176,8 +198,94 @@ class DB_Manager:
                 pass
             return False
 
+    def write_tests(self, db, items):
+        """
+        כותב [(collection, doc_id, doc)] + מוני האדמין בטרנזקציה אחת (אטומי).
+        מבחן שכבר נספר (אותו מפתח של _dedupe_admin_tests) לא מעלה את המונים שוב.
+        מבחן בודד שכבר קיים (למשל timeout אחרי commit) — לא נכתב שוב.
+        """
+        from google.api_core.exceptions import AlreadyExists
+        from google.cloud import firestore
+
+        markers = {}
+        for collection, _, doc in items:
+            markers.setdefault(_admin_dedupe_id(doc), (collection, doc))
+        meta_ref = db.collection(ADMIN_STATS_COLLECTION).document(ADMIN_STATS_META)
+        dedupe_ref = db.collection(ADMIN_DEDUPE_COLLECTION)
+
+        @firestore.transactional
+        def _apply(transaction):
+            # המונים של ה-generation השלם, ושל זה שנבנה עכשיו (rebuild_admin_stats) אם יש
+            generations = _counting_generations(meta_ref.get(transaction=transaction).to_dict())
+            refs = {(gen, mid): dedupe_ref.document(_marker_id(gen, mid))
+                    for gen in generations for mid in markers}
+            counted = {snap.id for snap in db.get_all(list(refs.values()), transaction=transaction)
+                       if snap.exists} if refs else set()
+            for collection, doc_id, doc in items:
+                transaction.create(db.collection(collection).document(doc_id), doc)
+            for gen in generations:
+                new = []
+                for mid, (collection, doc) in markers.items():
+                    ref = refs[(gen, mid)]
+                    if ref.id not in counted:
+                        transaction.set(ref, _marker_fields(collection, doc, gen))
+                        new.append((collection, doc))
+                _add_admin_stats_writes(db, transaction, new, gen)
+            _add_admin_user_writes(db, transaction, markers.values())
+
+        try:
+            _apply(db.transaction())
+        except AlreadyExists:
+            if len(items) > 1:
+                raise
+        # ההיסטוריה של המשתמש השתנתה — ה-cache לא תקף
+        for _, _, doc in items:
+            _invalidate_history(doc.get('user_id'))
+
+    def update_ai_report(self, collection, doc_id, report):
+        """
+        מעדכן את ai_report במסמך שנשמר — פעם אחת בלבד (ai_status='done').
+        מחזיר 'written' / 'already' / 'missing'.
+        """
+        from google.cloud import firestore
+
+        db = self._get_db()
+        if not db:
+            raise RuntimeError("Firebase לא זמין")
+        ref = db.collection(collection).document(doc_id)
+
+        @firestore.transactional
+        def _apply(transaction):
+            snap = ref.get(transaction=transaction)
+            if not snap.exists:
+                return 'missing', None
+            current = snap.to_dict() or {}
+            if current.get('ai_status') == 'done':
+                return 'already', current.get('user_id')
+            transaction.update(ref, {
+                'ai_report': self._safe_serialize(report),
+                'ai_status': 'done',
+                'ai_updated_at': datetime.now(),
+            })
+            return 'written', current.get('user_id')
+
+        outcome, user_id = _apply(db.transaction())
+        if outcome == 'written':
+            _invalidate_history(user_id)
+            with _admin_lock:
+                _admin_doc_cache.pop((collection, doc_id), None)
+        return outcome
+
     def fetch_history(self, user_name, collection):
         """Fetch up to 20 records — without order_by."""
+        try:
+            return self._query_history(user_name, collection)
+        except Exception as e:
+            _warn_history_error(collection, e)
+            return []
+
+    def _query_history(self, user_name, collection):
+        """כמו fetch_history — אבל זורק שגיאה במקום להציג אזהרה (בטוח ל-thread)."""
         db = self._get_db()
         if not db:
             return []
@@ -187,25 +295,56 @@ class DB_Manager:
 
         user_id = _make_safe_user_id(str(user_name).strip())
 
+        query = (db.collection(collection)
+                 .where('user_id', '==', user_id)
+                 .limit(20))
+        docs = list(query.stream())
+        results = [doc.to_dict() for doc in docs]
+        
         try:
-            query = (db.collection(collection)
-                     .where('user_id', '==', user_id)
-                     .limit(20))
-            docs = list(query.stream())
-            results = [doc.to_dict() for doc in docs]
-            
-            try:
-                results.sort(key=lambda x: x.get('timestamp', ''), reverse=False)
-            except Exception:
-                pass
-            
-            return results
-        except Exception as e:
-            try:
-                st.warning(f"⚠️ שגיאה בטעינת היסטוריה ({collection}): {type(e).__name__}: {e}")
-            except Exception:
-                pass
-            return []
+            results.sort(key=lambda x: x.get('timestamp', ''), reverse=False)
+        except Exception:
+            pass
+        
+        return results
+
+    def fetch_admin_page(self, collection, fields, start_after=None, page_size=500):
+        """
+        עמוד אחד של מסמכים לפי מזהה המסמך — רק השדות ב-fields (projection).
+        (מיון לפי מזהה ולא לפי timestamp — מסמך בלי timestamp לא נופל מהסריקה.)
+        מחזיר (docs, cursor) — cursor הוא ה-snapshot האחרון, להמשך מאותה נקודה.
+        """
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        db = self._get_db()
+        if not db:
+            return [], start_after
+        query = (db.collection(collection)
+                 .select(list(fields))
+                 .order_by(FieldPath.document_id())
+                 .limit(page_size))
+        if start_after is not None:
+            query = query.start_after(start_after)
+        snaps = list(query.stream())
+        docs = []
+        for snap in snaps:
+            doc = snap.to_dict() or {}
+            doc['_collection'] = collection
+            doc['_doc_id'] = snap.id
+            docs.append(doc)
+        return docs, (snaps[-1] if snaps else start_after)
+
+    def fetch_documents(self, keys):
+        """מסמכים מלאים לפי [(collection, doc_id)] — batch get אחד."""
+        db = self._get_db()
+        if not db or not keys:
+            return {}
+        refs = [db.collection(c).document(doc_id) for c, doc_id in keys]
+        docs = {}
+        for snap in db.get_all(refs):
+            if snap.exists:
+                docs[(snap.reference.parent.id, snap.id)] = snap.to_dict()
+        return docs
 
     def fetch_all_tests_admin(self, collection):
         db = self._get_db()
@@ -235,36 +374,466 @@ class DB_Manager:
             return str(data)
 
 
+def _warn_history_error(collection, e):
+    try:
+        st.warning(f"⚠️ שגיאה בטעינת היסטוריה ({collection}): {type(e).__name__}: {e}")
+    except Exception:
+        pass
+
+
+# ============================================================
+# History Cache — 4 הקולקציות במקביל + cache לכל משתמש
+# ============================================================
+HISTORY_COLLECTIONS = ('hexaco_results', 'integrity_results', 'combined_results', 'haifa_results')
+HISTORY_TTL_SECONDS = 60
+
+_history_cache = {}           # user_id -> (expires_at, {collection: [docs]})
+_history_lock = threading.Lock()
+_query_pool = None
+
+
+def _get_query_pool():
+    global _query_pool
+    if _query_pool is None:
+        with _history_lock:
+            if _query_pool is None:
+                _query_pool = ThreadPoolExecutor(max_workers=len(HISTORY_COLLECTIONS),
+                                                 thread_name_prefix="db_query")
+    return _query_pool
+
+
+def _invalidate_history(user_id):
+    with _history_lock:
+        _history_cache.pop(user_id, None)
+
+
+def _fetch_user_history(name):
+    """
+    {collection: [docs]} לכל 4 הקולקציות — שאילתה אחת במקביל לכל קולקציה
+    (זמן של round-trip אחד), ונשמר ל-HISTORY_TTL_SECONDS. save_test מבטל את ה-cache.
+    כל קריאה מקבלת עותק עמוק — שינוי במסמך אצל הקורא לא נוגע ב-cache.
+    """
+    if not name or not str(name).strip():
+        return {c: [] for c in HISTORY_COLLECTIONS}
+    user_id = _make_safe_user_id(str(name).strip())
+
+    with _history_lock:
+        cached = _history_cache.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return copy.deepcopy(cached[1])
+
+    futures = {c: _get_query_pool().submit(_db._query_history, name, c)
+               for c in HISTORY_COLLECTIONS}
+    by_collection, failed = {}, False
+    for collection, future in futures.items():
+        try:
+            by_collection[collection] = future.result()
+        except Exception as e:
+            by_collection[collection] = []
+            failed = True
+            _warn_history_error(collection, e)
+
+    # שגיאה לא נשמרת ב-cache — בפעם הבאה ננסה שוב
+    if not failed:
+        with _history_lock:
+            _history_cache[user_id] = (time.monotonic() + HISTORY_TTL_SECONDS, by_collection)
+    return copy.deepcopy(by_collection)
+
+
+# ============================================================
+# Admin Cache — projection + cursor לכל קולקציה
+# ============================================================
+# שדות המדדים בדשבורד — בלי ai_report / results / video_responses
+ADMIN_SUMMARY_FIELDS = ('user_name', 'user_id', 'test_type', 'test_date', 'test_time',
+                        'timestamp', 'reliability_score', 'hesitation_count')
+ADMIN_PAGE_SIZE = 500
+ADMIN_SUMMARY_TTL_SECONDS = 120
+ADMIN_DOC_TTL_SECONDS = 60
+
+_admin_cache = {}             # collection -> {'docs', 'checked_at', 'lock'}
+_admin_doc_cache = {}         # (collection, doc_id) -> (expires_at, doc)
+_admin_lock = threading.Lock()
+
+
+def _admin_entry(collection):
+    with _admin_lock:
+        entry = _admin_cache.get(collection)
+        if entry is None:
+            entry = _admin_cache[collection] = {
+                'docs': [], 'checked_at': 0.0, 'lock': threading.Lock(),
+            }
+        return entry
+
+
+def _admin_collection_summaries(collection):
+    """
+    תקצירי המסמכים של קולקציה — נסרקת כולה בעמודים (projection),
+    לכל היותר פעם ב-ADMIN_SUMMARY_TTL_SECONDS או אחרי refresh_admin_cache.
+    כל סריקה מחליפה את הרשימה — מסמכים שנמחקו יוצאים ממנה.
+    """
+    entry = _admin_entry(collection)
+    with entry['lock']:
+        if time.monotonic() - entry['checked_at'] < ADMIN_SUMMARY_TTL_SECONDS:
+            return list(entry['docs'])
+        try:
+            docs, cursor = [], None
+            while True:
+                page, cursor = _db.fetch_admin_page(collection, ADMIN_SUMMARY_FIELDS,
+                                                    start_after=cursor,
+                                                    page_size=ADMIN_PAGE_SIZE)
+                docs.extend(page)
+                if len(page) < ADMIN_PAGE_SIZE:
+                    break
+            entry['docs'] = docs
+            entry['checked_at'] = time.monotonic()
+        except Exception:
+            pass
+        return list(entry['docs'])
+
+
+# ============================================================
+# Admin Stats — מונים מצטברים (sharded) שמתעדכנים בכל שמירה
+# ============================================================
+ADMIN_STATS_COLLECTION = 'admin_stats'
+ADMIN_USERS_COLLECTION = 'admin_users'
+ADMIN_DEDUPE_COLLECTION = 'admin_dedupe'   # מבדק אחד לכל מפתח של _dedupe_admin_tests
+ADMIN_STATS_SHARDS = 4
+ADMIN_STATS_TOTAL = 'total'
+ADMIN_STATS_META = '_meta'   # {'generation', 'complete'} — נכתב ע"י rebuild_admin_stats (+ 'building' בזמן בנייה)
+ADMIN_REBUILD_PAGE = 150     # מבדקים לכל batch בבנייה מחדש: סימון + 2 מונים לכל אחד < 500 כתיבות
+ADMIN_PRUNE_PAGE = 400
+
+
+def _admin_dedupe_key(t):
+    # כולל שם משתמש במפתח (כי אדמין רואה את כולם)
+    return (
+        t.get('user_name', ''),
+        t.get('test_type', ''),
+        t.get('test_date', ''),
+        str(t.get('test_time', ''))[:5],
+        str(t.get('reliability_score', '')),
+    )
+
+
+def _admin_dedupe_id(t):
+    return hashlib.sha1(repr(_admin_dedupe_key(t)).encode('utf-8')).hexdigest()
+
+
+def _stats_doc_id(collection, period, shard, generation):
+    return f"{generation}__{collection}__{period}__{shard}"
+
+
+def _marker_id(generation, dedupe_id):
+    return f"{generation}__{dedupe_id}"
+
+
+def _marker_fields(collection, doc, generation):
+    return {'collection': collection, 'timestamp': doc.get('timestamp'), 'generation': generation}
+
+
+def _counting_generations(meta):
+    """ה-generations שכל שמירה מעדכנת: השלם ('generation') וזה שבבנייה ('building')."""
+    meta = meta or {}
+    return list(dict.fromkeys(g for g in (meta.get('generation'), meta.get('building')) if g))
+
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+_COUNTER_FIELDS = ('count', 'hesitation_sum', 'hesitation_n', 'reliability_sum', 'reliability_n')
+
+
+def _add_admin_stats_writes(db, writer, items, generation):
+    """
+    מוסיף ל-writer (batch / טרנזקציה): increment למונים של generation — לכל קולקציה
+    (יומי + סה"כ), ב-shard אקראי. items: [(collection, doc)] — אותם כללים כמו compute_admin_stats.
+    """
+    from google.cloud import firestore
+
+    if not items:
+        return
+    shard = random.randrange(ADMIN_STATS_SHARDS)
+    tests = [dict(doc, _collection=collection) for collection, doc in items]
+    counters = _counters_from_tests(tests)
+    counters.update(_counters_from_tests(tests, key=lambda t: t.get('test_date', '')))
+    for (collection, period), c in counters.items():
+        fields = {k: firestore.Increment(v) if k in _COUNTER_FIELDS else v for k, v in c.items()}
+        fields.update(period=period, shard=shard, generation=generation)
+        doc_id = _stats_doc_id(collection, period, shard, generation)
+        writer.set(db.collection(ADMIN_STATS_COLLECTION).document(doc_id), fields, merge=True)
+
+
+def _add_admin_user_writes(db, writer, items):
+    """רשומת משתמש ב-admin_users (לספירת מועמדים ייחודיים). items: [(collection, doc)]."""
+    users = {}
+    for _, doc in items:
+        users[doc.get('user_id', 'anonymous_user')] = {
+            'user_name': doc.get('user_name', ''),
+            'user_id': doc.get('user_id', ''),
+            'last_test': doc.get('timestamp'),
+        }
+    for user_id, user in users.items():
+        writer.set(db.collection(ADMIN_USERS_COLLECTION).document(user_id), user, merge=True)
+
+
+def _stats_from_counters(counters):
+    """[{test_type, count, hesitation_sum, ...}] -> מדדי הדשבורד."""
+    total = sum(c.get('count', 0) for c in counters)
+    h_sum = sum(c.get('hesitation_sum', 0) for c in counters)
+    h_n = sum(c.get('hesitation_n', 0) for c in counters)
+    r_sum = sum(c.get('reliability_sum', 0) for c in counters)
+    r_n = sum(c.get('reliability_n', 0) for c in counters)
+    type_counts = {}
+    for c in counters:
+        if c.get('count'):
+            tt = c.get('test_type', 'unknown')
+            type_counts[tt] = type_counts.get(tt, 0) + c['count']
+    return {
+        'total_tests': total,
+        'avg_hesitation': h_sum / h_n if h_n else 0,
+        'avg_reliability': r_sum / r_n if r_n else 0,
+        'type_counts': type_counts,
+    }
+
+
+def _counters_from_tests(tests, key=lambda t: ADMIN_STATS_TOTAL):
+    """מונים מתוך רשימת מבדקים — {(collection, period): counter}."""
+    counters = {}
+    for t in tests:
+        collection = t.get('_collection', '')
+        c = counters.setdefault((collection, key(t)), {
+            'collection': collection,
+            'test_type': t.get('test_type', 'unknown'),
+            'count': 0, 'hesitation_sum': 0, 'hesitation_n': 0,
+            'reliability_sum': 0, 'reliability_n': 0,
+        })
+        c['count'] += 1
+        if t.get('hesitation_count') is not None:
+            c['hesitation_sum'] += t['hesitation_count']
+            c['hesitation_n'] += 1
+        if _numeric(t.get('reliability_score')):
+            c['reliability_sum'] += t['reliability_score']
+            c['reliability_n'] += 1
+    return counters
+
+
+def compute_admin_stats(tests):
+    """מדדי הדשבורד מתוך רשימת מבדקים (כשאין עדיין מונים)."""
+    stats = _stats_from_counters(list(_counters_from_tests(tests).values()))
+    stats['type_counts'] = {}
+    for t in tests:
+        tt = t.get('test_type', 'unknown')
+        stats['type_counts'][tt] = stats['type_counts'].get(tt, 0) + 1
+    stats['unique_users'] = len(set(t.get('user_name', '') for t in tests))
+    return stats
+
+
+def refresh_admin_cache():
+    """מוחק את ה-cache של האדמין — הקריאה הבאה סורקת את כל הקולקציות מחדש (טעינה מלאה)."""
+    with _admin_lock:
+        _admin_cache.clear()
+        _admin_doc_cache.clear()
+
+
+# ============================================================
+# Save Journal — יומן מקומי + flusher רקע ל-Firestore
+# ============================================================
+_journal = None
+_journal_flusher = None
+_journal_lock = threading.Lock()
+_journal_init_attempted = False
+
+
+def _get_journal():
+    """היומן המקומי (SQLite) — None אם אי אפשר לפתוח אותו (אז שומרים ישירות)."""
+    global _journal, _journal_init_attempted
+    if _journal is not None or _journal_init_attempted:
+        return _journal
+    with _journal_lock:
+        if not _journal_init_attempted:
+            _journal_init_attempted = True
+            try:
+                _journal = SaveJournal()
+            except Exception:
+                _journal = None
+    return _journal
+
+
+def _apply_journal_rows(rows):
+    """מעביר פעולות מהיומן ל-Firestore. מחזיר {seq: None (הצליח) או שגיאה}."""
+    db = _db._get_db()
+    if not db:
+        return {row['seq']: "Firebase לא זמין" for row in rows}
+
+    outcome = {}
+    creates, seen = [], set()
+    for row in rows:
+        if row['op'] != 'create':
+            continue
+        key = (row['collection'], row['doc_id'])
+        if key in seen:
+            outcome[row['seq']] = None  # אותו מסמך פעמיים ביומן
+            continue
+        seen.add(key)
+        creates.append(row)
+
+    # ניסיון אחד ל-batch כולו; אם נכשל — כל מבחן בנפרד, כדי שאחד תקול לא יעכב את השאר
+    try:
+        if creates:
+            _db.write_tests(db, [(r['collection'], r['doc_id'], r['payload']) for r in creates])
+        outcome.update({r['seq']: None for r in creates})
+    except Exception:
+        for r in creates:
+            try:
+                _db.write_tests(db, [(r['collection'], r['doc_id'], r['payload'])])
+                outcome[r['seq']] = None
+            except Exception as e:
+                outcome[r['seq']] = f"{type(e).__name__}: {e}"
+
+    # דוח AI נכתב רק אחרי שה-create של אותו מסמך הגיע ל-Firestore
+    journal = _get_journal()
+    landed = {(r['collection'], r['doc_id']) for r in creates if outcome.get(r['seq']) is None}
+    for row in rows:
+        if row['op'] != 'ai_report':
+            continue
+        landed_now = (row['collection'], row['doc_id']) in landed
+        create_state = None if landed_now or journal is None else journal.state(row['doc_id'])
+        if create_state == 'pending':
+            outcome[row['seq']] = "ממתין לשמירת המסמך"
+            continue
+        if create_state == 'dead':
+            outcome[row['seq']] = FinalError("שמירת המסמך נכשלה סופית — אין לאן לכתוב את הדוח")
+            continue
+        try:
+            result = _db.update_ai_report(row['collection'], row['doc_id'], row['payload'].get('report'))
+            # המסמך נשמר (או נכתב ישירות) ואיננו — לא יופיע אם ננסה שוב
+            outcome[row['seq']] = (None if result in ('written', 'already')
+                                   else FinalError("המסמך לא קיים ב-Firestore"))
+        except Exception as e:
+            outcome[row['seq']] = f"{type(e).__name__}: {e}"
+    return outcome
+
+
+def start_save_flusher():
+    """מפעיל את ה-flusher (פעם אחת לתהליך) — גם כדי לרוקן שמירות מהפעלה קודמת."""
+    global _journal_flusher
+    journal = _get_journal()
+    if journal is None or _journal_flusher is not None:
+        return _journal_flusher
+    with _journal_lock:
+        if _journal_flusher is None:
+            _journal_flusher = JournalFlusher(journal, _apply_journal_rows).start()
+    return _journal_flusher
+
+
+def _wake_flusher():
+    flusher = start_save_flusher()
+    if flusher is not None:
+        flusher.wake()
+
+
+def get_save_state(doc_id):
+    """
+    מצב השמירה של המבחן ביומן: 'pending' (ממתין ל-Firestore), 'dead' (הוויתור אחרי
+    MAX_ATTEMPTS / MAX_AGE_SECONDS), או None (נשלח, או שנכתב ישירות בלי יומן).
+    """
+    journal = _get_journal()
+    if journal is None or not doc_id:
+        return None
+    try:
+        state = journal.state(doc_id)
+    except Exception:
+        return None
+    return state if state in ('pending', 'dead') else None
+
+
+def get_save_journal_stats():
+    """מספר השמירות שממתינות ביומן ושעברו ל-dead-letter (לאבחון באדמין)."""
+    journal = _get_journal()
+    if journal is None:
+        return None
+    try:
+        return {'pending': journal.pending_count(), 'dead': journal.dead_count()}
+    except Exception:
+        return None
+
+
 # ============================================================
 # Public Interface Functions
 # ============================================================
 _db = DB_Manager()
 
 
-def save_to_db(name, res, rep, hesitation=0):
-    return _db.save_test(name, res, rep, 'hexaco_results', hesitation)
+# סוג מבחן -> קולקציה
+TEST_TYPE_COLLECTIONS = {
+    'hexaco': 'hexaco_results',
+    'quick': 'hexaco_results',
+    'integrity': 'integrity_results',
+    'combined': 'combined_results',
+    'haifa': 'haifa_results',
+}
 
 
-def save_integrity_test_to_db(name, int_scores, reliability_score, rep, hesitation=0):
+def save_to_db(name, res, rep, hesitation=0, doc_id=None):
+    return _db.save_test(name, res, rep, 'hexaco_results', hesitation, doc_id=doc_id)
+
+
+def save_integrity_test_to_db(name, int_scores, reliability_score, rep, hesitation=0, doc_id=None):
     return _db.save_test(name, int_scores, rep, 'integrity_results', hesitation,
-                         extra_data={'reliability_score': reliability_score})
+                         extra_data={'reliability_score': reliability_score}, doc_id=doc_id)
 
 
-def save_combined_test_to_db(name, trait_scores, int_scores, reliability_score, rep, hesitation=0):
+def save_combined_test_to_db(name, trait_scores, int_scores, reliability_score, rep, hesitation=0,
+                             doc_id=None):
     return _db.save_test(name, trait_scores, rep, 'combined_results', hesitation,
                          extra_data={
                              'int_scores': int_scores,
                              'reliability_score': reliability_score
-                         })
+                         }, doc_id=doc_id)
 
 
-def save_haifa_test_to_db(name, results, report, hesitation=0, video_count=0, video_data=None):
+def save_haifa_test_to_db(name, results, report, hesitation=0, video_count=0, video_data=None,
+                          doc_id=None):
     """שמירה של תרגול חיפה — קטגוריה נפרדת, כולל תשובות הווידאו."""
     extra = {'video_count': video_count}
     if video_data:
         extra['video_responses'] = video_data
     return _db.save_test(name, results, report, 'haifa_results', hesitation,
-                         extra_data=extra)
+                         extra_data=extra, doc_id=doc_id)
+
+
+def update_ai_report(collection, doc_id, report, retries=3, backoff=1.0):
+    """
+    כותב את דוח ה-AI למסמך שנשמר בסוף המבחן (במקום הודעת ה-"נשמר...").
+    נרשם ביומן אחרי ה-create של אותו מסמך, וה-flusher כותב אותו רק אחרי שה-create הגיע
+    ל-Firestore. אם ה-create עבר ל-dead-letter — אין מסמך לעדכן, ולא נרשם כלום.
+    בלי יומן (או בלי create ביומן) — מנסה ישירות עם backoff. True אם הדוח נרשם/נכתב.
+    בטוח ל-thread רקע (לא נוגע ב-st).
+    """
+    journal = _get_journal()
+    try:
+        create_state = journal.state(doc_id) if journal is not None else None
+    except Exception:
+        create_state = None
+    if create_state == 'dead':
+        return False
+    if create_state is not None:
+        try:
+            journal.append('ai_report', collection, doc_id, {'report': _db._safe_serialize(report)})
+            _wake_flusher()
+            return True
+        except Exception:
+            pass
+    for attempt in range(retries):
+        try:
+            if _db.update_ai_report(collection, doc_id, report) in ('written', 'already'):
+                return True
+        except Exception:
+            pass
+        if attempt < retries - 1:
+            time.sleep(backoff * (2 ** attempt))
+    return False
 
 
 def _dedupe_tests(tests):
@@ -293,12 +862,8 @@ def _dedupe_tests(tests):
 def get_db_history(name):
     """Merge history from all 4 collections — with deduplication."""
     all_history = []
-    for collection in ['hexaco_results', 'integrity_results', 'combined_results', 'haifa_results']:
-        try:
-            history = _db.fetch_history(name, collection)
-            all_history.extend(history)
-        except Exception:
-            continue
+    for history in _fetch_user_history(name).values():
+        all_history.extend(history)
     try:
         all_history.sort(key=lambda x: x.get('timestamp', ''), reverse=False)
     except Exception:
@@ -307,15 +872,203 @@ def get_db_history(name):
 
 
 def get_integrity_history(name):
-    return _db.fetch_history(name, 'integrity_results')
+    return _fetch_user_history(name)['integrity_results']
 
 
 def get_combined_history(name):
-    return _db.fetch_history(name, 'combined_results')
+    return _fetch_user_history(name)['combined_results']
 
 
 def get_haifa_history(name):
-    return _db.fetch_history(name, 'haifa_results')
+    return _fetch_user_history(name)['haifa_results']
+
+
+def _dedupe_admin_tests(all_tests):
+    seen = set()
+    unique = []
+    for t in all_tests:
+        key = _admin_dedupe_key(t)
+        if key not in seen:
+            seen.add(key)
+            unique.append(t)
+    return unique
+
+
+def get_admin_summaries():
+    """
+    Admin: תקצירי כל המבדקים (שדות המדדים בלבד) מ-4 הקולקציות במקביל — with deduplication.
+    כל תקציר כולל _collection ו-_doc_id לטעינת המסמך המלא.
+    """
+    futures = [_get_query_pool().submit(_admin_collection_summaries, c)
+               for c in HISTORY_COLLECTIONS]
+    all_tests = []
+    for future in futures:
+        try:
+            all_tests.extend(future.result())
+        except Exception:
+            continue
+    return _dedupe_admin_tests(all_tests)
+
+
+def get_admin_candidate_tests(summaries):
+    """Admin: המסמכים המלאים (דוח AI, תוצאות) רק של התקצירים שנבחרו."""
+    now = time.monotonic()
+    keys = [(t.get('_collection'), t.get('_doc_id')) for t in summaries]
+    keys = [k for k in keys if k[0] and k[1]]
+    with _admin_lock:
+        cached = {k: v[1] for k, v in ((k, _admin_doc_cache.get(k)) for k in keys)
+                  if v and v[0] > now}
+    missing = [k for k in keys if k not in cached]
+    if missing:
+        try:
+            fetched = _db.fetch_documents(missing)
+        except Exception:
+            fetched = {}
+        with _admin_lock:
+            for k, doc in fetched.items():
+                _admin_doc_cache[k] = (now + ADMIN_DOC_TTL_SECONDS, doc)
+        cached.update(fetched)
+    # אם מסמך לא נטען — מציגים לפחות את התקציר
+    return [cached.get((t.get('_collection'), t.get('_doc_id')), t) for t in summaries]
+
+
+def get_admin_stats():
+    """
+    Admin: מדדי הדשבורד מתוך המונים — ADMIN_STATS_META ואז shards ה-total של ה-generation
+    שלו, וספירת admin_users במקביל. None עד שהמונים נבנו מכל המבדקים
+    (rebuild_admin_stats מסמן generation שלם) — אז מחשבים מסריקה.
+    """
+    db = _db._get_db()
+    if not db:
+        return None
+    try:
+        stats_ref = db.collection(ADMIN_STATS_COLLECTION)
+        users_count = _get_query_pool().submit(
+            lambda: db.collection(ADMIN_USERS_COLLECTION).count().get())
+        meta = stats_ref.document(ADMIN_STATS_META).get().to_dict() or {}
+        generation = meta.get('generation')
+        if not (meta.get('complete') and generation):
+            return None
+        refs = [stats_ref.document(_stats_doc_id(c, ADMIN_STATS_TOTAL, shard, generation))
+                for c in HISTORY_COLLECTIONS for shard in range(ADMIN_STATS_SHARDS)]
+        stats = _stats_from_counters([snap.to_dict() for snap in db.get_all(refs) if snap.exists])
+        stats['unique_users'] = int(users_count.result()[0][0].value)
+        return stats
+    except Exception:
+        return None
+
+
+def get_admin_user_names():
+    """Admin: שמות כל המועמדים — מ-admin_users (מסמך קטן לכל משתמש)."""
+    db = _db._get_db()
+    if not db:
+        return []
+    try:
+        docs = db.collection(ADMIN_USERS_COLLECTION).select(['user_name']).stream()
+        return sorted(set(d.to_dict().get('user_name', '') for d in docs) - {''})
+    except Exception:
+        return []
+
+
+def get_admin_user_summaries(name):
+    """Admin: תקצירי המבדקים של מועמד אחד — שאילתה לכל קולקציה, במקביל."""
+    def query(collection):
+        db = _db._get_db()
+        if not db:
+            return []
+        snaps = (db.collection(collection)
+                 .where('user_name', '==', name)
+                 .select(list(ADMIN_SUMMARY_FIELDS))
+                 .stream())
+        return [dict(s.to_dict() or {}, _collection=collection, _doc_id=s.id) for s in snaps]
+
+    futures = [_get_query_pool().submit(query, c) for c in HISTORY_COLLECTIONS]
+    tests = []
+    for future in futures:
+        try:
+            tests.extend(future.result())
+        except Exception:
+            continue
+    return _dedupe_admin_tests(tests)
+
+
+def _prune_admin_generations(db, collection, generation, keep=()):
+    """מוחק מ-collection מסמכים של generations אחרים — בעמודים ו-batches קטנים."""
+    prefix, cursor = f"{generation}__", None
+    while True:
+        docs, cursor = _db.fetch_admin_page(collection, [], cursor, ADMIN_PRUNE_PAGE)
+        stale = [d['_doc_id'] for d in docs if not d['_doc_id'].startswith(prefix) and d['_doc_id'] not in keep]
+        if stale:
+            batch = db.batch()
+            for doc_id in stale:
+                batch.delete(db.collection(collection).document(doc_id))
+            batch.commit()
+        if len(docs) < ADMIN_PRUNE_PAGE:
+            return
+
+
+def rebuild_admin_stats():
+    """
+    Admin: בונה מחדש את המונים, סימוני ה-dedupe ו-admin_users מכל המבדקים הקיימים
+    (אחרי dedupe, כמו compute_admin_stats). מחזיר את מספר המבדקים.
+    בלי טרנזקציה גדולה: המונים נבנים ב-generation חדש — סריקה בעמודים לפי מזהה מסמך
+    וכתיבה ב-batches קטנים, ושמירות שמגיעות בינתיים נספרות גם בו (write_tests).
+    בסוף, בכתיבה נפרדת, ה-generation מסומן שלם, ורק אז הישנים נמחקים.
+    """
+    db = _db._get_db()
+    if not db:
+        return 0
+    stats_ref = db.collection(ADMIN_STATS_COLLECTION)
+    dedupe_ref = db.collection(ADMIN_DEDUPE_COLLECTION)
+    meta_ref = stats_ref.document(ADMIN_STATS_META)
+    generation = uuid.uuid4().hex[:12]
+    meta_ref.set({'building': generation}, merge=True)
+
+    seen, users, total = set(), {}, 0
+    for collection in HISTORY_COLLECTIONS:
+        cursor = None
+        while True:
+            tests, cursor = _db.fetch_admin_page(collection, ADMIN_SUMMARY_FIELDS, cursor, ADMIN_REBUILD_PAGE)
+            page = {}
+            for t in tests:
+                mid = _admin_dedupe_id(t)
+                if mid in seen:
+                    continue
+                seen.add(mid)
+                page[mid] = t
+                user_id = t.get('user_id') or _make_safe_user_id(t.get('user_name', ''))
+                if t.get('timestamp') and (user_id not in users or users[user_id]['last_test'] < t['timestamp']):
+                    users[user_id] = {'user_name': t.get('user_name', ''), 'user_id': user_id,
+                                      'last_test': t['timestamp']}
+            total += len(page)
+            if page:
+                refs = {mid: dedupe_ref.document(_marker_id(generation, mid)) for mid in page}
+                # מבדק ששמירה חדשה כבר ספרה ב-generation הזה — לא נספר שוב
+                counted = {snap.id for snap in db.get_all(list(refs.values())) if snap.exists}
+                batch, new = db.batch(), []
+                for mid, t in page.items():
+                    if refs[mid].id not in counted:
+                        batch.set(refs[mid], _marker_fields(collection, t, generation))
+                        new.append((collection, t))
+                _add_admin_stats_writes(db, batch, new, generation)
+                batch.commit()
+            if len(tests) < ADMIN_REBUILD_PAGE:
+                break
+
+    # המונים שלמים — כתיבה אחת קטנה; מכאן הדשבורד קורא את ה-generation החדש
+    meta_ref.set({'generation': generation, 'complete': True, 'tests': total, 'rebuilt_at': datetime.now()})
+    _prune_admin_generations(db, ADMIN_STATS_COLLECTION, generation, keep={ADMIN_STATS_META})
+    _prune_admin_generations(db, ADMIN_DEDUPE_COLLECTION, generation)
+
+    # admin_users — merge אידמפוטנטי (רק לספירת מועמדים)
+    writes = list(users.items())
+    for start in range(0, len(writes), 400):
+        batch = db.batch()
+        for user_id, user in writes[start:start + 400]:
+            batch.set(db.collection(ADMIN_USERS_COLLECTION).document(user_id), user, merge=True)
+        batch.commit()
+    refresh_admin_cache()
+    return total
 
 
 def get_all_tests():
@@ -327,20 +1080,4 @@ def get_all_tests():
             all_tests.extend(tests)
         except Exception:
             continue
-    
-    # dedup — כולל שם משתמש במפתח (כי אדמין רואה את כולם)
-    seen = set()
-    unique = []
-    for t in all_tests:
-        test_time = str(t.get('test_time', ''))[:5]
-        key = (
-            t.get('user_name', ''),
-            t.get('test_type', ''),
-            t.get('test_date', ''),
-            test_time,
-            str(t.get('reliability_score', '')),
-        )
-        if key not in seen:
-            seen.add(key)
-            unique.append(t)
-    return unique
\ No newline at end of file
+    return _dedupe_admin_tests(all_tests)
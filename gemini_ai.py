@@ -1,11 +1,25 @@
 import streamlit as st
 import requests
+import asyncio
+import hashlib
 import json
+import os
 import pandas as pd
 import plotly.graph_objects as go
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+import ai_async
+from ai_scheduler import AI_EMBEDDED_WORKERS, AI_WORKERS
+from key_health import KeyRouter
+from prompt_builder import (PROMPT_TOKEN_BUDGETS, PromptBuilder, estimate_tokens, history_scores,
+                            history_trend_variants)
+from report_cache import ReportCache, report_cache_key
+from secrets_config import get_secret
+
 # זכויות יוצרים לניתאי מלכה
 
 # --- 1. הגדרות ליבה וטווחים פסיכומטריים (ניתוח פערים) ---
@@ -36,6 +50,180 @@ TRAIT_RANGES = {
     "Openness to Experience": {"critical_low": 2.8, "optimal_low": 3.5, "optimal_high": 4.1, "critical_high": 4.7}
 }
 
+# --- כתובות הספקים (ניתן להפנות לשרת מקומי לבדיקות) ---
+GEMINI_BASE_URL = os.environ.get("MEDNITAI_GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+CLAUDE_BASE_URL = os.environ.get("MEDNITAI_CLAUDE_BASE_URL", "https://api.anthropic.com").rstrip("/")
+
+# --- HTTP: Session משותף עם keep-alive לכל הקריאות ל-AI (בלי httpx — ב-async יש pool משלו) ---
+# דוחות שרצים במקביל בתהליך: workers של AIScheduler + ה-worker המובנה של ai_worker;
+# כל דוח — 2 ספקים במקביל. תהליך worker חיצוני מעדכן לפי --threads (set_report_threads).
+AI_PROVIDERS_PER_REPORT = 2
+HTTP_POOL_MAXSIZE = (AI_WORKERS + AI_EMBEDDED_WORKERS) * AI_PROVIDERS_PER_REPORT
+# (connect, read) בשניות — ב-streaming ה-read הוא ההמתנה המקסימלית בין chunks
+GEMINI_TIMEOUT = (5, 120)
+CLAUDE_TIMEOUT = (5, 120)
+DISCOVERY_TIMEOUT = (5, 10)
+
+_http_session = None
+_http_lock = threading.Lock()
+
+def _http():
+    """requests.Session אחד לכל התהליך — חיבורי TCP+TLS נשמרים בין דוחות, מפתחות ומודלים."""
+    global _http_session
+    with _http_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+    return _http_session
+
+def set_report_threads(threads):
+    """כמה דוחות רצים במקביל בתהליך הזה — לפני הקריאה הראשונה לספק (ה-pools נבנים פעם אחת)."""
+    global HTTP_POOL_MAXSIZE
+    HTTP_POOL_MAXSIZE = max(1, int(threads)) * AI_PROVIDERS_PER_REPORT
+
+def get_http_pool_stats():
+    """כמה בקשות נשלחו מול כמה חיבורים נפתחו — ההפרש הוא חיבורים שמוחזרו (keep-alive)."""
+    stats = {'requests': 0, 'connections': 0, 'reused': 0, 'hosts': 0}
+    if _http_session is None:
+        return stats
+    try:
+        adapter = _http_session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['hosts'] += 1
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+    except Exception:
+        pass
+    stats['reused'] = max(0, stats['requests'] - stats['connections'])
+    return stats
+
+# --- Cache דוחות: מבחן חוזר עם אותם ציונים לא משלם שוב על שני דוחות ---
+PROMPT_VERSION = 2  # להעלות בכל שינוי בנוסח ה-prompts — מבטל את הדוחות השמורים
+
+_report_cache = None
+_report_cache_attempted = False
+_report_cache_lock = threading.Lock()
+
+def _get_report_cache():
+    """ה-cache המקומי, או None אם אי אפשר לפתוח אותו (אז פשוט בלי cache)."""
+    global _report_cache, _report_cache_attempted
+    with _report_cache_lock:
+        if not _report_cache_attempted:
+            _report_cache_attempted = True
+            try:
+                _report_cache = ReportCache()
+            except Exception:
+                _report_cache = None
+    return _report_cache
+
+def get_report_cache_stats():
+    cache = _get_report_cache()
+    if cache is None:
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0}
+    try:
+        return cache.stats()
+    except Exception:
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'entries': 0}
+
+def _is_report_ok(text):
+    """הודעות שגיאה (❌ / ⚠️) לא נשמרות ב-cache."""
+    return bool(text) and not str(text).lstrip().startswith(("❌", "⚠️"))
+
+# --- Cache: המודל של Claude שעובד לכל מפתח (במקום לנסות את כל הרשימה בכל דוח) ---
+CLAUDE_MODELS = [
+    "claude-opus-4-6",
+    "claude-sonnet-4-20250514",
+    "claude-3-5-sonnet-20241022",
+    "claude-3-5-sonnet-latest"
+]
+CLAUDE_MODEL_TTL_SECONDS = 24 * 3600
+
+_claude_models = {}  # key id -> {'model', 'resolved_at', 'probes'}
+_claude_models_lock = threading.Lock()
+
+def _key_id(api_key):
+    """מזהה קצר למפתח — לתצוגה ולאינדקס, בלי לחשוף את המפתח."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+def _cached_claude_model(api_key):
+    with _claude_models_lock:
+        entry = _claude_models.get(_key_id(api_key))
+        if entry and entry['model'] and time.time() - entry['resolved_at'] < CLAUDE_MODEL_TTL_SECONDS:
+            return entry['model']
+    return None
+
+def _claude_model_entry(api_key):
+    return _claude_models.setdefault(_key_id(api_key), {'model': None, 'resolved_at': 0.0, 'probes': 0})
+
+def _record_claude_model(api_key, model):
+    """המודל שעבד למפתח — נשמר עד CLAUDE_MODEL_TTL_SECONDS."""
+    with _claude_models_lock:
+        entry = _claude_model_entry(api_key)
+        entry['model'] = model
+        entry['resolved_at'] = time.time()
+
+def _record_claude_404(api_key, model):
+    """ניסיון שנכשל ב-404. אם זה המודל השמור — הוא נשכח, והמודל נבחר מחדש."""
+    with _claude_models_lock:
+        entry = _claude_model_entry(api_key)
+        entry['probes'] += 1
+        if entry['model'] == model:
+            entry['model'] = None
+
+def get_claude_model_resolution():
+    """לאבחון: לכל מפתח — איזה מודל נבחר, לפני כמה זמן, וכמה ניסיונות 404 עלה."""
+    now = time.time()
+    with _claude_models_lock:
+        return [{
+            'key': key_id,
+            'model': entry['model'] or '—',
+            'age_minutes': round((now - entry['resolved_at']) / 60, 1) if entry['resolved_at'] else None,
+            'expires_in_minutes': round(max(0.0, CLAUDE_MODEL_TTL_SECONDS - (now - entry['resolved_at'])) / 60, 1)
+                                  if entry['model'] else None,
+            'probes_404': entry['probes'],
+        } for key_id, entry in _claude_models.items()]
+
+# --- ניתוב בין מפתחות Gemini: המפתח הבריא ביותר קודם, תור כשכולם עמוסים ---
+GEMINI_QUEUE_TIMEOUT = 60.0  # כמה זמן בקשה ממתינה למפתח פנוי לפני שמוותרים
+
+_gemini_routers = {}
+_gemini_routers_lock = threading.Lock()
+
+def _get_gemini_router(keys):
+    """KeyRouter אחד לכל סט מפתחות — המצב (429, זמני תגובה) משותף לכל המבחנים בתהליך."""
+    with _gemini_routers_lock:
+        router = _gemini_routers.get(tuple(keys))
+        if router is None:
+            router = _gemini_routers[tuple(keys)] = KeyRouter(keys)
+        return router
+
+def get_gemini_key_health():
+    """
+    מצב המפתחות (state/tokens/latency/recent_429) של כל סט מפתחות שנוצר בתהליך —
+    key = מספר המפתח בסט + מזהה קצר של הסט, בלי המפתחות עצמם.
+    """
+    with _gemini_routers_lock:
+        routers = list(_gemini_routers.items())
+    rows = []
+    for keys, router in routers:
+        key_set = _key_id("\n".join(keys))
+        for i, snap in enumerate(router.snapshot(), 1):
+            rows.append(dict(snap, key=f"#{i} ({key_set})", key_set=key_set))
+    return rows
+
+def _retry_after(res):
+    try:
+        return float(res.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
 # --- פונקציות עזר: חילוץ נתונים מוגן מקריסות ---
 def _extract_float(val):
     try:
@@ -75,8 +263,8 @@ def _parse_to_simple_dict(data):
 @st.cache_resource
 def _cached_model_discovery(api_key):
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models?key={api_key}"
-        res = requests.get(url, timeout=10)
+        url = f"{GEMINI_BASE_URL}/v1beta/models?key={api_key}"
+        res = _http().get(url, timeout=DISCOVERY_TIMEOUT)
         if res.status_code == 200:
             models = [m['name'] for m in res.json().get('models', []) if 'generateContent' in m.get('supportedGenerationMethods', [])]
             for m in models:
@@ -86,81 +274,509 @@ def _cached_model_discovery(api_key):
         pass
     return "models/gemini-1.5-flash"
 
+# --- ספירת tokens: מה שה-API דיווח (usage) לכל דוח, ולסטטיסטיקה באדמין ---
+TOKEN_LEDGER_SIZE = 256   # כמה דוחות אחרונים זוכרים (לפי hash של הטקסט) — למד ה-tokens במסך הדוח
+
+_token_ledger = OrderedDict()
+_token_totals = {}
+_token_lock = threading.Lock()
+
+def _text_id(text):
+    return hashlib.sha256(str(text).encode('utf-8')).hexdigest()[:16]
+
+def _record_tokens(provider, prompt, text, usage):
+    """רושם קלט/פלט של קריאה — מה-usage של ה-API, ואם לא הגיע — הערכה."""
+    if not _is_report_ok(text):
+        return
+    entry = {
+        'provider': provider,
+        'prompt_tokens': usage.get('prompt') or estimate_tokens(prompt),
+        'output_tokens': usage.get('output') or estimate_tokens(text),
+        'exact': bool(usage.get('prompt')),
+    }
+    with _token_lock:
+        _token_ledger[_text_id(text)] = entry
+        _token_ledger.move_to_end(_text_id(text))
+        while len(_token_ledger) > TOKEN_LEDGER_SIZE:
+            _token_ledger.popitem(last=False)
+        t = _token_totals.setdefault(provider, {'calls': 0, 'prompt_tokens': 0, 'output_tokens': 0,
+                                                'max_prompt_tokens': 0, 'exact': 0})
+        t['calls'] += 1
+        t['prompt_tokens'] += entry['prompt_tokens']
+        t['output_tokens'] += entry['output_tokens']
+        t['max_prompt_tokens'] = max(t['max_prompt_tokens'], entry['prompt_tokens'])
+        t['exact'] += entry['exact']
+
+def get_report_tokens(text):
+    """{'prompt_tokens', 'output_tokens', 'exact'} של הדוח, או None אם הוא לא נוצר בתהליך הזה."""
+    with _token_lock:
+        entry = _token_ledger.get(_text_id(text))
+    return dict(entry) if entry else None
+
+def get_prompt_token_stats():
+    """ממוצעי tokens לכל ספק (לאדמין) — כולל התקציב של ה-prompt."""
+    with _token_lock:
+        totals = {p: dict(t) for p, t in _token_totals.items()}
+    return [{
+        'provider': provider,
+        'calls': t['calls'],
+        'avg_prompt_tokens': round(t['prompt_tokens'] / t['calls']),
+        'max_prompt_tokens': t['max_prompt_tokens'],
+        'budget': PROMPT_TOKEN_BUDGETS.get(provider),
+        'avg_output_tokens': round(t['output_tokens'] / t['calls']),
+        'exact_pct': round(100.0 * t['exact'] / t['calls'], 1),
+    } for provider, t in sorted(totals.items()) if t['calls']]
+
+# --- Streaming (SSE): הטקסט מגיע בחלקים, on_delta מקבל את הטקסט המצטבר ---
+class _SSEParser:
+    """מפרק SSE שורה אחר שורה — משותף ל-requests (sync) ול-httpx (async)."""
+
+    def __init__(self):
+        self.event, self.data = None, []
+
+    def feed(self, line):
+        """מחזיר (event, data) כשאירוע הושלם (שורה ריקה), אחרת None. data מפוענח כ-JSON."""
+        if not line:
+            return self.flush()
+        if line.startswith(':'):
+            return None
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            self.event = value
+        elif field == 'data':
+            self.data.append(value)
+        return None
+
+    def flush(self):
+        event, data = self.event, self.data
+        self.event, self.data = None, []
+        return (event, json.loads("\n".join(data))) if data else None
+
+def _iter_sse(res):
+    res.encoding = 'utf-8'  # text/event-stream בלי charset — requests מניח latin-1
+    parser = _SSEParser()
+    for line in res.iter_lines(decode_unicode=True):
+        item = parser.feed(line)
+        if item:
+            yield item
+    item = parser.flush()
+    if item:
+        yield item
+
+async def _aiter_sse(res):
+    parser = _SSEParser()
+    async for line in res.aiter_lines():
+        item = parser.feed(line)
+        if item:
+            yield item
+    item = parser.flush()
+    if item:
+        yield item
+
+def _gemini_chunk_text(chunk):
+    return "".join(part.get('text', '')
+                   for cand in chunk.get('candidates', [])[:1]
+                   for part in cand.get('content', {}).get('parts', []))
+
+def _gemini_usage(data, usage):
+    meta = data.get('usageMetadata') or {}
+    if usage is not None and meta:
+        usage['prompt'] = meta.get('promptTokenCount') or usage.get('prompt')
+        usage['output'] = meta.get('candidatesTokenCount') or usage.get('output')
+
+def _claude_usage(data, usage):
+    """message_start מביא את ה-input, message_delta את ה-output המצטבר; בלי stream — usage בגוף."""
+    if usage is None:
+        return
+    counts = data.get('usage') or (data.get('message') or {}).get('usage') or {}
+    if counts.get('input_tokens'):
+        usage['prompt'] = counts['input_tokens']
+    if counts.get('output_tokens'):
+        usage['output'] = counts['output_tokens']
+
+def _claude_event_text(event, data):
+    """הטקסט שאירוע של Claude מוסיף ('' לאירועי מעטפת). אירוע error — exception."""
+    kind = data.get('type', event)
+    if kind == 'content_block_delta' and data.get('delta', {}).get('type') == 'text_delta':
+        return data['delta'].get('text', '')
+    if kind == 'error':
+        raise RuntimeError(data.get('error', {}).get('message', str(data)))
+    return ''
+
+def _gemini_text(data, usage):
+    _gemini_usage(data, usage)
+    return data['candidates'][0]['content']['parts'][0]['text']
+
+def _claude_text(data, usage):
+    _claude_usage(data, usage)
+    return data['content'][0]['text']
+
+def _gemini_piece(event, data, usage):
+    _gemini_usage(data, usage)
+    return _gemini_chunk_text(data)
+
+def _claude_piece(event, data, usage):
+    _claude_usage(data, usage)
+    return _claude_event_text(event, data)
+
+class _Request:
+    """
+    בקשה אחת לספק: מה שולחים ואיך קוראים תשובת 200 (JSON או stream של SSE).
+    ה-transport — requests או httpx — רק שולח ומעביר את האירועים ל-feed.
+    """
+
+    def __init__(self, url, body, timeout, headers=None, on_delta=None, usage=None,
+                 text_of=None, piece_of=None):
+        self.url, self.body, self.timeout, self.headers = url, body, timeout, headers
+        self.stream = bool(on_delta)
+        self.on_delta, self.usage = on_delta, usage
+        self.text_of, self.piece_of = text_of, piece_of
+        self.text = ""
+
+    def parse(self, data):
+        """תשובה בלי stream — usage והטקסט מהגוף."""
+        return self.text_of(data, self.usage)
+
+    def feed(self, event, data):
+        piece = self.piece_of(event, data, self.usage)
+        if piece:
+            self.text += piece
+            self.on_delta(self.text)
+
+    def streamed(self):
+        if not self.text:
+            raise ValueError("תגובת stream ריקה")
+        return self.text
+
+class _Reply:
+    """תשובת הספק אחרי ה-transport: status, הטקסט (או גוף השגיאה) ו-Retry-After."""
+
+    def __init__(self, status, text, retry_after=None):
+        self.status, self.text, self.retry_after = status, text, retry_after
+
+def _send(request):
+    """transport רגיל (requests) — חוסם את ה-thread עד סוף התשובה."""
+    res = _http().post(request.url, headers=request.headers, json=request.body,
+                       timeout=request.timeout, stream=request.stream)
+    try:
+        if res.status_code != 200:
+            return _Reply(res.status_code, res.text, _retry_after(res))
+        if request.stream:
+            for event, data in _iter_sse(res):
+                request.feed(event, data)
+            return _Reply(200, request.streamed())
+        return _Reply(200, request.parse(res.json()))
+    finally:
+        res.close()
+
+async def _asend(request):
+    """transport async (httpx על ה-event loop של ai_async)."""
+    timeout = ai_async.httpx.Timeout(request.timeout[1], connect=request.timeout[0])
+    async with ai_async.async_client().stream("POST", request.url, headers=request.headers,
+                                              json=request.body, timeout=timeout) as res:
+        if res.status_code != 200:
+            await res.aread()
+            return _Reply(res.status_code, res.text, _retry_after(res))
+        if request.stream:
+            async for event, data in _aiter_sse(res):
+                request.feed(event, data)
+            return _Reply(200, request.streamed())
+        await res.aread()
+        return _Reply(200, request.parse(res.json()))
+
+def _acquire_key(router, tried, deadline):
+    return router.acquire(exclude=tried, timeout=max(0.0, deadline - time.monotonic()))
+
+async def _aacquire_key(router, tried, deadline):
+    while True:
+        key, wait = router.try_acquire(exclude=tried)
+        if key is not None or wait is None or time.monotonic() + wait > deadline:
+            return key
+        await asyncio.sleep(wait)
+
+def _run_flow(flow):
+    """
+    מריץ flow של ספק (ראו HEXACO_Expert_System._gemini_flow) עם transport חוסם.
+    כל צעד: ('acquire', (router, tried, deadline)) / ('call', (fn, *args)) / ('send', _Request).
+    """
+    reply, error = None, None
+    while True:
+        try:
+            kind, arg = flow.throw(error) if error else flow.send(reply)
+        except StopIteration as done:
+            return done.value
+        reply, error = None, None
+        try:
+            if kind == 'acquire':
+                reply = _acquire_key(*arg)
+            elif kind == 'call':
+                reply = arg[0](*arg[1:])
+            else:
+                reply = _send(arg)
+        except Exception as e:
+            error = e
+
+async def _arun_flow(flow):
+    """כמו _run_flow — על ה-event loop: המתנה למפתח ב-sleep, קריאה חוסמת ב-thread, httpx."""
+    reply, error = None, None
+    while True:
+        try:
+            kind, arg = flow.throw(error) if error else flow.send(reply)
+        except StopIteration as done:
+            return done.value
+        reply, error = None, None
+        try:
+            if kind == 'acquire':
+                reply = await _aacquire_key(*arg)
+            elif kind == 'call':
+                reply = await asyncio.to_thread(*arg)
+            else:
+                reply = await _asend(arg)
+        except Exception as e:
+            error = e
+
+# --- הרצה מקבילית: Gemini ו-Claude יחד ---
+_provider_pool = None
+_provider_pool_lock = threading.Lock()
+
+def _get_provider_pool():
+    """pool משותף לקריאות לספקים — נפרד מה-executor של האפליקציה."""
+    global _provider_pool
+    with _provider_pool_lock:
+        if _provider_pool is None:
+            _provider_pool = ThreadPoolExecutor(max_workers=HTTP_POOL_MAXSIZE, thread_name_prefix="ai_provider")
+    return _provider_pool
+
+def _provider_callbacks(on_result, on_delta):
+    """עוטף את ה-callbacks כך ששגיאה בהם לא מפילה את הקריאה לספק."""
+    def finish(provider, text):
+        if on_result:
+            try:
+                on_result(provider, text)
+            except Exception:
+                pass
+
+    def delta_for(provider):
+        if on_delta is None:
+            return None
+        def _delta(text):
+            try:
+                on_delta(provider, text)
+            except Exception:
+                pass
+        return _delta
+
+    return finish, delta_for
+
+def _cached_reports(cache_key):
+    """{provider: text} לדוחות שכבר שמורים ב-cache למפתח הזה."""
+    cache = _get_report_cache() if cache_key else None
+    out = {}
+    if cache is not None:
+        for provider in ('gemini', 'claude'):
+            try:
+                cached = cache.get(f"{cache_key}:{provider}")
+            except Exception:
+                cached = None
+            if cached:
+                out[provider] = cached
+    return out
+
+def _store_report(cache_key, provider, text):
+    cache = _get_report_cache() if cache_key else None
+    if cache is not None and _is_report_ok(text):
+        try:
+            cache.put(f"{cache_key}:{provider}", text)
+        except Exception:
+            pass
+
+def _start_providers(on_result, on_delta, cache_key):
+    """(out, finish, delta_for) — דוחות שכבר ב-cache נכנסים ל-out ומדווחים מיד."""
+    finish, delta_for = _provider_callbacks(on_result, on_delta)
+    out = _cached_reports(cache_key)
+    for provider, text in out.items():
+        finish(provider, text)
+    return out, finish, delta_for
+
+def _provider_done(out, finish, provider, result, prompt, usage, cache_key):
+    """ספק סיים: result() מחזיר את הטקסט או זורק. ספירת tokens, cache ו-on_result."""
+    try:
+        out[provider] = result()
+    except Exception as e:
+        out[provider] = f"❌ שגיאה טכנית ב-{provider}: {str(e)}"
+    _record_tokens(provider, prompt, out[provider], usage)
+    _store_report(cache_key, provider, out[provider])
+    finish(provider, out[provider])
+
+def _call_providers(expert, gemini_prompt, claude_prompt, on_result=None, on_delta=None,
+                    cache_key=None):
+    """
+    מריץ את Gemini ואת Claude במקביל — ההמתנה היא לאיטי מביניהם, לא לסכום.
+    on_result(provider, text) נקרא לכל ספק ('gemini' / 'claude') ברגע שהוא מסיים.
+    on_delta(provider, text_so_far) — אם ניתן, התשובות נקראות ב-streaming.
+    cache_key — דוח שכבר שמור לאותו מפתח חוזר מיד, בלי קריאה לספק.
+    """
+    out, finish, delta_for = _start_providers(on_result, on_delta, cache_key)
+    prompts = {'gemini': gemini_prompt, 'claude': claude_prompt}
+    usage = {provider: {} for provider in prompts}
+    pool = _get_provider_pool()
+    futures = {pool.submit(_run_flow, expert._provider_flow(provider, prompt, delta_for(provider),
+                                                            usage[provider])): provider
+               for provider, prompt in prompts.items() if provider not in out}
+    for future in as_completed(futures):
+        provider = futures[future]
+        _provider_done(out, finish, provider, future.result, prompts[provider], usage[provider], cache_key)
+    return out['gemini'], out['claude']
+
+async def _call_providers_async(expert, gemini_prompt, claude_prompt, on_result=None, on_delta=None,
+                                cache_key=None):
+    """כמו _call_providers — אבל שני הספקים רצים כ-tasks על ה-event loop של ai_async."""
+    out, finish, delta_for = _start_providers(on_result, on_delta, cache_key)
+    prompts = {'gemini': gemini_prompt, 'claude': claude_prompt}
+    usage = {provider: {} for provider in prompts}
+    tasks = {asyncio.ensure_future(_arun_flow(expert._provider_flow(provider, prompt, delta_for(provider),
+                                                                    usage[provider]))): provider
+             for provider, prompt in prompts.items() if provider not in out}
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            provider = tasks[task]
+            _provider_done(out, finish, provider, task.result, prompts[provider], usage[provider], cache_key)
+    return out['gemini'], out['claude']
+
+# --- בניית בקשות — משותף לגרסה הרגילה ול-async ---
+def _gemini_url(model, key, stream):
+    if stream:
+        return f"{GEMINI_BASE_URL}/v1beta/{model}:streamGenerateContent?alt=sse&key={key}"
+    return f"{GEMINI_BASE_URL}/v1beta/{model}:generateContent?key={key}"
+
+def _gemini_body(prompt):
+    return {"contents": [{"parts": [{"text": prompt}]}]}
+
+def _claude_models_order(api_key):
+    """(המודל השמור, רשימת הניסיון) — המודל שכבר עבד קודם; שאר הרשימה רק אם הוסר (404)."""
+    cached_model = _cached_claude_model(api_key)
+    models = [cached_model] if cached_model else []
+    return cached_model, models + [m for m in CLAUDE_MODELS if m != cached_model]
+
+def _claude_headers(api_key):
+    return {
+        "x-api-key": api_key,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+
+def _claude_payload(model_name, prompt, stream):
+    payload = {
+        "model": model_name,
+        "max_tokens": 4096,
+        "messages": [{"role": "user", "content": prompt}]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
 class HEXACO_Expert_System:
     def __init__(self):
         self.gemini_keys = [
-            st.secrets.get("GEMINI_KEY_1", "").strip(),
-            st.secrets.get("GEMINI_KEY_2", "").strip(),
-            st.secrets.get("GEMINI_KEY_3", "").strip()
+            str(get_secret("GEMINI_KEY_1", "")).strip(),
+            str(get_secret("GEMINI_KEY_2", "")).strip(),
+            str(get_secret("GEMINI_KEY_3", "")).strip()
         ]
         self.gemini_keys = [k for k in self.gemini_keys if k]
-        self.claude_key = st.secrets.get("CLAUDE_KEY") or st.secrets.get("ANTHROPIC_API_KEY", "").strip()
+        self.claude_key = str(get_secret("CLAUDE_KEY") or get_secret("ANTHROPIC_API_KEY", "")).strip()
 
     def _get_model_discovery(self, api_key):
         return _cached_model_discovery(api_key)
 
-    def _call_gemini_safe(self, prompt):
+    # --- הלוגיקה של כל ספק — generator בלי transport; _run_flow / _arun_flow מריצים אותו ---
+    def _provider_flow(self, provider, prompt, on_delta=None, usage=None):
+        flow = self._gemini_flow if provider == 'gemini' else self._claude_flow
+        return flow(prompt, on_delta, usage)
+
+    def _gemini_flow(self, prompt, on_delta=None, usage=None):
         if not self.gemini_keys:
             return "❌ מפתחות Gemini חסרים בהגדרות ה-Secrets."
-        
+
         errors = []
-        for i, key in enumerate(self.gemini_keys, 1):
-            model = self._get_model_discovery(key)
+        router = _get_gemini_router(self.gemini_keys)
+        tried = set()
+        deadline = time.monotonic() + GEMINI_QUEUE_TIMEOUT
+        while len(tried) < len(self.gemini_keys):
+            # המפתח הבריא ביותר שעוד לא ניסינו — אם כולם עמוסים, ממתינים בתור
+            key = yield 'acquire', (router, tried, deadline)
+            if key is None:
+                errors.append("⏳ כל המפתחות עמוסים — לא התפנה מפתח בזמן")
+                break
+            tried.add(key)
+            i = self.gemini_keys.index(key) + 1
+            model = yield 'call', (self._get_model_discovery, key)
+            started = time.monotonic()
             try:
-                url = f"https://generativelanguage.googleapis.com/v1beta/{model}:generateContent?key={key}"
-                # מוגדר כאן ל-120 שניות
-                res = requests.post(url, json={"contents": [{"parts": [{"text": prompt}]}]}, timeout=120)
-                
-                if res.status_code == 200:
-                    data = res.json()
-                    return data['candidates'][0]['content']['parts'][0]['text']
-                elif res.status_code == 429:
-                    errors.append(f"🔑 מפתח #{i}: חריגת מכסה/עומס (429)")
-                else:
-                    errors.append(f"🔑 מפתח #{i} נדחה על ידי גוגל (קוד {res.status_code}): {res.text}")
+                reply = yield 'send', _Request(_gemini_url(model, key, bool(on_delta)), _gemini_body(prompt),
+                                               GEMINI_TIMEOUT, on_delta=on_delta, usage=usage,
+                                               text_of=_gemini_text, piece_of=_gemini_piece)
             except Exception as e:
+                router.record_failure(key)
                 errors.append(f"🔑 מפתח #{i} כשל טכנית: {str(e)}")
-                
+                continue
+
+            if reply.status == 200:
+                router.record_success(key, time.monotonic() - started)
+                return reply.text
+            elif reply.status == 429:
+                router.record_rate_limited(key, reply.retry_after)
+                errors.append(f"🔑 מפתח #{i}: חריגת מכסה/עומס (429)")
+            else:
+                router.record_failure(key)
+                errors.append(f"🔑 מפתח #{i} נדחה על ידי גוגל (קוד {reply.status}): {reply.text}")
+
         return "❌ שגיאת התחברות ל-Gemini. פירוט השגיאות מהשרת:\n\n" + "\n".join(errors)
 
-    def _call_claude(self, prompt):
+    def _claude_flow(self, prompt, on_delta=None, usage=None):
         if not self.claude_key:
             return "⚠️ מפתח Claude חסר בהגדרות ה-Secrets."
 
-        models_to_try = [
-            "claude-opus-4-6",               
-            "claude-sonnet-4-20250514",      
-            "claude-3-5-sonnet-20241022",    
-            "claude-3-5-sonnet-latest"       
-        ]
-
-        headers = {
-            "x-api-key": self.claude_key,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
+        cached_model, models_to_try = _claude_models_order(self.claude_key)
+        headers = _claude_headers(self.claude_key)
 
         for model_name in models_to_try:
             try:
-                payload = {
-                    "model": model_name,
-                    "max_tokens": 4096,
-                    "messages": [{"role": "user", "content": prompt}]
-                }
-                # מוגדר כאן ל-120 שניות כדי שקלוד לא יקרוס ויחתוך את הפעולה באמצע!
-                res = requests.post("https://api.anthropic.com/v1/messages", headers=headers, json=payload, timeout=120)
-
-                if res.status_code == 200:
-                    return res.json()['content'][0]['text']
-                elif res.status_code == 404:
-                    continue
-                else:
-                    return f"❌ השרת של קלוד סירב למודל {model_name}. (קוד {res.status_code}): {res.text}"
+                # read timeout של 120 שניות כדי שקלוד לא יקרוס ויחתוך את הפעולה באמצע!
+                reply = yield 'send', _Request(f"{CLAUDE_BASE_URL}/v1/messages",
+                                               _claude_payload(model_name, prompt, bool(on_delta)),
+                                               CLAUDE_TIMEOUT, headers=headers, on_delta=on_delta, usage=usage,
+                                               text_of=_claude_text, piece_of=_claude_piece)
             except Exception as e:
                 return f"❌ שגיאה טכנית בחיבור ל-Claude: {str(e)}"
 
+            if reply.status == 200:
+                if model_name != cached_model:
+                    _record_claude_model(self.claude_key, model_name)
+                return reply.text
+            elif reply.status == 404:
+                # המודל לא קיים / הוצא משימוש — אם הוא השמור, בוחרים מחדש
+                _record_claude_404(self.claude_key, model_name)
+                continue
+            else:
+                return f"❌ השרת של קלוד סירב למודל {model_name}. (קוד {reply.status}): {reply.text}"
+
         return "❌ שגיאת 404: אף אחד מהמודלים שניסינו לא זמין בחשבון ה-API שלך בקלוד."
 
+    def _call_gemini_safe(self, prompt, on_delta=None, usage=None):
+        return _run_flow(self._gemini_flow(prompt, on_delta, usage))
+
+    def _call_claude(self, prompt, on_delta=None, usage=None):
+        return _run_flow(self._claude_flow(prompt, on_delta, usage))
+
+    async def _call_gemini_async(self, prompt, on_delta=None, usage=None):
+        return await _arun_flow(self._gemini_flow(prompt, on_delta, usage))
+
+    async def _call_claude_async(self, prompt, on_delta=None, usage=None):
+        return await _arun_flow(self._claude_flow(prompt, on_delta, usage))
+
     def calculate_compatibility_score(self, results):
         clean_results = _parse_to_simple_dict(results)
         if not clean_results: return 0
@@ -172,36 +788,44 @@ class HEXACO_Expert_System:
             else: total += 70
         return int(total / max(1, len(clean_results)))
 
-    def generate_expert_reports(self, name, results, history=[]):
+    def _expert_prompts(self, name, results, history, test_type='hexaco'):
+        """(gemini_prompt, claude_prompt, cache_key) לדוח אישיות (hexaco/quick/haifa) — כל אחד בתקציב של הספק."""
         clean_results = _parse_to_simple_dict(results)
         gaps = []
         for t, s in clean_results.items():
             gaps.append(f"{TRAIT_DICT.get(t, t)}: {_extract_float(s):.2f} (יעד: {IDEAL_DOCTOR.get(t, 'N/A')})")
-        gaps_str = "\n".join(gaps)
-        
-        trend_text = "אין היסטוריה קודמת"
-        if history:
-            trend_text = "\n".join([f"מבחן מ-{h.get('test_date', 'unknown')}: {h.get('results', '{}')}" for h in history[-3:]])
-
-        gemini_prompt = f"""
-        אתה פסיכולוג ארגוני בכיר במיוני רפואה (מס"ר).
-        מועמד: {name}
-        תוצאות נוכחיות: {json.dumps(clean_results)}
-        ניתוח פערים: {gaps_str}
-        היסטוריית מגמות: {trend_text}
-        כתוב דוח מפורט (לפחות 1200 מילים) בעברית.
-        """
-
-        claude_prompt = f"""
-        אתה ד"ר רחל גולדשטיין, פסיכולוגית קלינית בכירה המומחית למיון מועמדים לרפואה.
-        מועמד: {name}
-        תוצאות: {json.dumps(clean_results)}
-        נתח את הסיכונים הקליניים והתאמת המועמד למצבי לחץ.
-        כתוב דוח מעמיק של 1500 מילים בעברית.
-        © זכויות יוצרים לניתאי מלכה.
-        """
-
-        return self._call_gemini_safe(gemini_prompt), self._call_claude(claude_prompt)
+
+        gemini_prompt, _, _ = (PromptBuilder(PROMPT_TOKEN_BUDGETS['gemini'])
+            .add('אתה פסיכולוג ארגוני בכיר במיוני רפואה (מס"ר).')
+            .add(f"מועמד: {name}")
+            .add(f"תוצאות נוכחיות: {json.dumps(clean_results)}")
+            .add_lines("ניתוח פערים", gaps)
+            .add_variants(history_trend_variants("היסטוריית מגמות", clean_results, history,
+                                                 _parse_to_simple_dict, TRAIT_DICT))
+            .add("כתוב דוח מפורט (לפחות 1200 מילים) בעברית.")
+            .build())
+
+        claude_prompt, _, _ = (PromptBuilder(PROMPT_TOKEN_BUDGETS['claude'])
+            .add('אתה ד"ר רחל גולדשטיין, פסיכולוגית קלינית בכירה המומחית למיון מועמדים לרפואה.')
+            .add(f"מועמד: {name}")
+            .add(f"תוצאות: {json.dumps(clean_results)}")
+            .add("נתח את הסיכונים הקליניים והתאמת המועמד למצבי לחץ.")
+            .add("כתוב דוח מעמיק של 1500 מילים בעברית.")
+            .add("© זכויות יוצרים לניתאי מלכה.")
+            .build())
+
+        cache_key = report_cache_key(test_type, clean_results, (), PROMPT_VERSION, extra=name,
+                                     history=history_scores(history, _parse_to_simple_dict))
+        return gemini_prompt, claude_prompt, cache_key
+
+    def generate_expert_reports(self, name, results, history=[], on_result=None, on_delta=None, test_type='hexaco'):
+        gemini_prompt, claude_prompt, cache_key = self._expert_prompts(name, results, history, test_type)
+        return _call_providers(self, gemini_prompt, claude_prompt, on_result, on_delta, cache_key)
+
+    async def generate_expert_reports_async(self, name, results, history=[], on_result=None, on_delta=None,
+                                            test_type='hexaco'):
+        gemini_prompt, claude_prompt, cache_key = self._expert_prompts(name, results, history, test_type)
+        return await _call_providers_async(self, gemini_prompt, claude_prompt, on_result, on_delta, cache_key)
 
     def create_radar_chart(self, results):
         clean_results = _parse_to_simple_dict(results)
@@ -229,31 +853,91 @@ class HEXACO_Expert_System:
         return fig
 
     def create_token_gauge(self, text):
-        tokens = int(len(str(text).split()) * 1.5) if text else 0
-        fig = go.Figure(go.Indicator(mode="gauge+number", value=tokens, title={'text': "Tokens"}, gauge={'axis': {'range': [0, 8000]}, 'bar': {'color': "#2ECC71"}}))
+        # הספירה שה-API דיווח לדוח הזה (קלט + פלט); דוח מ-cache / מתהליך אחר — הערכה לפי אורך
+        counts = get_report_tokens(text) if text else None
+        if counts:
+            tokens = counts['prompt_tokens'] + counts['output_tokens']
+            title = f"Tokens — קלט {counts['prompt_tokens']:,} + פלט {counts['output_tokens']:,}"
+            if not counts['exact']:
+                title += " (הערכה)"
+        else:
+            tokens = estimate_tokens(text)
+            title = "Tokens (הערכה)"
+        fig = go.Figure(go.Indicator(mode="gauge+number", value=tokens, title={'text': title}, gauge={'axis': {'range': [0, max(8000, int(tokens * 1.2))]}, 'bar': {'color': "#2ECC71"}}))
         fig.update_layout(height=250)
         return fig
 
 # --- פונקציות גלובליות ---
-def get_multi_ai_analysis(name, results, history=[]): return HEXACO_Expert_System().generate_expert_reports(name, results, history)
+def get_multi_ai_analysis(name, results, history=[], on_result=None, on_delta=None, test_type='hexaco'): return HEXACO_Expert_System().generate_expert_reports(name, results, history, on_result, on_delta, test_type)
 def get_radar_chart(results): return HEXACO_Expert_System().create_radar_chart(results)
 def get_comparison_chart(results): return HEXACO_Expert_System().create_comparison_bar_chart(results)
 def create_token_gauge(text): return HEXACO_Expert_System().create_token_gauge(text)
 
-def get_integrity_ai_analysis(user_name, reliability_score, contradictions, int_scores, history):
-    expert = HEXACO_Expert_System()
+def _contradiction_lines(contradictions):
+    return [f"- {c.get('message', str(c))}" if isinstance(c, dict) else f"- {c}" for c in (contradictions or [])]
+
+def _integrity_prompt(user_name, reliability_score, contradictions, int_scores, history):
+    """(gemini_prompt, claude_prompt, cache_key) — אותו נוסח, כל אחד בתקציב של הספק שלו."""
     clean_scores = _parse_to_simple_dict(int_scores)
-    rel_info = f"מדד אמינות: {reliability_score}%\n"
-    if contradictions:
-        rel_info += "סתירות שזוהו:\n" + "\n".join([f"- {c.get('message', str(c))}" for c in contradictions])
-    prompt = f"אתה פסיכולוג מנתח מבדק אמינות. מועמד: {user_name}\nתוצאות: {json.dumps(clean_scores)}\n{rel_info}\nהיסטוריה: {history}\nכתוב דוח מפורט בעברית."
-    return expert._call_gemini_safe(prompt), expert._call_claude(prompt)
-
-def get_combined_ai_analysis(user_name, trait_scores, reliability_score, contradictions, history):
-    expert = HEXACO_Expert_System()
+
+    def build(provider):
+        return (PromptBuilder(PROMPT_TOKEN_BUDGETS[provider])
+            .add(f"אתה פסיכולוג מנתח מבדק אמינות. מועמד: {user_name}")
+            .add(f"תוצאות: {json.dumps(clean_scores)}")
+            .add(f"מדד אמינות: {reliability_score}%")
+            .add_lines("סתירות שזוהו", _contradiction_lines(contradictions), min_lines=3)
+            .add_variants(history_trend_variants("היסטוריה", clean_scores, history, _parse_to_simple_dict))
+            .add("כתוב דוח מפורט בעברית.")
+            .build()[0])
+
+    cache_key = report_cache_key('integrity', clean_scores, contradictions, PROMPT_VERSION,
+                                 extra=[user_name, round(_extract_float(reliability_score))],
+                                 history=history_scores(history, _parse_to_simple_dict))
+    return build('gemini'), build('claude'), cache_key
+
+def get_integrity_ai_analysis(user_name, reliability_score, contradictions, int_scores, history, on_result=None, on_delta=None):
+    gemini_prompt, claude_prompt, cache_key = _integrity_prompt(user_name, reliability_score, contradictions,
+                                                                int_scores, history)
+    return _call_providers(HEXACO_Expert_System(), gemini_prompt, claude_prompt, on_result, on_delta, cache_key)
+
+def _combined_prompt(user_name, trait_scores, reliability_score, contradictions, history):
+    """(gemini_prompt, claude_prompt, cache_key) — כמו _integrity_prompt."""
     clean_scores = _parse_to_simple_dict(trait_scores)
-    rel_info = f"מדד אמינות שאלון: {reliability_score}%\n"
-    if contradictions:
-        rel_info += "אזהרת עקביות - נמצאו סתירות:\n" + "\n".join([f"- {c.get('message', str(c))}" for c in contradictions])
-    prompt = f"אתה פסיכולוג בכיר המנתח מבדק משולב: אישיות (HEXACO) ואמינות. מועמד: {user_name}\nציוני אישיות: {json.dumps(clean_scores)}\n{rel_info}\nכתוב דוח מעמיק בעברית."
-    return expert._call_gemini_safe(prompt), expert._call_claude(prompt)
+
+    def build(provider):
+        return (PromptBuilder(PROMPT_TOKEN_BUDGETS[provider])
+            .add(f"אתה פסיכולוג בכיר המנתח מבדק משולב: אישיות (HEXACO) ואמינות. מועמד: {user_name}")
+            .add(f"ציוני אישיות: {json.dumps(clean_scores)}")
+            .add(f"מדד אמינות שאלון: {reliability_score}%")
+            .add_lines("אזהרת עקביות - נמצאו סתירות", _contradiction_lines(contradictions), min_lines=3)
+            .add("כתוב דוח מעמיק בעברית.")
+            .build()[0])
+
+    cache_key = report_cache_key('combined', clean_scores, contradictions, PROMPT_VERSION,
+                                 extra=[user_name, round(_extract_float(reliability_score))])
+    return build('gemini'), build('claude'), cache_key
+
+def get_combined_ai_analysis(user_name, trait_scores, reliability_score, contradictions, history, on_result=None, on_delta=None):
+    gemini_prompt, claude_prompt, cache_key = _combined_prompt(user_name, trait_scores, reliability_score,
+                                                               contradictions, history)
+    return _call_providers(HEXACO_Expert_System(), gemini_prompt, claude_prompt, on_result, on_delta, cache_key)
+
+# --- גרסאות async — רצות על ה-event loop של ai_async (כשיש httpx) ---
+def async_ai_available():
+    return ai_async.get_async_worker() is not None
+
+async def get_multi_ai_analysis_async(name, results, history=[], on_result=None, on_delta=None, test_type='hexaco'):
+    return await HEXACO_Expert_System().generate_expert_reports_async(name, results, history, on_result, on_delta,
+                                                                      test_type)
+
+async def get_integrity_ai_analysis_async(user_name, reliability_score, contradictions, int_scores, history, on_result=None, on_delta=None):
+    gemini_prompt, claude_prompt, cache_key = _integrity_prompt(user_name, reliability_score, contradictions,
+                                                                int_scores, history)
+    return await _call_providers_async(HEXACO_Expert_System(), gemini_prompt, claude_prompt, on_result, on_delta,
+                                       cache_key)
+
+async def get_combined_ai_analysis_async(user_name, trait_scores, reliability_score, contradictions, history, on_result=None, on_delta=None):
+    gemini_prompt, claude_prompt, cache_key = _combined_prompt(user_name, trait_scores, reliability_score,
+                                                               contradictions, history)
+    return await _call_providers_async(HEXACO_Expert_System(), gemini_prompt, claude_prompt, on_result, on_delta,
+                                       cache_key)
@@ -7,7 +7,10 @@ Mednitai — Integrity Logic
 import pandas as pd
 import numpy as np
 import random
-import streamlit as st
+
+from scoring import (ResponseBatch, count_gap_pairs, effective_score,
+                     integrity_reliability_score, iter_gap_pairs, label_score_histograms,
+                     score_moments, std_above, std_below)
 
 INTEGRITY_CATEGORIES = {
     'theft', 'academic', 'termination', 'gambling', 'drugs',
@@ -22,129 +25,90 @@ POSITIVE_TRAITS = {'whistleblowing', 'feedback', 'teamwork', 'procedures'}  # ה
 META_CYCLE = ['polygraph', 'regret', 'honesty_meta']
 
 
-@st.cache_data
-def _load_integrity_csv():
-    try:
-        return pd.read_csv("data/integrity_questions.csv")
-    except Exception as e:
-        st.error(f"שגיאה בטעינת שאלות אמינות: {e}")
-        return pd.DataFrame()
-
-
-def get_integrity_questions(count=140):
+def get_integrity_questions(bank, count=140):
     """
-    Load and structure integrity questions.
+    Structure integrity questions from the catalog bank (question_catalog.QuestionBank).
     - Separate into regular / control / meta banks
     - Inject meta every 15 questions (polygraph -> regret -> honesty_meta)
     - Meta questions get is_stress_meta = 1 (int)
     - Control questions injected at random positions
     """
-    df = _load_integrity_csv()
-    if df.empty:
+    if bank is None or not len(bank):
         return []
 
     try:
-        # Determine category column
-        cat_col = None
-        for col in ['category', 'Category', 'trait']:
-            if col in df.columns:
-                cat_col = col
-                break
-        if not cat_col:
-            return df.head(count).to_dict('records')
+        if bank.group_column is None:
+            return bank.rows(range(min(count, len(bank))))
 
         # Determine control column
-        ctrl_col = None
+        control_mask = None
         for col in ['main_control', 'is_control', 'control']:
-            if col in df.columns:
-                ctrl_col = col
+            control_mask = bank.flag_mask(col)
+            if control_mask is not None:
                 break
 
         # Separate banks
-        meta_categories = set(META_CYCLE)
-        meta_df = df[df[cat_col].isin(meta_categories)]
-
-        if ctrl_col:
-            control_df = df[
-                (df[ctrl_col].astype(str).str.strip().str.lower().isin(['1', '1.0', 'true', 'yes']))
-                & (~df[cat_col].isin(meta_categories))
-            ]
-            regular_df = df[
-                (~df[cat_col].isin(meta_categories))
-                & (~df.index.isin(control_df.index))
-            ]
+        meta_mask = bank.group_mask(META_CYCLE)
+        if control_mask is not None:
+            control_mask = control_mask & ~meta_mask
+            regular_mask = ~meta_mask & ~control_mask
         else:
-            control_df = pd.DataFrame()
-            regular_df = df[~df[cat_col].isin(meta_categories)]
+            control_mask = np.zeros(len(bank), dtype=bool)
+            regular_mask = ~meta_mask
 
         # Sample regular questions
-        regular_needed = count - (count // 15) - min(10, len(control_df))
-        if len(regular_df) >= regular_needed:
-            regular_sample = regular_df.sample(n=regular_needed)
+        n_control = int(control_mask.sum())
+        regular_needed = count - (count // 15) - min(10, n_control)
+        if int(regular_mask.sum()) >= regular_needed:
+            regular_idx = bank.sample(regular_needed, regular_mask)
         else:
-            regular_sample = regular_df
+            regular_idx = bank.indices(regular_mask)
 
-        questions = regular_sample.to_dict('records')
+        questions = bank.rows(regular_idx, is_stress_meta=0)
 
         # Inject meta questions every 15
         meta_index = 0
-        meta_records = meta_df.to_dict('records') if not meta_df.empty else []
+        meta_idx = list(bank.indices(meta_mask))
         inject_positions = list(range(14, len(questions), 15))
 
         for pos in reversed(inject_positions):
-            if meta_records:
+            if meta_idx:
                 # Cycle through meta categories
                 target_cat = META_CYCLE[meta_index % len(META_CYCLE)]
-                candidates = [m for m in meta_records if m.get(cat_col) == target_cat]
-                if candidates:
-                    chosen = random.choice(candidates)
-                else:
-                    chosen = random.choice(meta_records)
-
-                chosen['is_stress_meta'] = 1  # int, not bool!
-                questions.insert(min(pos, len(questions)), chosen)
+                candidates = [i for i in meta_idx if bank.group_name(i) == target_cat]
+                chosen = random.choice(candidates) if candidates else random.choice(meta_idx)
+                questions.insert(min(pos, len(questions)), bank.row(chosen, is_stress_meta=1))  # int, not bool!
                 meta_index += 1
 
         # Inject control questions at random positions
-        if not control_df.empty:
-            control_sample = control_df.sample(n=min(10, len(control_df)))
-            for _, ctrl in control_sample.iterrows():
-                ctrl_dict = ctrl.to_dict()
-                pos = random.randint(0, len(questions))
-                questions.insert(pos, ctrl_dict)
-
-        # Ensure is_stress_meta exists on all
-        for q in questions:
-            if 'is_stress_meta' not in q:
-                q['is_stress_meta'] = 0
+        for i in bank.sample(10, control_mask):
+            pos = random.randint(0, len(questions))
+            questions.insert(pos, bank.row(i, is_stress_meta=0))
 
         return questions[:count]
 
     except Exception as e:
-        return df.head(count).to_dict('records')
+        return bank.rows(range(min(count, len(bank))))
 
 
 def calculate_integrity_score(answer, reverse):
     """Same as HEXACO calculate_score."""
-    try:
-        score = int(answer)
-        rev = str(reverse).strip().lower()
-        if rev in ['true', '1', '1.0', 'yes', 't', 'ת', 'אמת']:
-            score = 6 - score
-        return max(1, min(5, score))
-    except (ValueError, TypeError):
-        return 3
+    return effective_score(answer, reverse)
 
 
-def detect_contradictions(responses_df):
+def detect_contradictions(responses_df, count_only=False):
     """
     Part 1: Gap >= 3 in same category -> severity: high
     Part 2: Control questions with gap >= 2 -> severity: critical
     Part 3: SD > 0.8 in meta questions -> severity: high
+    זוגות נספרים מהיסטוגרמת ציונים (O(n)), לא בהשוואת כל זוג.
+    count_only=True — מחזיר רק {'critical': n, 'high': n}.
     """
+    counts = {'critical': 0, 'high': 0}
     contradictions = []
+    empty = counts if count_only else contradictions
     if responses_df is None or responses_df.empty:
-        return contradictions
+        return empty
 
     try:
         cat_col = None
@@ -153,42 +117,41 @@ def detect_contradictions(responses_df):
                 cat_col = col
                 break
         if not cat_col or 'score' not in responses_df.columns:
-            return contradictions
+            return empty
 
         # Part 1: Same category contradictions
-        for cat in responses_df[cat_col].unique():
-            cat_df = responses_df[responses_df[cat_col] == cat]
-            scores = cat_df['score'].values
-            questions = cat_df['question'].values if 'question' in cat_df.columns else [''] * len(scores)
-
-            for i in range(len(scores)):
-                for j in range(i + 1, len(scores)):
-                    if abs(scores[i] - scores[j]) >= 3:
-                        contradictions.append({
-                            'type': 'category_contradiction',
-                            'category': cat,
-                            'gap': abs(scores[i] - scores[j]),
-                            'severity': 'high',
-                            'message': f"סתירה בקטגוריית {cat}: פער {abs(scores[i] - scores[j]):.0f}"
-                        })
+        cats, values, hist = label_score_histograms(responses_df[cat_col], responses_df['score'])
+        if count_only:
+            counts['high'] += int(count_gap_pairs(values, hist, 3).sum())
+        else:
+            for c, cat in enumerate(cats):
+                for gap, n in iter_gap_pairs(values, hist[c], 3):
+                    contradictions.extend({
+                        'type': 'category_contradiction',
+                        'category': cat,
+                        'gap': gap,
+                        'severity': 'high',
+                        'message': f"סתירה בקטגוריית {cat}: פער {gap:.0f}"
+                    } for _ in range(n))
 
         # Part 2: Control questions (if identifiable)
         if 'main_control' in responses_df.columns or 'is_control' in responses_df.columns:
             ctrl_col = 'main_control' if 'main_control' in responses_df.columns else 'is_control'
-            ctrl_df = responses_df[
-                responses_df[ctrl_col].astype(str).str.strip().str.lower().isin(['1', '1.0', 'true'])
-            ]
-            if len(ctrl_df) > 1:
-                scores = ctrl_df['score'].values
-                for i in range(len(scores)):
-                    for j in range(i + 1, len(scores)):
-                        if abs(scores[i] - scores[j]) >= 2:
-                            contradictions.append({
-                                'type': 'control_contradiction',
-                                'gap': abs(scores[i] - scores[j]),
-                                'severity': 'critical',
-                                'message': f"סתירה בשאלות בקרה: פער {abs(scores[i] - scores[j]):.0f}"
-                            })
+            is_ctrl = responses_df[ctrl_col].astype(str).str.strip().str.lower().isin(['1', '1.0', 'true'])
+            if is_ctrl.sum() > 1:
+                # כל שאלות הבקרה = קבוצה אחת
+                _, values, hist = label_score_histograms(
+                    np.zeros(int(is_ctrl.sum()), dtype=np.int64), responses_df.loc[is_ctrl, 'score'])
+                if count_only:
+                    counts['critical'] += int(count_gap_pairs(values, hist, 2).sum())
+                else:
+                    for gap, n in iter_gap_pairs(values, hist[0], 2):
+                        contradictions.extend({
+                            'type': 'control_contradiction',
+                            'gap': gap,
+                            'severity': 'critical',
+                            'message': f"סתירה בשאלות בקרה: פער {gap:.0f}"
+                        } for _ in range(n))
 
         # Part 3: Meta SD
         is_meta_col = 'is_stress_meta'
@@ -197,7 +160,8 @@ def detect_contradictions(responses_df):
                 responses_df[is_meta_col].astype(str).str.strip().str.lower().isin(['1', '1.0', 'true'])
             ]
             if len(meta_df) > 1 and 'score' in meta_df.columns:
-                if meta_df['score'].std() > 0.8:
+                if std_above(*score_moments(meta_df['score']), 0.8):
+                    counts['high'] += 1
                     contradictions.append({
                         'type': 'meta_inconsistency',
                         'severity': 'high',
@@ -207,7 +171,7 @@ def detect_contradictions(responses_df):
     except Exception:
         pass
 
-    return contradictions
+    return counts if count_only else contradictions
 
 
 def calculate_reliability_score(responses_df):
@@ -219,45 +183,34 @@ def calculate_reliability_score(responses_df):
         return 100
 
     try:
-        score = 100.0
-        contradictions = detect_contradictions(responses_df)
-
-        for c in contradictions:
-            if c.get('severity') == 'critical':
-                score -= 35
-            elif c.get('severity') == 'high':
-                score -= 15
+        contradictions = detect_contradictions(responses_df, count_only=True)
 
         # Speed penalty
+        fast = 0
         if 'response_time' in responses_df.columns:
-            fast = (responses_df['response_time'] < 5).sum()
-            score -= fast * 1.5
+            fast = int((responses_df['response_time'] < 5).sum())
 
-        # Monotone
+        # Monotone + extreme answers
+        monotone, extreme = False, 0
         if 'score' in responses_df.columns:
-            if responses_df['score'].std() < 0.3:
-                score -= 15
-
-        # Extreme answers
-        if 'score' in responses_df.columns:
-            extreme = ((responses_df['score'] == 1) | (responses_df['score'] == 5)).sum()
-            ratio = extreme / len(responses_df)
-            if ratio > 0.7:
-                score -= 20
+            monotone = std_below(*score_moments(responses_df['score']), 0.3)
+            extreme = int(((responses_df['score'] == 1) | (responses_df['score'] == 5)).sum())
 
         # Polygraph resistance
+        polygraph_mean = None
         cat_col = None
         for col in ['category', 'trait']:
             if col in responses_df.columns:
                 cat_col = col
                 break
-        if cat_col:
+        if cat_col and 'score' in responses_df.columns:
             poly_df = responses_df[responses_df[cat_col] == 'polygraph']
-            if not poly_df.empty and 'score' in poly_df.columns:
-                if poly_df['score'].mean() < 2:
-                    score -= 10
+            if not poly_df.empty:
+                polygraph_mean = poly_df['score'].mean()
 
-        return max(0, min(100, round(score)))
+        return integrity_reliability_score(
+            len(responses_df), critical=contradictions['critical'], high=contradictions['high'],
+            fast_count=fast, monotone=monotone, extreme_count=extreme, polygraph_mean=polygraph_mean)
     except Exception:
         return 50
 
@@ -270,30 +223,28 @@ def process_integrity_results(user_responses):
     if not user_responses:
         return pd.DataFrame(), pd.DataFrame()
 
-    records = []
-    for r in user_responses:
-        score = calculate_integrity_score(r.get('answer', 3), r.get('reverse', False))
-        records.append({
-            'question': r.get('question', ''),
-            'answer': r.get('answer', 3),
-            'score': score,
-            'response_time': r.get('response_time', 0),
-            'category': r.get('category', r.get('trait', '')),
-            'is_stress_meta': r.get('is_stress_meta', 0),
-            'reverse': r.get('reverse', False),
-        })
-
-    df_raw = pd.DataFrame(records)
-    if df_raw.empty or 'category' not in df_raw.columns:
-        return df_raw, pd.DataFrame()
-
-    summary = df_raw.groupby('category').agg(
-        avg_score=('score', 'mean'),
-        score_std=('score', 'std'),
-        q_count=('score', 'count'),
-        avg_time=('response_time', 'mean')
-    ).reset_index()
-
+    batch = ResponseBatch(user_responses, trait_key='category', fallback_key='trait')
+    return integrity_frames(user_responses, batch.score, batch.trait_aggregates())
+
+
+def integrity_frames(responses, scores, agg):
+    """(df_raw, summary) מהתשובות, הציונים האפקטיביים וסכומי הקטגוריות (scoring.summary_columns)."""
+    df_raw = pd.DataFrame({
+        'question': [r.get('question', '') for r in responses],
+        'answer': [r.get('answer', 3) for r in responses],
+        'score': np.asarray(scores, dtype=np.int64),
+        'response_time': [r.get('response_time', 0) for r in responses],
+        'category': [r.get('category', r.get('trait', '')) for r in responses],
+        'is_stress_meta': [r.get('is_stress_meta', 0) for r in responses],
+        'reverse': [r.get('reverse', False) for r in responses],
+    })
+    summary = pd.DataFrame({
+        'category': agg['names'],
+        'avg_score': agg['mean_score'],
+        'score_std': agg['std_score'],
+        'q_count': agg['count'],
+        'avg_time': agg['mean_time'],
+    })
     return df_raw, summary
 
 
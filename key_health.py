@@ -0,0 +1,145 @@
+"""
+Mednitai — API Key Health
+=========================
+ניתוב בין מפתחות ה-API: token bucket + circuit breaker לכל מפתח.
+כל בקשה הולכת למפתח הבריא ביותר, ואם כולם עמוסים — ממתינה בתור במקום להיכשל.
+"""
+
+import threading
+import time
+
+KEY_RATE_PER_MINUTE = 15     # קצב בקשות מותר לכל מפתח
+KEY_BURST = 3                # כמה בקשות אפשר לשלוח ברצף לפני שהקצב נאכף
+RATE_LIMIT_COOLDOWN = 5.0    # המתנה בסיסית אחרי 429 (מוכפלת בכל 429 רצוף)
+FAILURE_COOLDOWN = 30.0      # המתנה אחרי FAILURE_THRESHOLD כשלונות רצופים
+FAILURE_THRESHOLD = 3
+MAX_COOLDOWN = 120.0
+RECENT_WINDOW = 60.0         # חלון "429 אחרונים" לדירוג
+LATENCY_ALPHA = 0.3          # משקל המדידה החדשה ב-EWMA של זמן התגובה
+
+
+class KeyHealth:
+    """מצב מפתח אחד: tokens, circuit breaker, זמן תגובה ממוצע ו-429 אחרונים."""
+
+    def __init__(self, key, rate_per_minute=KEY_RATE_PER_MINUTE, burst=KEY_BURST):
+        self.key = key
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.open_until = 0.0
+        self.consecutive_429 = 0
+        self.consecutive_failures = 0
+        self.recent_429 = []
+        self.latency = None
+        self.requests = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def ready_in(self, now):
+        """שניות עד שאפשר לשלוח דרך המפתח (0 = עכשיו)."""
+        self._refill(now)
+        token_wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(token_wait, self.open_until - now, 0.0)
+
+    def score(self, now):
+        """נמוך = בריא יותר: זמן תגובה ממוצע + קנס על 429 בדקה האחרונה."""
+        self.recent_429 = [t for t in self.recent_429 if now - t < RECENT_WINDOW]
+        return (self.latency or 0.0) + 10.0 * len(self.recent_429)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+        self.requests += 1
+
+    def snapshot(self, now):
+        return {
+            'state': 'open' if self.open_until > now else 'closed',
+            'tokens': round(min(float(self.burst), self.tokens + (now - self.updated_at) * self.rate), 2),
+            'latency': round(self.latency, 2) if self.latency is not None else None,
+            'recent_429': len([t for t in self.recent_429 if now - t < RECENT_WINDOW]),
+            'requests': self.requests,
+            'retry_in': round(max(0.0, self.open_until - now), 1),
+        }
+
+
+class KeyRouter:
+    """
+    מחלק בקשות בין מפתחות. acquire() מחזיר את המפתח הבריא ביותר שמוכן,
+    או ממתין עד שאחד יתפנה (עד timeout). אחרי כל בקשה מדווחים record_*.
+    """
+
+    def __init__(self, keys, rate_per_minute=KEY_RATE_PER_MINUTE, burst=KEY_BURST):
+        self._health = [KeyHealth(k, rate_per_minute, burst) for k in keys]
+        self._cond = threading.Condition()
+
+    def _get(self, key):
+        return next(h for h in self._health if h.key == key)
+
+    def try_acquire(self, exclude=()):
+        """
+        בלי להמתין: (key, 0) אם יש מפתח מוכן, (None, wait) עם שניות עד שאחד יתפנה,
+        או (None, None) אם לא נשארו מפתחות. מתאים גם ל-event loop (asyncio).
+        """
+        with self._cond:
+            now = time.monotonic()
+            candidates = [h for h in self._health if h.key not in exclude]
+            if not candidates:
+                return None, None
+            waits = {id(h): h.ready_in(now) for h in candidates}
+            ready = [h for h in candidates if waits[id(h)] <= 0]
+            if ready:
+                best = min(ready, key=lambda h: h.score(now))
+                best.take(now)
+                return best.key, 0.0
+            return None, min(waits.values())
+
+    def acquire(self, exclude=(), timeout=60.0):
+        """מפתח לשליחה (לא מתוך exclude), או None אם אף מפתח לא יתפנה בזמן."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                key, wait = self.try_acquire(exclude)
+                if key is not None or wait is None:
+                    return key
+                if time.monotonic() + wait > deadline:
+                    return None
+                self._cond.wait(wait)
+
+    def record_success(self, key, latency):
+        with self._cond:
+            h = self._get(key)
+            h.latency = latency if h.latency is None else (
+                LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * h.latency)
+            h.consecutive_429 = 0
+            h.consecutive_failures = 0
+            h.open_until = 0.0
+            self._cond.notify_all()
+
+    def record_rate_limited(self, key, retry_after=None):
+        """429 — המפתח נסגר ל-cooldown (Retry-After אם השרת שלח, אחרת exponential)."""
+        with self._cond:
+            h = self._get(key)
+            now = time.monotonic()
+            h.recent_429.append(now)
+            h.consecutive_429 += 1
+            cooldown = retry_after if retry_after else RATE_LIMIT_COOLDOWN * (2 ** (h.consecutive_429 - 1))
+            h.open_until = now + min(cooldown, MAX_COOLDOWN)
+            h.tokens = min(h.tokens, 0.0)
+            self._cond.notify_all()
+
+    def record_failure(self, key):
+        with self._cond:
+            h = self._get(key)
+            h.consecutive_failures += 1
+            if h.consecutive_failures >= FAILURE_THRESHOLD:
+                h.open_until = time.monotonic() + FAILURE_COOLDOWN
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """מצב כל המפתחות לפי הסדר (בלי המפתח עצמו)."""
+        with self._cond:
+            now = time.monotonic()
+            return [h.snapshot(now) for h in self._health]
@@ -8,6 +8,9 @@ import numpy as np
 import io
 import os
 
+from scoring import (ResponseBatch, count_gap_pairs, effective_score, fatigue_score,
+                     iter_gap_pairs, label_score_histograms)
+
 IDEAL_RANGES = {
     'Conscientiousness':       (4.3, 4.8),
     'Honesty-Humility':        (4.2, 4.9),
@@ -19,43 +22,34 @@ IDEAL_RANGES = {
 
 
 def calculate_score(answer, reverse_value):
-    try:
-        score = int(answer)
-        rev = str(reverse_value).strip().lower()
-        if rev in ['true', '1', '1.0', 'yes', 't', 'ת', 'אמת']:
-            score = 6 - score
-        return max(1, min(5, score))
-    except (ValueError, TypeError):
-        return 3
+    return effective_score(answer, reverse_value)
 
 
 def process_results(user_responses):
     if not user_responses:
         return pd.DataFrame(), pd.DataFrame()
 
-    records = []
-    for r in user_responses:
-        score = calculate_score(r.get('answer', 3), r.get('reverse', False))
-        records.append({
-            'question': r.get('question', ''),
-            'answer': r.get('answer', 3),
-            'score': score,
-            'response_time': r.get('response_time', 0),
-            'trait': r.get('trait', ''),
-            'reverse': r.get('reverse', False),
-        })
-
-    df_raw = pd.DataFrame(records)
-    if df_raw.empty or 'trait' not in df_raw.columns:
-        return df_raw, pd.DataFrame()
-
-    summary = df_raw.groupby('trait').agg(
-        avg_score=('score', 'mean'),
-        avg_time=('response_time', 'mean'),
-        std_score=('score', 'std'),
-        q_count=('score', 'count')
-    ).reset_index()
-    summary.rename(columns={'trait': 'Trait', 'avg_score': 'Mean'}, inplace=True)
+    batch = ResponseBatch(user_responses)
+    return results_frames(user_responses, batch.score, batch.trait_aggregates())
+
+
+def results_frames(responses, scores, agg):
+    """(df_raw, summary) מהתשובות, הציונים האפקטיביים וסכומי התכונות (scoring.summary_columns)."""
+    df_raw = pd.DataFrame({
+        'question': [r.get('question', '') for r in responses],
+        'answer': [r.get('answer', 3) for r in responses],
+        'score': np.asarray(scores, dtype=np.int64),
+        'response_time': [r.get('response_time', 0) for r in responses],
+        'trait': [r.get('trait', '') for r in responses],
+        'reverse': [r.get('reverse', False) for r in responses],
+    })
+    summary = pd.DataFrame({
+        'Trait': agg['names'],
+        'Mean': agg['mean_score'],
+        'avg_time': agg['mean_time'],
+        'std_score': agg['std_score'],
+        'q_count': agg['count'],
+    })
     return df_raw, summary
 
 
@@ -91,7 +85,7 @@ def calculate_reliability_index(df_raw):
         score = 100.0
         if 'response_time' in df_raw.columns:
             score -= (df_raw['response_time'] < 1.4).sum() * 2
-        score -= len(get_inconsistent_questions(df_raw)) * 5
+        score -= get_inconsistent_questions(df_raw, count_only=True) * 5
         if 'trait' in df_raw.columns and 'score' in df_raw.columns:
             for trait in df_raw['trait'].unique():
                 ts = df_raw[df_raw['trait'] == trait]['score']
@@ -102,25 +96,28 @@ def calculate_reliability_index(df_raw):
         return 50
 
 
-def get_inconsistent_questions(df_raw):
-    result = []
+def get_inconsistent_questions(df_raw, count_only=False):
+    """
+    זוגות שאלות באותה תכונה עם פער ציון >= 2.5.
+    נספר מהיסטוגרמת הציונים של כל תכונה (O(n)) במקום להשוות כל זוג.
+    count_only=True — מחזיר רק את מספר הסתירות.
+    """
+    result = 0 if count_only else []
     if df_raw is None or df_raw.empty:
         return result
     try:
         if 'trait' not in df_raw.columns or 'score' not in df_raw.columns:
             return result
-        for trait in df_raw['trait'].unique():
-            tdf = df_raw[df_raw['trait'] == trait]
-            scores = tdf['score'].values
-            questions = tdf['question'].values
-            for i in range(len(scores)):
-                for j in range(i + 1, len(scores)):
-                    if abs(scores[i] - scores[j]) >= 2.5:
-                        result.append({
-                            'trait': trait, 'gap': abs(scores[i] - scores[j]),
-                            'severity': 'high',
-                            'message': f"סתירה ב-{trait}: פער {abs(scores[i] - scores[j]):.1f}"
-                        })
+        traits, values, hist = label_score_histograms(df_raw['trait'], df_raw['score'])
+        if count_only:
+            return int(count_gap_pairs(values, hist, 2.5).sum())
+        for t, trait in enumerate(traits):
+            for gap, n in iter_gap_pairs(values, hist[t], 2.5):
+                result.extend({
+                    'trait': trait, 'gap': gap,
+                    'severity': 'high',
+                    'message': f"סתירה ב-{trait}: פער {gap:.1f}"
+                } for _ in range(n))
     except Exception:
         pass
     return result
@@ -142,11 +139,11 @@ def analyze_consistency(df):
                 ts = df[df['trait'] == trait]['score']
                 if len(ts) > 3 and ts.std() < 0.35:
                     alerts.append({'level': 'orange', 'message': f'תשובות מונוטוניות ב-{trait}'})
-        incons = get_inconsistent_questions(df)
-        if len(incons) > 3:
-            alerts.append({'level': 'red', 'message': f'{len(incons)} סתירות'})
+        incons = get_inconsistent_questions(df, count_only=True)
+        if incons > 3:
+            alerts.append({'level': 'red', 'message': f'{incons} סתירות'})
         elif incons:
-            alerts.append({'level': 'blue', 'message': f'{len(incons)} סתירות קלות'})
+            alerts.append({'level': 'blue', 'message': f'{incons} סתירות קלות'})
     except Exception:
         pass
     return alerts
@@ -222,37 +219,6 @@ def create_excel_download(responses):
     return "שגיאה: לא נמצא מנוע Excel (xlsxwriter / openpyxl)"
 
 
-def get_balanced_questions(df, total_limit=60):
-    if df is None or df.empty:
-        return []
-    try:
-        trait_col = None
-        for col in ['trait', 'Trait', 'category']:
-            if col in df.columns:
-                trait_col = col
-                break
-        if not trait_col:
-            return df.head(total_limit).to_dict('records')
-
-        traits = df[trait_col].unique()
-        per_trait = max(1, total_limit // len(traits))
-        parts = []
-        for trait in traits:
-            tdf = df[df[trait_col] == trait]
-            parts.append(tdf.sample(n=min(per_trait, len(tdf))))
-
-        result = pd.concat(parts)
-        remaining = total_limit - len(result)
-        if remaining > 0:
-            leftover = df[~df.index.isin(result.index)]
-            if not leftover.empty:
-                result = pd.concat([result, leftover.sample(n=min(remaining, len(leftover)))])
-
-        return result.sample(frac=1).reset_index(drop=True).to_dict('records')
-    except Exception:
-        return df.head(total_limit).to_dict('records')
-
-
 # ============================================================
 # Dynamic WPM Threshold
 # ============================================================
@@ -277,6 +243,29 @@ def calculate_dynamic_wpm_threshold(question_text):
         return 1.4  # Fallback
 
 
+# ============================================================
+# Statement Polarity
+# ============================================================
+# מילון מילות-מפתח שמרמזות על "מתחייב" או "נשלל" בהיגד
+NEGATION_HINTS = ['לא ', 'אין ', 'אינני', 'אינו ', 'אינה ', 'נמנע', 'מתקשה',
+                  'מתרחק', 'מסרב', 'בורח', 'אסור']
+
+
+def detect_statement_polarity(question_text):
+    """
+    מזהה האם ההיגד "מתחייב" את התכונה (חיובי) או "שולל" אותה (בעל שלילה).
+    מחזיר: 'affirms' (מתחייב) / 'negates' (שולל) / 'neutral'
+    """
+    text = str(question_text).lower()
+    
+    # סופרים מילות שלילה
+    negation_count = sum(1 for hint in NEGATION_HINTS if hint in text)
+    
+    if negation_count >= 1:
+        return 'negates'
+    return 'affirms'
+
+
 # ============================================================
 # Fatigue Index
 # ============================================================
@@ -300,66 +289,22 @@ def calculate_fatigue_index(responses):
         first_third = responses[:third]
         last_third = responses[-third:]
 
-        fatigue_score = 0
-
-        # ---- 1. Response time comparison ----
-        first_times = [r.get('response_time', 0) for r in first_third if r.get('response_time', 0) > 0]
-        last_times = [r.get('response_time', 0) for r in last_third if r.get('response_time', 0) > 0]
-
-        if first_times and last_times:
-            avg_first = sum(first_times) / len(first_times)
-            avg_last = sum(last_times) / len(last_times)
-
-            if avg_first > 0:
-                # Significant slowdown = fatigue
-                time_ratio = avg_last / avg_first
-                if time_ratio > 1.5:
-                    fatigue_score += 30  # Major slowdown
-                elif time_ratio > 1.2:
-                    fatigue_score += 15  # Moderate slowdown
-                # Or significant speedup (rushing to finish)
-                elif time_ratio < 0.6:
-                    fatigue_score += 25  # Rushing at end
-                elif time_ratio < 0.8:
-                    fatigue_score += 10
-
-        # ---- 2. Score variance comparison ----
+        def avg_time(window):
+            times = [r.get('response_time', 0) for r in window if r.get('response_time', 0) > 0]
+            return sum(times) / len(times) if times else None
+
         first_scores = [r.get('answer', 3) for r in first_third]
         last_scores = [r.get('answer', 3) for r in last_third]
 
-        if len(first_scores) > 2 and len(last_scores) > 2:
-            first_std = np.std(first_scores)
-            last_std = np.std(last_scores)
-
-            # Less variance at end = fatigue (defaulting to middle)
-            if last_std < first_std * 0.5 and first_std > 0.5:
-                fatigue_score += 20  # Much less variance
-            elif last_std < first_std * 0.7 and first_std > 0.5:
-                fatigue_score += 10
-
-            # Or much more variance (careless)
-            if last_std > first_std * 1.8 and last_std > 1.0:
-                fatigue_score += 15
-
-        # ---- 3. Last 10% speed check ----
-        last_10pct = responses[-max(1, n // 10):]
-        last_10_times = [r.get('response_time', 0) for r in last_10pct if r.get('response_time', 0) > 0]
-
-        if last_10_times and first_times:
-            avg_last_10 = sum(last_10_times) / len(last_10_times)
-            avg_first_time = sum(first_times) / len(first_times)
-
-            if avg_first_time > 0 and avg_last_10 < avg_first_time * 0.4:
-                fatigue_score += 20  # Extremely rushed at end
-
-        # ---- 4. Monotone answers at end ----
-        if len(last_scores) > 5:
-            # Check if last answers are all the same
-            unique_last = len(set(last_scores[-min(10, len(last_scores)):]))
-            if unique_last <= 2:
-                fatigue_score += 15  # Almost no variation
-
-        return min(100, max(0, fatigue_score))
+        return fatigue_score(
+            third,
+            avg_first=avg_time(first_third),
+            avg_last=avg_time(last_third),
+            avg_tail=avg_time(responses[-max(1, n // 10):]),
+            first_std=np.std(first_scores),
+            last_std=np.std(last_scores),
+            tail_unique=len(set(last_scores[-min(10, len(last_scores)):])),
+        )
 
     except Exception:
         return 0
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Mednitai — Prompt Builder
+=========================
+בניית prompts לדוחות ה-AI בתוך תקציב tokens לכל ספק.
+היסטוריה ארוכה מסוכמת לטבלת מגמות קצרה (ציון לכל מבחן + שינוי), במקום להדביק את המסמכים עצמם.
+"""
+
+import math
+
+# תקציב tokens ל-prompt (קלט בלבד) לכל ספק
+PROMPT_TOKEN_BUDGETS = {'gemini': 2500, 'claude': 2000}
+HISTORY_TREND_MAX_TESTS = 4   # כמה מבחנים קודמים (האחרונים) נכנסים לטבלת המגמות
+BYTES_PER_TOKEN = 4.0         # הערכה: עברית ≈ 2 תווים ל-token (2 bytes לתו ב-UTF-8), אנגלית ≈ 4 תווים
+
+
+def estimate_tokens(text):
+    """הערכת מספר ה-tokens לפני שליחה (לתקציב). הספירה האמיתית מגיעה מה-API אחרי הקריאה."""
+    if not text:
+        return 0
+    return int(math.ceil(len(str(text).encode('utf-8')) / BYTES_PER_TOKEN))
+
+
+def _fmt(value):
+    return "—" if value is None else f"{value:.2f}"
+
+
+def _delta(new, old):
+    if new is None or old is None:
+        return "—"
+    return f"{new - old:+.2f}"
+
+
+def history_scores(history, parse, max_tests=HISTORY_TREND_MAX_TESTS):
+    """[(test_date, {trait: score})] של המבחנים שנכנסים לטבלת המגמות (גם למפתח ה-cache של הדוח)."""
+    past = []
+    for h in (history or [])[-max_tests:]:
+        try:
+            scores = parse(h.get('results')) if isinstance(h, dict) else {}
+        except Exception:
+            scores = {}
+        if scores:
+            past.append((str(h.get('test_date') or '?'), scores))
+    return past
+
+
+def history_trend_table(current, history, parse, labels=None, max_tests=HISTORY_TREND_MAX_TESTS):
+    """
+    טבלת מגמות קומפקטית: שורה לכל תכונה — הציון בכל מבחן קודם, עכשיו,
+    ושינוי מהמבחן הקודם ומהראשון בטבלה. current — {trait: score};
+    history — מסמכי מבחנים (מהישן לחדש) עם 'results' ו-'test_date';
+    parse — results של מסמך → {trait: score}. מחזיר '' אם אין היסטוריה שימושית.
+    """
+    labels = labels or {}
+    past = history_scores(history, parse, max_tests)
+    if not past:
+        return ''
+
+    header = ["תכונה"] + [date for date, _ in past] + ["עכשיו", "Δ קודם", "Δ ראשון"]
+    rows = [" | ".join(header)]
+    for trait in (current or {}):
+        now = current[trait]
+        values = [scores.get(trait) for _, scores in past]
+        previous = next((v for v in reversed(values) if v is not None), None)
+        first = next((v for v in values if v is not None), None)
+        rows.append(" | ".join([str(labels.get(trait, trait))] + [_fmt(v) for v in values]
+                               + [_fmt(now), _delta(now, previous), _delta(now, first)]))
+    return "\n".join(rows)
+
+
+def history_trend_variants(title, current, history, parse, labels=None, empty="אין היסטוריה קודמת"):
+    """גרסאות של חלק ההיסטוריה ל-PromptBuilder.add_variants: כל המבחנים → רק האחרון → בלי היסטוריה."""
+    tables = [history_trend_table(current, history, parse, labels, max_tests=n)
+              for n in range(HISTORY_TREND_MAX_TESTS, 0, -1)]
+    tables = [t for i, t in enumerate(tables) if t and t not in tables[:i]]
+    if not tables:
+        return [f"{title}: {empty}"]
+    return [f"{title}:\n{t}" for t in tables] + [f"{title}: הושמטה (מגבלת אורך)"]
+
+
+class PromptBuilder:
+    """
+    prompt מחלקים. חלק קבוע (הוראות, ציונים) תמיד נכנס כמו שהוא; לחלק גמיש יש
+    כמה גרסאות — מהמלאה לקצרה — ומתקדמים לגרסה קצרה יותר עד שה-prompt נכנס בתקציב.
+    build() -> (prompt, estimated_tokens, trimmed).
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._parts = []  # רשימת גרסאות לכל חלק, מהמלאה לקצרה
+
+    def add(self, text):
+        if text:
+            self._parts.append([str(text)])
+        return self
+
+    def add_variants(self, variants):
+        """גרסאות של אותו חלק (המלאה ראשונה). '' בסוף = אפשר לוותר עליו לגמרי."""
+        variants = [str(v) for v in variants if v is not None]
+        if variants:
+            self._parts.append(variants)
+        return self
+
+    def add_lines(self, title, lines, min_lines=0, empty=None):
+        """רשימה שמתקצרת מהסוף (השורות הראשונות הכי חשובות). empty — טקסט אם אין שורות."""
+        lines = [str(line) for line in (lines or []) if line]
+        if not lines:
+            return self.add(f"{title}: {empty}" if title and empty else empty)
+        variants = []
+        for n in range(len(lines), min_lines - 1, -1):
+            dropped = len(lines) - n
+            body = lines[:n] + ([f"(ועוד {dropped} שורות שהושמטו)"] if dropped else [])
+            variants.append(f"{title}:\n" + "\n".join(body) if n else "")
+        return self.add_variants(variants)
+
+    def _render(self, chosen):
+        return "\n".join(t for t in (variants[i] for variants, i in zip(self._parts, chosen)) if t)
+
+    def build(self):
+        chosen = [0] * len(self._parts)
+        prompt = self._render(chosen)
+        tokens = estimate_tokens(prompt)
+        trimmed = False
+        # בכל צעד מקצרים את החלק הגמיש שתופס הכי הרבה מקום, עד שנכנסים בתקציב
+        while tokens > self.budget:
+            candidates = [j for j, variants in enumerate(self._parts) if chosen[j] + 1 < len(variants)]
+            if not candidates:
+                break
+            j = max(candidates, key=lambda k: estimate_tokens(self._parts[k][chosen[k]]))
+            chosen[j] += 1
+            trimmed = True
+            prompt = self._render(chosen)
+            tokens = estimate_tokens(prompt)
+        return prompt, tokens, trimmed
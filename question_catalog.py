@@ -0,0 +1,197 @@
+"""
+Mednitai — Question Catalog
+===========================
+מאגרי השאלות (HEXACO + אמינות) — נטענים פעם אחת לתהליך (st.cache_resource ב-app.py).
+לכל שאלה: שורה immutable ב-QUESTION_TABLE ועמודות מוקלדות — קוד תכונה/קטגוריה,
+סף WPM וקוטביות ההיגד. מחוללי המבחנים דוגמים אינדקסים — בלי DataFrames;
+מסלול התשובה מוצא את סף ה-WPM והקוטביות דרך QuestionCatalog.meta.
+"""
+
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from logic import calculate_dynamic_wpm_threshold, detect_statement_polarity
+from session_store import QUESTION_TABLE
+
+# עמודת הקיבוץ (תכונה / קטגוריה) — הראשונה שקיימת בקובץ
+HEXACO_GROUP_COLUMNS = ('trait', 'Trait', 'category')
+INTEGRITY_GROUP_COLUMNS = ('category', 'Category', 'trait')
+_TRUE_FLAGS = ('1', '1.0', 'true', 'yes')
+QUESTION_META_CACHE_SIZE = 4096   # טקסטים שלא מהמאגרים (וידאו, שאלות ידניות)
+
+
+class QuestionMeta:
+    """מה שנגזר מטקסט השאלה בלבד: סף WPM (שניות) וקוטביות ('affirms' / 'negates')."""
+
+    __slots__ = ('wpm_threshold', 'polarity')
+
+    def __init__(self, wpm_threshold, polarity):
+        self.wpm_threshold = wpm_threshold
+        self.polarity = polarity
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(calculate_dynamic_wpm_threshold(text), detect_statement_polarity(text))
+
+
+@lru_cache(maxsize=QUESTION_META_CACHE_SIZE)
+def _adhoc_meta(text):
+    return QuestionMeta.from_text(text)
+
+
+def question_meta(text):
+    """
+    QuestionMeta לטקסט שאלה שלא מהמאגרים (LRU). לשאלות המאגרים — QuestionCatalog.meta,
+    מהעמודות שחושבו בטעינת הקטלוג.
+    """
+    return _adhoc_meta(str(text))
+
+
+class QuestionBank:
+    """
+    מאגר שאלות אחד (קובץ CSV אחד). השאלה ה-i:
+    - row(i) — השורה בטבלה המשותפת (עם שדות נוספים: row(i, quiz_format=...))
+    - group[i] — קוד int16 של התכונה/קטגוריה (group_names[code] = השם)
+    - wpm[i] (שניות), negates[i] (bool — ההיגד שולל); meta(i) — שניהם כ-QuestionMeta
+    """
+
+    def __init__(self, df=None, group_columns=HEXACO_GROUP_COLUMNS):
+        df = df if df is not None else pd.DataFrame()
+        records = df.to_dict('records')
+        self.columns = frozenset(df.columns)
+        self.qids = np.fromiter((QUESTION_TABLE.intern(r) for r in records), dtype=np.int32, count=len(records))
+        self.text = tuple(str(r.get('q', r.get('question', ''))) for r in records)
+
+        self.group_column = next((c for c in group_columns if c in df.columns), None)
+        if self.group_column is not None:
+            codes, names = pd.factorize(df[self.group_column])
+        else:
+            codes, names = np.zeros(len(records), dtype=np.int64), ['']
+        self.group = codes.astype(np.int16)
+        self.group_names = [str(n) for n in names]
+        self._group_codes = {name: code for code, name in enumerate(self.group_names)}
+
+        metas = [QuestionMeta.from_text(t) for t in self.text]
+        self.wpm = np.fromiter((m.wpm_threshold for m in metas), dtype=np.float64, count=len(records))
+        self.negates = np.fromiter((m.polarity == 'negates' for m in metas), dtype=bool, count=len(records))
+
+        self._index_by_text = {}
+        for i, t in enumerate(self.text):
+            self._index_by_text.setdefault(t, i)
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.qids)
+
+    # ============================================================
+    # Rows
+    # ============================================================
+    def row(self, i, **extra):
+        """השאלה ה-i (MappingProxyType). extra — שדות נוספים; כל וריאנט נבנה פעם אחת לתהליך."""
+        if not extra:
+            return QUESTION_TABLE[self.qids[i]]
+        key = (int(i), tuple(sorted(extra.items())))
+        row = self._variants.get(key)
+        if row is None:
+            with self._lock:
+                row = self._variants.get(key)
+                if row is None:
+                    base = QUESTION_TABLE[self.qids[i]]
+                    row = self._variants[key] = QUESTION_TABLE[QUESTION_TABLE.intern({**base, **extra})]
+        return row
+
+    def rows(self, indices, **extra):
+        return [self.row(i, **extra) for i in indices]
+
+    def group_name(self, i):
+        code = self.group[i]
+        return self.group_names[code] if code >= 0 else ''
+
+    def index_of(self, text):
+        """אינדקס השאלה לפי הטקסט, או None אם היא לא מהמאגר."""
+        return self._index_by_text.get(str(text))
+
+    def polarity(self, i):
+        return 'negates' if self.negates[i] else 'affirms'
+
+    def meta(self, i):
+        return QuestionMeta(float(self.wpm[i]), self.polarity(i))
+
+    # ============================================================
+    # Masks & sampling
+    # ============================================================
+    def group_mask(self, names):
+        codes = [self._group_codes[n] for n in names if n in self._group_codes]
+        return np.isin(self.group, codes)
+
+    def flag_mask(self, column):
+        """עמודת דגל ('1' / 'true' / 'yes' ...) כמסכה; None אם העמודה לא קיימת."""
+        if column not in self.columns:
+            return None
+        return np.fromiter((str(QUESTION_TABLE[q].get(column, '')).strip().lower() in _TRUE_FLAGS
+                            for q in self.qids), dtype=bool, count=len(self))
+
+    def indices(self, mask=None):
+        return np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+
+    def sample(self, n, mask=None):
+        """n אינדקסים אקראיים (בלי חזרות) מתוך המסכה — בסדר אקראי."""
+        pool = self.indices(mask)
+        return np.random.permutation(pool)[:max(0, min(int(n), len(pool)))]
+
+    def balanced(self, total_limit, mask=None):
+        """
+        דגימה מאוזנת בין התכונות: אותו מספר מכל תכונה, ההשלמה מהשאר, והכל מעורבב.
+        """
+        pool = self.indices(mask)
+        if not len(pool):
+            return pool
+        in_pool = np.zeros(len(self), dtype=bool)
+        in_pool[pool] = True
+        groups = pd.unique(self.group[pool])
+        per_group = max(1, total_limit // len(groups))
+        parts = [self.sample(per_group, in_pool & (self.group == g)) for g in groups]
+        chosen = np.concatenate(parts)
+        remaining = total_limit - len(chosen)
+        if remaining > 0:
+            leftover = np.setdiff1d(pool, chosen)
+            chosen = np.concatenate([chosen, np.random.permutation(leftover)[:remaining]])
+        return np.random.permutation(chosen)
+
+
+class QuestionCatalog:
+    """שני המאגרים + שגיאות הטעינה (להצגה למשתמש)."""
+
+    def __init__(self, hexaco=None, integrity=None, errors=()):
+        self.hexaco = hexaco if hexaco is not None else QuestionBank()
+        self.integrity = integrity if integrity is not None else QuestionBank()
+        self.errors = list(errors)
+
+    @classmethod
+    def from_csv(cls, hexaco_path, integrity_path):
+        banks, errors = {}, []
+        for name, path, label, group_columns in (
+                ('hexaco', hexaco_path, "HEXACO", HEXACO_GROUP_COLUMNS),
+                ('integrity', integrity_path, "אמינות", INTEGRITY_GROUP_COLUMNS)):
+            try:
+                banks[name] = QuestionBank(pd.read_csv(path), group_columns)
+            except Exception as e:
+                errors.append(f"שגיאה בטעינת שאלות {label}: {e}")
+        return cls(errors=errors, **banks)
+
+    def find(self, text):
+        """(מאגר, אינדקס) של שאלה לפי הטקסט, או (None, None)."""
+        for bank in (self.hexaco, self.integrity):
+            i = bank.index_of(text)
+            if i is not None:
+                return bank, i
+        return None, None
+
+    def meta(self, text):
+        """QuestionMeta של שאלה מהמאגרים (מהעמודות שחושבו בטעינה), או None אם הטקסט לא מהם."""
+        bank, i = self.find(text)
+        return bank.meta(i) if bank is not None else None
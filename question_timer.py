@@ -0,0 +1,72 @@
+"""
+Mednitai — Question Timer Component
+===================================
+רכיב Streamlit סטטי (question_timer_frontend/index.html) שמריץ את הטיימרים בדפדפן:
+שעון החול ואזהרת ההיסוס בשאלה, ספירה לאחור במסך הלחץ ובשאלת וידאו.
+השרת מתרענן רק בפעולה של המשתמש — והזמן שנמדד בדפדפן חוזר יחד עם התשובה.
+"""
+
+import os
+
+import streamlit.components.v1 as components
+
+HOURGLASS_WARN_SECONDS = 8    # מכאן השעון אדום ומופיעה אזהרת היסוס
+HOURGLASS_MAX_SECONDS = 15    # השעון מתרוקן לגמרי
+CLIENT_CLOCK_SLACK = 2.0      # כמה זמן הדפדפן יכול "למדוד" מעבר לשעון השרת
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_timer_frontend")
+_component = components.declare_component("question_timer", path=_FRONTEND_DIR)
+
+
+def question_timer(key, options=(), card=None, columns=1, caption=None, show_timer=True, elapsed=0.0):
+    """
+    כרטיס השאלה + שעון חול + כפתורי תשובה, הכל בדפדפן.
+    options — [(label, value)]; card — {'category', 'text'} (None = בלי כרטיס).
+    elapsed — שניות שכבר עברו מאז שהשאלה הוצגה (לפי השרת).
+    מחזיר {'value', 'elapsed'} אחרי לחיצה, אחרת None.
+    key חייב להשתנות בכל הצגה של שאלה — אחרת ערך ישן (למשל אחרי "חזור") יחזור שוב.
+    """
+    return _component(
+        mode="quiz",
+        options=[{'label': str(label), 'value': value} for label, value in options],
+        card=card,
+        columns=columns,
+        caption=caption,
+        show_timer=show_timer,
+        warn_after=HOURGLASS_WARN_SECONDS,
+        max_seconds=HOURGLASS_MAX_SECONDS,
+        elapsed=elapsed,
+        key=key,
+        default=None,
+    )
+
+
+def countdown_timer(key, seconds, view, message=None, elapsed=0.0, notify=True):
+    """
+    ספירה לאחור בדפדפן. view — 'stress' (עם message של STRESS_MESSAGES) או 'video'.
+    notify — כשהזמן נגמר הרכיב מחזיר {'expired': True} (rerun אחד), אחרת רק מציג.
+    """
+    return _component(
+        mode="countdown",
+        view=view,
+        seconds=int(seconds),
+        message=message,
+        elapsed=elapsed,
+        notify=notify,
+        key=key,
+        default=None,
+    )
+
+
+def measured_response_time(answer, server_elapsed):
+    """
+    זמן התגובה שנמדד בדפדפן, אם הוא סביר מול שעון השרת (לא שלילי ולא ארוך ממנו);
+    אחרת — הזמן של השרת.
+    """
+    try:
+        client = float((answer or {}).get('elapsed'))
+    except (TypeError, ValueError):
+        return server_elapsed
+    if 0 <= client <= server_elapsed + CLIENT_CLOCK_SLACK:
+        return client
+    return server_elapsed
@@ -0,0 +1,133 @@
+"""
+Mednitai — AI Report Cache
+==========================
+cache מקומי (SQLite) לדוחות AI, לפי hash של תוכן המבחן.
+מבחן חוזר עם ציונים כמעט זהים מקבל את הדוח מיד — בלי לבזבז מכסה של Gemini/Claude.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+REPORT_CACHE_FILE = "report_cache.sqlite3"
+REPORT_TTL_SECONDS = 30 * 24 * 3600
+REPORT_CACHE_MAX_ENTRIES = 500
+REPORT_SCORE_PRECISION = 1  # ספרות אחרי הנקודה — 4.23 ו-4.18 נחשבים אותו ציון
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    key TEXT PRIMARY KEY,
+    report TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_lru ON reports (last_used_at);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _default_data_dir():
+    return os.environ.get("MEDNITAI_DATA_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data"))
+
+
+def _rounded_scores(results):
+    return sorted((str(k), round(float(v), REPORT_SCORE_PRECISION)) for k, v in (results or {}).items())
+
+
+def report_cache_key(test_type, results, contradictions=(), prompt_version=1, extra=None, history=()):
+    """
+    hash של מה שקובע את הדוח: סוג המבחן, הציונים (מעוגלים), הודעות הסתירה
+    וגרסת ה-prompt. results — dict של {trait: score} (אחרי _parse_to_simple_dict).
+    history — [(test_date, {trait: score})] של המבחנים הקודמים שנכנסו ל-prompt.
+    """
+    scores = _rounded_scores(results)
+    messages = sorted(str(c.get('message', c)) if isinstance(c, dict) else str(c)
+                      for c in (contradictions or []))
+    material = json.dumps({
+        'test_type': str(test_type),
+        'scores': scores,
+        'contradictions': messages,
+        'prompt_version': prompt_version,
+        'extra': extra,
+        'history': [[str(date), _rounded_scores(past)] for date, past in (history or ())],
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """
+    מפתח → טקסט הדוח. רשומה פגה אחרי ttl שניות; מעל max_entries
+    נמחקות הרשומות שלא נקראו הכי הרבה זמן (LRU).
+    """
+
+    def __init__(self, path=None, ttl=REPORT_TTL_SECONDS, max_entries=REPORT_CACHE_MAX_ENTRIES):
+        if path is None:
+            data_dir = _default_data_dir()
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, REPORT_CACHE_FILE)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def _bump(self, name):
+        self._conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """הדוח השמור, או None (לא קיים / פג תוקף). נספר כ-hit או miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT report FROM reports WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl)).fetchone()
+            if row is None:
+                self._bump('misses')
+            else:
+                self._bump('hits')
+                self._conn.execute("UPDATE reports SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[0] if row else None
+
+    def put(self, key, report):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (key, report, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, str(report), now, now))
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM reports WHERE created_at <= ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM reports WHERE key IN ("
+            "SELECT key FROM reports ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def stats(self):
+        """{'hits', 'misses', 'hit_rate', 'entries'} — hit_rate באחוזים."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+        hits, misses = counters.get('hits', 0), counters.get('misses', 0)
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(100.0 * hits / total, 1) if total else 0.0,
+            'entries': entries,
+        }
@@ -0,0 +1,245 @@
+"""
+Mednitai — Save Journal
+=======================
+יומן כתיבה מקומי (SQLite) לשמירות ל-Firestore.
+כל שמירה נרשמת קודם ביומן, ו-thread רקע מעביר אותה ל-Firestore עם backoff —
+כך תוצאות שורדות נפילת Firestore והפעלה מחדש של האפליקציה.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+JOURNAL_FILE = "save_journal.sqlite3"
+FLUSH_BATCH_SIZE = 50
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 300.0
+RETENTION_SECONDS = 7 * 24 * 3600  # רשומות שכבר נשלחו נמחקות אחרי שבוע
+MAX_ATTEMPTS = 100                 # ~8 שעות בקצב של BACKOFF_MAX_SECONDS
+MAX_AGE_SECONDS = 48 * 3600        # אחרי זה (או MAX_ATTEMPTS) השורה עוברת ל-dead-letter
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    done_at REAL,
+    dead_at REAL
+);
+CREATE INDEX IF NOT EXISTS journal_pending ON journal (done_at, next_attempt_at);
+"""
+_PENDING = "done_at IS NULL AND dead_at IS NULL"
+
+
+class FinalError(Exception):
+    """כישלון סופי של פעולה ביומן — apply מחזיר אותו, והשורה עוברת ל-dead-letter מיד."""
+
+
+def _default_data_dir():
+    return os.environ.get("MEDNITAI_DATA_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data"))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    return str(value)
+
+
+def _json_hook(obj):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def encode_payload(payload):
+    return json.dumps(payload, ensure_ascii=False, default=_json_default)
+
+
+def decode_payload(text):
+    return json.loads(text, object_hook=_json_hook)
+
+
+def backoff_delay(attempts):
+    """המתנה לפני ניסיון נוסף — exponential עם jitter, עד BACKOFF_MAX_SECONDS."""
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** attempts), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class SaveJournal:
+    """
+    יומן append-only: כל פעולה (create / ai_report) היא שורה עם seq רץ.
+    שורה שנשלחה מסומנת done_at — לא נמחקת מיד.
+    שורה שנכשלה MAX_ATTEMPTS פעמים, או ישנה מ-MAX_AGE_SECONDS, או שנכשלה סופית
+    (mark_dead) — מסומנת dead_at: לא נשלחת יותר ולא נמחקת (לשחזור ידני).
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            data_dir = _default_data_dir()
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, JOURNAL_FILE)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(journal)")}
+            if 'dead_at' not in columns:  # יומן מגרסה קודמת
+                self._conn.execute("ALTER TABLE journal ADD COLUMN dead_at REAL")
+            self._conn.commit()
+
+    def append(self, op, collection, doc_id, payload):
+        """רושם פעולה ביומן (נכתב לדיסק לפני שחוזרים). מחזיר seq."""
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO journal (op, collection, doc_id, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (op, collection, doc_id, encode_payload(payload), time.time()))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def due(self, limit=FLUSH_BATCH_SIZE, now=None):
+        """פעולות שממתינות ושהגיע זמנן — לפי סדר הרישום."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, op, collection, doc_id, payload, attempts FROM journal "
+                f"WHERE {_PENDING} AND next_attempt_at <= ? ORDER BY seq LIMIT ?",
+                (now, limit)).fetchall()
+        return [{'seq': seq, 'op': op, 'collection': collection, 'doc_id': doc_id,
+                 'payload': decode_payload(payload), 'attempts': attempts}
+                for seq, op, collection, doc_id, payload, attempts in rows]
+
+    def mark_done(self, seqs):
+        if not seqs:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE journal SET done_at = ?, last_error = NULL WHERE seq = ?",
+                                   [(now, seq) for seq in seqs])
+            self._conn.commit()
+
+    def mark_failed(self, seq, attempts, error):
+        """ניסיון נוסף אחרי backoff — או dead-letter אם עבר MAX_ATTEMPTS / MAX_AGE_SECONDS."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE journal SET attempts = ?, next_attempt_at = ?, last_error = ?, "
+                "dead_at = CASE WHEN ? >= ? OR created_at < ? THEN ? END WHERE seq = ?",
+                (attempts + 1, now + backoff_delay(attempts), str(error)[:500],
+                 attempts + 1, MAX_ATTEMPTS, now - MAX_AGE_SECONDS, now, seq))
+            self._conn.commit()
+
+    def mark_dead(self, seq, error):
+        """כישלון סופי — לא מנסים שוב."""
+        with self._lock:
+            self._conn.execute("UPDATE journal SET dead_at = ?, last_error = ? WHERE seq = ?",
+                               (time.time(), str(error)[:500], seq))
+            self._conn.commit()
+
+    def next_due_in(self):
+        """שניות עד הפעולה הממתינה הבאה (None = אין)."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT MIN(next_attempt_at) FROM journal WHERE {_PENDING}").fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM journal WHERE {_PENDING}").fetchone()[0]
+
+    def dead_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM journal WHERE dead_at IS NOT NULL").fetchone()[0]
+
+    def is_pending(self, doc_id, op='create'):
+        return self.state(doc_id, op) == 'pending'
+
+    def state(self, doc_id, op='create'):
+        """מצב הרישום האחרון של הפעולה: 'pending' / 'done' / 'dead', או None אם אין."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT done_at, dead_at FROM journal WHERE doc_id = ? AND op = ? ORDER BY seq DESC LIMIT 1",
+                (doc_id, op)).fetchone()
+        if row is None:
+            return None
+        done_at, dead_at = row
+        if done_at is not None:
+            return 'done'
+        return 'dead' if dead_at is not None else 'pending'
+
+    def prune(self, older_than=RETENTION_SECONDS):
+        with self._lock:
+            self._conn.execute("DELETE FROM journal WHERE done_at IS NOT NULL AND done_at < ?",
+                               (time.time() - older_than,))
+            self._conn.commit()
+
+
+class JournalFlusher:
+    """
+    Thread רקע שמרוקן את היומן: apply(rows) -> {seq: None (הצליח) או שגיאה}.
+    שגיאה מסוג FinalError — השורה לא תנוסה שוב.
+    נרדם עד הפעולה הבאה שהגיע זמנה, או עד wake().
+    """
+
+    def __init__(self, journal, apply, batch_size=FLUSH_BATCH_SIZE):
+        self.journal = journal
+        self.apply = apply
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="save_journal_flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def flush_once(self):
+        """מעביר מנה אחת של פעולות ממתינות. מחזיר כמה נשלחו בהצלחה."""
+        rows = self.journal.due(limit=self.batch_size)
+        if not rows:
+            return 0
+        try:
+            outcome = self.apply(rows)
+        except Exception as e:
+            outcome = {row['seq']: e for row in rows}
+        done = [row['seq'] for row in rows if outcome.get(row['seq'], 'missing outcome') is None]
+        self.journal.mark_done(done)
+        for row in rows:
+            error = outcome.get(row['seq'], 'missing outcome')
+            if isinstance(error, FinalError):
+                self.journal.mark_dead(row['seq'], error)
+            elif error is not None:
+                self.journal.mark_failed(row['seq'], row['attempts'], error)
+        return len(done)
+
+    def _run(self):
+        try:
+            self.journal.prune()
+        except Exception:
+            pass
+        while True:
+            try:
+                while self.flush_once():
+                    pass
+                wait = self.journal.next_due_in()
+            except Exception:
+                wait = BACKOFF_BASE_SECONDS
+            self._wake.wait(timeout=BACKOFF_MAX_SECONDS if wait is None else max(wait, 0.05))
+            self._wake.clear()
@@ -0,0 +1,386 @@
+"""
+Mednitai — Scoring Core
+=======================
+ליבת ציונים עמודתית (NumPy) — משותפת ל-HEXACO ולאמינות.
+תשובות נהפכות פעם אחת למערכים מוקלדים, וכל החישובים רצים וקטורית.
+"""
+
+import math
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+
+# ערכים שנחשבים "הפוך" בעמודת reverse — הסט של calculate_score / process_results
+# ושל process_integrity_results. שינוי התנהגות מכוון: _calc_effective ב-app.py
+# (אמינות חכמה וסתירות) קיבל קודם רק 'true'/'1'/'1.0'/'yes'/'t', ועכשיו גם 'ת'/'אמת' —
+# כך שכל המסלולים מחשבים אותו ציון. המאגרים הקיימים משתמשים רק ב-TRUE/FALSE.
+REVERSE_TRUE = frozenset(['true', '1', '1.0', 'yes', 't', 'ת', 'אמת'])
+
+
+def parse_reverse(value):
+    """True אם ערך ה-reverse מסמן שאלה הפוכה ('TRUE', 1, 'yes', 'אמת'...)."""
+    return str(value).strip().lower() in REVERSE_TRUE
+
+
+def parse_answer(value):
+    """התשובה כמספר, או None אם אי אפשר לפרש אותה."""
+    try:
+        return int(value)
+    except Exception:
+        return None
+
+
+def parse_time(value):
+    """זמן התגובה כ-float, או NaN אם אי אפשר לפרש אותו."""
+    try:
+        return float(value)
+    except Exception:
+        return np.nan
+
+
+def effective_score(answer, reverse):
+    """ציון אפקטיבי בודד (אחרי reverse), 1-5. תשובה לא תקינה = 3."""
+    score = parse_answer(answer)
+    if score is None:
+        return 3
+    if parse_reverse(reverse):
+        score = 6 - score
+    return max(1, min(5, score))
+
+
+class ResponseBatch:
+    """
+    אוסף תשובות במבנה עמודתי:
+    - answer: int8 (התשובה, קצוצה ל-0..6 — מספיק לכל ציון אפקטיבי)
+    - valid: bool (האם התשובה ניתנת לפירוש)
+    - reverse: bool
+    - trait: קוד int16 לכל תכונה/קטגוריה (-1 = חסר), trait_names = השמות
+    - response_time: float32 (NaN = חסר)
+    - score: int8 — הציון האפקטיבי
+    """
+
+    def __init__(self, responses, trait_key='trait', fallback_key=None, default_trait=''):
+        n = len(responses)
+        answers = np.zeros(n, dtype=np.int8)
+        valid = np.zeros(n, dtype=bool)
+        reverse = np.zeros(n, dtype=bool)
+        times = np.empty(n, dtype=np.float32)
+        traits = []
+        reverse_cache = {}
+
+        for i, r in enumerate(responses):
+            a = parse_answer(r.get('answer', 3))
+            if a is not None:
+                answers[i] = max(0, min(6, a))
+                valid[i] = True
+            rev = r.get('reverse', False)
+            try:
+                is_rev = reverse_cache[rev]
+            except KeyError:
+                is_rev = reverse_cache[rev] = parse_reverse(rev)
+            except TypeError:  # ערך לא hashable
+                is_rev = parse_reverse(rev)
+            reverse[i] = is_rev
+            times[i] = parse_time(r.get('response_time', 0))
+            if fallback_key:
+                traits.append(r.get(trait_key, r.get(fallback_key, default_trait)))
+            else:
+                traits.append(r.get(trait_key, default_trait))
+
+        self.size = n
+        self.answer = answers
+        self.valid = valid
+        self.reverse = reverse
+        self.response_time = times
+        codes, names = pd.factorize(pd.Series(traits, dtype=object), sort=True)
+        self.trait = codes.astype(np.int16)
+        self.trait_names = list(names)
+        self.score = self._effective_scores()
+
+    def __len__(self):
+        return self.size
+
+    def _effective_scores(self):
+        flipped = np.where(self.reverse, 6 - self.answer, self.answer)
+        scores = np.clip(flipped, 1, 5).astype(np.int8)
+        scores[~self.valid] = 3
+        return scores
+
+    def fast_mask(self, threshold):
+        """תשובות מהירות מהסף (זמן חסר לא נחשב מהיר)."""
+        return self.response_time < np.float32(threshold)
+
+    def fast_count(self, threshold):
+        return int(self.fast_mask(threshold).sum())
+
+    def trait_aggregates(self):
+        """
+        סכומים לכל תכונה במעבר אחד (bincount):
+        מחזיר dict עם names, count, mean_score, std_score (ddof=1), mean_time.
+        """
+        k = len(self.trait_names)
+        has_trait = self.trait >= 0
+        codes = self.trait[has_trait]
+        scores = self.score[has_trait].astype(np.float64)
+        times = self.response_time[has_trait].astype(np.float64)
+
+        count = np.bincount(codes, minlength=k)
+        s1 = np.bincount(codes, weights=scores, minlength=k)
+        s2 = np.bincount(codes, weights=scores * scores, minlength=k)
+        time_ok = ~np.isnan(times)
+        t_count = np.bincount(codes[time_ok], minlength=k)
+        t_sum = np.bincount(codes[time_ok], weights=times[time_ok], minlength=k)
+        return summary_columns(self.trait_names, count, s1, s2, t_count, t_sum)
+
+
+# ============================================================
+# Moments — ממוצע וסטיית תקן מסכומים (n, Σx, Σx²)
+# ============================================================
+def summary_columns(names, count, s1, s2, t_count, t_sum):
+    """
+    עמודות הסיכום לכל תכונה מסכומים: count, mean_score, std_score (ddof=1), mean_time.
+    משותף ל-ResponseBatch (bincount) ול-LiveAnalytics (סכומים רצים).
+    """
+    count = np.asarray(count, dtype=np.float64)
+    s1 = np.asarray(s1, dtype=np.float64)
+    s2 = np.asarray(s2, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_score = s1 / count
+        # ציונים שלמים — המונה מחושב במדויק
+        var = (count * s2 - s1 * s1) / (count * (count - 1))
+        std_score = np.sqrt(np.maximum(var, 0.0))
+        std_score[count < 2] = np.nan
+        mean_time = np.asarray(t_sum, dtype=np.float64) / np.asarray(t_count, dtype=np.float64)
+    return {
+        'names': list(names),
+        'count': count.astype(np.int64),
+        'mean_score': mean_score,
+        'std_score': std_score,
+        'mean_time': mean_time,
+    }
+
+
+def score_moments(scores):
+    """(n, Σx, Σx²) של ציונים — שלמים מדויקים כשהציונים שלמים. NaN לא נספר."""
+    values = pd.to_numeric(pd.Series(scores), errors='coerce').dropna()
+    if values.empty:
+        return 0, 0, 0
+    if (values == values.round()).all():
+        values = [int(v) for v in values]
+    else:
+        values = [float(v) for v in values]
+    return len(values), sum(values), sum(v * v for v in values)
+
+
+def _variance_cmp(n, s1, s2, limit, ddof=1):
+    """משווה את השונות ל-limit² — בחשבון שלמים מדויק כשהסכומים שלמים. -1/0/1."""
+    limit = Fraction(str(limit))
+    lhs = (n * s2 - s1 * s1) * limit.denominator ** 2
+    rhs = limit.numerator ** 2 * n * (n - ddof)
+    return (lhs > rhs) - (lhs < rhs)
+
+
+def std_below(n, s1, s2, limit, ddof=1):
+    """האם סטיית התקן קטנה מ-limit (n - ddof < 1 = אין סטיית תקן = False)."""
+    return n - ddof >= 1 and _variance_cmp(n, s1, s2, limit, ddof) < 0
+
+
+def std_above(n, s1, s2, limit, ddof=1):
+    return n - ddof >= 1 and _variance_cmp(n, s1, s2, limit, ddof) > 0
+
+
+def moments_std(n, s1, s2, ddof=1):
+    den = n * (n - ddof)
+    if den <= 0:
+        return float('nan')
+    return math.sqrt(max(n * s2 - s1 * s1, 0) / den)
+
+
+# ============================================================
+# Reliability & Fatigue — הכללים מתוך ספירות
+# (החישוב המלא וה-LiveAnalytics המצטבר קוראים לאותן פונקציות)
+# ============================================================
+def smart_reliability_score(contradictions, fast_count, answer_counts, is_binary=False):
+    """
+    אמינות מותאמת (LiveAnalytics.smart_reliability):
+    contradictions — רשומות הסתירות החכמות; fast_count — תשובות מתחת ל-1.4 שניות;
+    answer_counts — {תשובה (int): כמה פעמים}. במבחן בינארי לא מענישים על קיצוניות.
+    """
+    score = 100.0
+    for c in contradictions:
+        score -= 12 if c.get('severity') == 'critical' else 6
+    score -= fast_count * 2
+
+    answer_counts = {a: k for a, k in answer_counts.items() if k}
+    n = sum(answer_counts.values())
+    if n > 5:
+        unique = len(answer_counts)
+        if is_binary:
+            if unique == 1:
+                score -= 30
+        elif unique <= 1:
+            score -= 30
+        elif unique == 2:
+            score -= 15
+        s1 = sum(a * k for a, k in answer_counts.items())
+        s2 = sum(a * a * k for a, k in answer_counts.items())
+        if not is_binary and std_below(n, s1, s2, 0.3):
+            score -= 15
+
+    if not is_binary and n:
+        extreme_ratio = (answer_counts.get(1, 0) + answer_counts.get(5, 0)) / n
+        if extreme_ratio > 0.7:
+            score -= 20
+
+    return max(0, min(100, round(score)))
+
+
+def integrity_reliability_score(n, critical=0, high=0, fast_count=0, monotone=False,
+                                extreme_count=0, polygraph_mean=None):
+    """
+    אמינות במבחן האמינות (calculate_reliability_score): n תשובות, סתירות critical/high,
+    תשובות מתחת ל-5 שניות, מונוטוניות (SD < 0.3), ציונים קיצוניים (1/5), וממוצע הפוליגרף.
+    """
+    if not n:
+        return 100
+    score = 100.0
+    score -= critical * 35
+    score -= high * 15
+    score -= fast_count * 1.5
+    if monotone:
+        score -= 15
+    if extreme_count / n > 0.7:
+        score -= 20
+    if polygraph_mean is not None and polygraph_mean < 2:
+        score -= 10
+    return max(0, min(100, round(score)))
+
+
+def fatigue_score(third, avg_first, avg_last, avg_tail, first_std, last_std, tail_unique):
+    """
+    מדד עייפות 0-100 (calculate_fatigue_index) מתוך סטטיסטיקות החלונות:
+    avg_first / avg_last / avg_tail — ממוצע הזמנים החיוביים בשליש הראשון / האחרון / ב-10%
+    האחרונים (None = אין זמנים); first_std / last_std — סטיית תקן (ddof=0) של התשובות
+    בשליש הראשון / האחרון; tail_unique — מספר התשובות השונות ב-min(10, third) האחרונות.
+    """
+    fatigue = 0
+
+    # האטה משמעותית (או האצה — ממהרים לסיים)
+    if avg_first is not None and avg_last is not None and avg_first > 0:
+        time_ratio = avg_last / avg_first
+        if time_ratio > 1.5:
+            fatigue += 30
+        elif time_ratio > 1.2:
+            fatigue += 15
+        elif time_ratio < 0.6:
+            fatigue += 25
+        elif time_ratio < 0.8:
+            fatigue += 10
+
+    # פחות פיזור בסוף (ברירת מחדל לאמצע) — או הרבה יותר (חוסר תשומת לב)
+    if third > 2:
+        if last_std < first_std * 0.5 and first_std > 0.5:
+            fatigue += 20
+        elif last_std < first_std * 0.7 and first_std > 0.5:
+            fatigue += 10
+        if last_std > first_std * 1.8 and last_std > 1.0:
+            fatigue += 15
+
+    # ה-10% האחרונים מהירים מאוד
+    if avg_tail is not None and avg_first is not None and avg_first > 0 and avg_tail < avg_first * 0.4:
+        fatigue += 20
+
+    # תשובות מונוטוניות בסוף
+    if third > 5 and tail_unique <= 2:
+        fatigue += 15
+
+    return min(100, max(0, fatigue))
+
+
+# ============================================================
+# Gap Pairs — ספירת זוגות עם פער מהיסטוגרמה (במקום כל הזוגות)
+# ============================================================
+_MAX_DENSE_SCORE = 64
+
+
+def score_histograms(scores, groups=None, n_groups=None):
+    """
+    היסטוגרמת ציונים לכל קבוצה (תכונה/קטגוריה).
+    groups: קודים שלמים (-1 = לא שייך לאף קבוצה). None = קבוצה אחת.
+    מחזיר (values, hist) — hist[g, v] = כמה פעמים הציון values[v] הופיע בקבוצה g.
+    ציונים שלמים קטנים (1-5) נספרים ב-bincount — O(n).
+    """
+    scores = np.asarray(scores)
+    if groups is None:
+        groups = np.zeros(len(scores), dtype=np.int64)
+        n_groups = 1
+    groups = np.asarray(groups, dtype=np.int64)
+    if n_groups is None:
+        n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+    keep = groups >= 0
+    if scores.dtype.kind == 'f':
+        keep &= ~np.isnan(scores)
+    scores, groups = scores[keep], groups[keep]
+
+    if len(scores) == 0:
+        return np.array([]), np.zeros((n_groups, 0), dtype=np.int64)
+
+    if (scores.dtype.kind in 'iub' and scores.min() >= 0
+            and scores.max() <= _MAX_DENSE_SCORE):
+        values = np.arange(int(scores.max()) + 1)
+        idx = scores.astype(np.int64)
+    else:
+        values, idx = np.unique(scores, return_inverse=True)
+
+    n_values = len(values)
+    hist = np.bincount(groups * n_values + idx, minlength=n_groups * n_values)
+    return values, hist.reshape(n_groups, n_values)
+
+
+def _gap_matrix(values, min_gap):
+    """מטריצת (a, b) של זוגות ערכים שונים (a < b) שהפער ביניהם >= min_gap."""
+    gaps = np.abs(values[None, :] - values[:, None])
+    upper = np.triu(np.ones((len(values), len(values)), dtype=bool), k=1)
+    return (gaps >= min_gap) & upper, gaps
+
+
+def count_gap_pairs(values, hist, min_gap):
+    """מספר הזוגות (i < j) עם |score_i - score_j| >= min_gap בכל קבוצה."""
+    if hist.shape[1] == 0:
+        return np.zeros(hist.shape[0], dtype=np.int64)
+    allowed, _ = _gap_matrix(values, min_gap)
+    counts = np.einsum('ga,ab,gb->g', hist, allowed.astype(np.int64), hist)
+    if min_gap <= 0:
+        counts = counts + (hist * (hist - 1) // 2).sum(axis=1)
+    return counts.astype(np.int64)
+
+
+def iter_gap_pairs(values, hist_row, min_gap):
+    """(gap, n_pairs) לכל צמד ערכים בקבוצה אחת — לבניית רשומות סתירה."""
+    if len(hist_row) == 0:
+        return
+    allowed, gaps = _gap_matrix(values, min_gap)
+    if min_gap <= 0:
+        for a in np.nonzero(hist_row > 1)[0]:
+            yield gaps[a, a], int(hist_row[a] * (hist_row[a] - 1) // 2)
+    for a, b in zip(*np.nonzero(allowed)):
+        n = int(hist_row[a] * hist_row[b])
+        if n:
+            yield gaps[a, b], n
+
+
+def label_score_histograms(labels, scores):
+    """
+    היסטוגרמות ציונים לפי עמודת תווית (trait/category) של DataFrame.
+    מחזיר (names, values, hist) — names לפי סדר ההופעה (כמו unique()).
+    """
+    codes, names = pd.factorize(pd.Series(labels))
+    scores = pd.to_numeric(pd.Series(scores), errors='coerce')
+    if scores.dtype.kind in 'iuf':
+        scores = scores.to_numpy()
+    else:
+        scores = scores.to_numpy(dtype=np.float64, na_value=np.nan)
+    values, hist = score_histograms(scores, codes, len(names))
+    return list(names), values, hist
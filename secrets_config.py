@@ -0,0 +1,71 @@
+"""
+Mednitai — Secrets
+==================
+מקור אחד למפתחות (Gemini, Claude, Firebase) — גם בתוך Streamlit וגם מחוץ לו.
+סדר: קובץ secrets מפורש (python -m ai_worker --secrets, או MEDNITAI_SECRETS_FILE) →
+st.secrets (כשיש .streamlit/secrets.toml) → משתני סביבה (טבלה כמו firebase — JSON).
+"""
+
+import json
+import os
+import threading
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+SECRETS_FILE_ENV = "MEDNITAI_SECRETS_FILE"
+
+_file_secrets = None
+_file_lock = threading.Lock()
+
+
+def load_secrets_file(path):
+    """טוען קובץ TOML בפורמט של secrets.toml — גובר על st.secrets ועל משתני הסביבה."""
+    global _file_secrets
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+    with _file_lock:
+        _file_secrets = data
+    return data
+
+
+def _from_file():
+    global _file_secrets
+    if _file_secrets is None and os.environ.get(SECRETS_FILE_ENV):
+        with _file_lock:
+            if _file_secrets is None:
+                try:
+                    with open(os.environ[SECRETS_FILE_ENV], "rb") as f:
+                        _file_secrets = tomllib.load(f)
+                except Exception:
+                    _file_secrets = {}
+    return _file_secrets or {}
+
+
+def _from_streamlit(name):
+    try:
+        import streamlit as st
+        return st.secrets[name]
+    except Exception:
+        # מחוץ ל-Streamlit בלי secrets.toml — st.secrets זורק
+        return None
+
+
+def _from_env(name):
+    value = os.environ.get(name)
+    if value and value.lstrip().startswith("{"):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def get_secret(name, default=None):
+    """הערך של name מהמקור הראשון שיש בו אותו, או default."""
+    for value in (_from_file().get(name), _from_streamlit(name), _from_env(name)):
+        if value not in (None, ""):
+            return value
+    return default
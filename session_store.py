@@ -0,0 +1,288 @@
+"""
+Mednitai — Session Store
+========================
+ייצוג קומפקטי של המבחן ב-session_state:
+- QUESTION_TABLE — טבלת שאלות (ומחרוזות) משותפת לכל התהליך. שורה שנכנסה לא משתנה.
+- QuestionList — רשימת השאלות של המבחן כמזהים (array) לתוך הטבלה.
+- ResponseLog — יומן תשובות עמודתי: answer int8, זמנים float32, דגלים בביטים,
+  טקסטים כמזהים. כל שורה נקראת כמו dict (get / [] / items) — הקוד הקיים לא משתנה.
+המזהים תקפים רק בתהליך שיצר אותם (session_state לא עובר בין תהליכים).
+"""
+
+import math
+import threading
+from array import array
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from scoring import parse_reverse
+
+
+def _clean(value):
+    """ערך לשמירה בטבלה: numpy → python, list → tuple (immutable)."""
+    if hasattr(value, 'item') and type(value).__module__ == 'numpy':
+        value = value.item()
+    if isinstance(value, (list, tuple)):
+        return tuple(_clean(v) for v in value)
+    if isinstance(value, dict):
+        return MappingProxyType({k: _clean(v) for k, v in value.items()})
+    return value
+
+
+def _is_missing(value):
+    return isinstance(value, float) and math.isnan(value)
+
+
+def _freeze(value):
+    """ערך hashable לחתימת השאלה."""
+    if isinstance(value, Mapping):
+        return tuple(sorted((str(k), _freeze(v)) for k, v in value.items()))
+    if isinstance(value, tuple):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+class QuestionTable:
+    """
+    טבלת שאלות ומחרוזות משותפת לכל ה-sessions בתהליך.
+    intern(question) -> מזהה; שאלה זהה (אותו תוכן) מקבלת את אותו מזהה.
+    השורות הן MappingProxyType — בלי עמודות ריקות (NaN של pandas) ובלי העתקים לכל משתמש.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = []
+        self._row_ids = {}     # חתימה -> מזהה
+        self._proxy_ids = {}   # id(שורה) -> מזהה — שורה שכבר בטבלה לא נבדקת שוב
+        self._texts = []
+        self._text_ids = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, qid):
+        return self._rows[qid]
+
+    def intern(self, question):
+        qid = self._proxy_ids.get(id(question))
+        if qid is not None and self._rows[qid] is question:
+            return qid
+        clean = {k: _clean(v) for k, v in dict(question).items() if not _is_missing(v)}
+        signature = tuple(sorted((str(k), _freeze(v)) for k, v in clean.items()))
+        with self._lock:
+            qid = self._row_ids.get(signature)
+            if qid is None:
+                row = MappingProxyType(clean)
+                qid = len(self._rows)
+                self._rows.append(row)
+                self._row_ids[signature] = qid
+                self._proxy_ids[id(row)] = qid
+        return qid
+
+    def intern_text(self, text):
+        tid = self._text_ids.get(text)
+        if tid is None:
+            with self._lock:
+                tid = self._text_ids.get(text)
+                if tid is None:
+                    tid = len(self._texts)
+                    self._texts.append(text)
+                    self._text_ids[text] = tid
+        return tid
+
+    def text(self, tid):
+        return self._texts[tid]
+
+
+QUESTION_TABLE = QuestionTable()
+
+
+class QuestionList:
+    """רשימת השאלות של מבחן — מזהים בלבד; כל שאלה נקראת מהטבלה המשותפת (read-only)."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, questions=()):
+        self.ids = array('i', (QUESTION_TABLE.intern(q) for q in questions))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [QUESTION_TABLE[qid] for qid in self.ids[index]]
+        return QUESTION_TABLE[self.ids[index]]
+
+    def __iter__(self):
+        return (QUESTION_TABLE[qid] for qid in self.ids)
+
+    def insert(self, index, question):
+        self.ids.insert(index, QUESTION_TABLE.intern(question))
+
+    def append(self, question):
+        self.ids.append(QUESTION_TABLE.intern(question))
+
+
+# ============================================================
+# Response log
+# ============================================================
+# סדר השדות = סדר העמודות בייצוא (כמו ה-dict המקורי של _handle_answer)
+FIELDS = ('question_index', 'question', 'answer', 'response_time', 'wpm_threshold',
+          'is_too_fast', 'is_hesitation', 'trait', 'reverse', 'is_stress_meta', 'category', 'is_video')
+_BIT = {name: 1 << i for i, name in enumerate(FIELDS)}   # ביט "השדה קיים בשורה"
+_TEXT_FIELDS = ('question', 'trait', 'category')
+_FLAG_FIELDS = ('is_too_fast', 'is_hesitation', 'reverse', 'is_stress_meta', 'is_video')
+_FLAG = {name: 1 << i for i, name in enumerate(_FLAG_FIELDS)}
+_TIME_FIELDS = ('response_time', 'wpm_threshold')
+TIME_DECIMALS = 2   # הזמנים נשמרים ב-float32 ומוחזרים מעוגלים ל-1/100 שנייה
+
+
+class Response(Mapping):
+    """שורה ב-ResponseLog — נקראת כמו dict. שתי שורות שוות אם הן אותה תשובה ביומן."""
+
+    __slots__ = ('_log', '_row', '_serial')
+
+    def __init__(self, log, row):
+        self._log = log
+        self._row = row
+        self._serial = log._serials[row]
+
+    def __getitem__(self, key):
+        return self._log._value(self._row, key)
+
+    def __iter__(self):
+        return iter(self._log._keys(self._row))
+
+    def __len__(self):
+        return len(self._log._keys(self._row))
+
+    def __eq__(self, other):
+        if isinstance(other, Response):
+            return self._log is other._log and self._serial == other._serial
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self._log), self._serial))
+
+    def __repr__(self):
+        return f"Response({dict(self)!r})"
+
+
+class ResponseLog:
+    """
+    יומן התשובות של מבחן, בעמודות מוקצות מראש (capacity = מספר השאלות):
+    answer int8, response_time/wpm_threshold float32, דגלים בביט-מסכה,
+    שאלה/תכונה/קטגוריה כמזהים ב-QUESTION_TABLE. שדות אחרים (טקסט וידאו) — ב-dict דליל.
+    API של רשימה: append(dict), pop(), len, [i], [a:b], iteration.
+    """
+
+    __slots__ = ('_n', '_next_serial', '_serials', '_present', '_flags', '_index',
+                 '_texts', '_answer', '_times', '_extras')
+
+    def __init__(self, capacity=0):
+        capacity = max(int(capacity), 0)
+        self._n = 0
+        self._next_serial = 0
+        self._serials = array('I', bytes(4 * capacity))
+        self._present = array('H', bytes(2 * capacity))
+        self._flags = array('B', bytes(capacity))
+        self._index = array('i', bytes(4 * capacity))
+        self._texts = {name: array('i', bytes(4 * capacity)) for name in _TEXT_FIELDS}
+        self._answer = array('b', bytes(capacity))
+        self._times = {name: array('f', bytes(4 * capacity)) for name in _TIME_FIELDS}
+        self._extras = {}   # row -> {key: value}
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Response(self, i) for i in range(*index.indices(self._n))]
+        if index < 0:
+            index += self._n
+        if not 0 <= index < self._n:
+            raise IndexError("response index out of range")
+        return Response(self, index)
+
+    def __iter__(self):
+        return (Response(self, i) for i in range(self._n))
+
+    def _columns(self):
+        return ([self._serials, self._present, self._flags, self._index, self._answer]
+                + list(self._texts.values()) + list(self._times.values()))
+
+    def _grow(self):
+        for column in self._columns():
+            column.extend(array(column.typecode, bytes(column.itemsize * max(16, len(column)))))
+
+    def append(self, record):
+        if self._n == len(self._serials):
+            self._grow()
+        row = self._n
+        present = flags = 0
+        extras = {}
+        for key, value in record.items():
+            try:
+                if key in _FLAG:
+                    flags |= _FLAG[key] if (parse_reverse(value) if key == 'reverse' else bool(value)) else 0
+                elif key in _TEXT_FIELDS:
+                    if not isinstance(value, str):
+                        raise TypeError(key)
+                    self._texts[key][row] = QUESTION_TABLE.intern_text(str(value))
+                elif key in _TIME_FIELDS:
+                    self._times[key][row] = value
+                elif key == 'answer':
+                    if isinstance(value, bool) or int(value) != value:
+                        raise TypeError(key)
+                    self._answer[row] = int(value)
+                elif key == 'question_index':
+                    self._index[row] = int(value)
+                else:
+                    raise KeyError(key)
+                present |= _BIT[key]
+            except (TypeError, ValueError, OverflowError, KeyError):
+                extras[key] = value   # לא נכנס לעמודה — נשמר כמו שהוא
+        self._present[row] = present
+        self._flags[row] = flags
+        self._serials[row] = self._next_serial
+        self._next_serial += 1
+        if extras:
+            self._extras[row] = extras
+        else:
+            self._extras.pop(row, None)
+        self._n += 1
+
+    def pop(self):
+        if not self._n:
+            raise IndexError("pop from empty response log")
+        record = dict(Response(self, self._n - 1))
+        self._n -= 1
+        self._extras.pop(self._n, None)
+        return record
+
+    def to_dicts(self):
+        """כל התשובות כ-dicts רגילים (לייצוא / pandas)."""
+        return [dict(r) for r in self]
+
+    def _keys(self, row):
+        present = self._present[row]
+        keys = [name for name in FIELDS if present & _BIT[name]]
+        return keys + list(self._extras.get(row, ()))
+
+    def _value(self, row, key):
+        bit = _BIT.get(key)
+        if bit is None or not self._present[row] & bit:
+            return self._extras.get(row, {})[key]
+        if key in _FLAG:
+            return bool(self._flags[row] & _FLAG[key])
+        if key in _TEXT_FIELDS:
+            return QUESTION_TABLE.text(self._texts[key][row])
+        if key in _TIME_FIELDS:
+            return round(self._times[key][row], TIME_DECIMALS)
+        if key == 'answer':
+            return self._answer[row]
+        return self._index[row]
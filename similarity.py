@@ -0,0 +1,321 @@
+"""
+Mednitai — Text Similarity
+==========================
+דמיון טקסט מבוסס trigrams לזיהוי סתירות חכם.
+Prefix-filtered inverted index: מוצאים זוגות דומים בלי להשוות כל זוג.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import defaultdict
+
+_NON_LETTERS_RE = re.compile(r'[^\u05D0-\u05EA\u05F0-\u05F4a-z\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+# דיוק של floating point — 0.3 * 10 = 3.0000000000000004
+_EPS = 1e-9
+
+
+def clean_for_trigrams(text):
+    """ניקוי טקסט לפני יצירת trigrams — שומרים על אותיות ורווחים בלבד."""
+    text = str(text).lower()
+    # רק אותיות עברית/אנגלית + רווח
+    text = _NON_LETTERS_RE.sub(' ', text)
+    text = _SPACES_RE.sub(' ', text).strip()
+    return text
+
+
+def trigrams(text, n=3):
+    """יוצר סט של תת-מחרוזות באורך n מהטקסט.
+    שיטה עמידה למורפולוגיה עברית — מתעלם מקידומות וסיומות.
+    """
+    text = clean_for_trigrams(text)
+    if len(text) < n:
+        return set()
+    return set(text[i:i+n] for i in range(len(text) - n + 1))
+
+
+def jaccard(t1, t2):
+    """Jaccard על שני סטים מוכנים מראש. מחזיר 0.0 - 1.0."""
+    if not t1 or not t2:
+        return 0.0
+    inter = len(t1 & t2)
+    return inter / (len(t1) + len(t2) - inter)
+
+
+def text_similarity(text1, text2):
+    """דמיון Jaccard על trigrams — מתאים מאוד לעברית.
+    מחזיר 0.0 - 1.0.
+    """
+    return jaccard(trigrams(text1, n=3), trigrams(text2, n=3))
+
+
+def _prefix_len(size, threshold):
+    """אורך ה-prefix שמבטיח חפיפה לכל זוג עם Jaccard >= threshold."""
+    return size - math.ceil(threshold * size - _EPS) + 1
+
+
+class TrigramIndex:
+    """
+    אינדקס הפוך על trigrams — נבנה פעם אחת לכל סט טקסטים.
+
+    כל טקסט מקבל מזהה רץ (0, 1, 2...). רק ה-prefix של כל סט (ה-trigrams
+    הנדירים ביותר) נכנס לאינדקס, כך שזוגות מועמדים הם רק כאלה שחולקים
+    trigram נדיר. הדמיון הסופי מחושב במדויק על הסטים המוכנים —
+    התוצאה זהה להשוואת כל הזוגות.
+    """
+
+    def __init__(self, texts=(), threshold=0.30):
+        self.threshold = threshold
+        self.sets = []
+        self._by_text = {}
+        for text in texts:
+            self.add(text)
+
+    def add(self, text):
+        """מוסיף טקסט ומחזיר את המזהה שלו. טקסט זהה לא מחושב פעמיים."""
+        text = str(text)
+        grams = self._by_text.get(text)
+        if grams is None:
+            grams = trigrams(text)
+            self._by_text[text] = grams
+        self.sets.append(grams)
+        return len(self.sets) - 1
+
+    def __len__(self):
+        return len(self.sets)
+
+    def similarity(self, i, j):
+        return jaccard(self.sets[i], self.sets[j])
+
+    def similar_pairs(self):
+        """
+        מחזיר dict של {(i, j): similarity} לכל זוג i < j עם דמיון >= threshold.
+        """
+        threshold = self.threshold
+        if threshold <= 0:
+            # כל זוג עובר את הסף — אין מה לסנן
+            n = len(self.sets)
+            return {(i, j): self.similarity(i, j)
+                    for i in range(n) for j in range(i + 1, n)}
+
+        # סדר גלובלי: trigrams נדירים קודם
+        freq = defaultdict(int)
+        for s in self.sets:
+            for g in s:
+                freq[g] += 1
+
+        postings = defaultdict(list)
+        pairs = {}
+        for j, s in enumerate(self.sets):
+            if not s:
+                continue
+            ordered = sorted(s, key=lambda g: (freq[g], g))
+            size = len(s)
+            candidates = set()
+            for g in ordered[:_prefix_len(size, threshold)]:
+                bucket = postings[g]
+                candidates.update(bucket)
+                bucket.append(j)
+
+            for i in candidates:
+                other = len(self.sets[i])
+                # סינון אורך — Jaccard חסום ע"י min/max של הגדלים
+                if min(size, other) < threshold * max(size, other) - _EPS:
+                    continue
+                sim = jaccard(self.sets[i], s)
+                if sim >= threshold:
+                    pairs[(i, j)] = sim
+        return pairs
+
+
+# ============================================================
+# Static Question Banks — Precomputed Similarity Table
+# ============================================================
+BANK_INDEX_VERSION = 2
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+BANK_CSV_FILES = tuple(os.path.join(_MODULE_DIR, "data", name)
+                       for name in ("questions.csv", "integrity_questions.csv"))
+
+
+def _default_cache_dir():
+    return os.environ.get("MEDNITAI_CACHE_DIR", os.path.join(_MODULE_DIR, ".cache"))
+
+
+def csv_content_hash(paths):
+    """hash של תוכן קבצי ה-CSV — כל שינוי בשאלות מבטל את ה-cache."""
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8'))
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class QuestionBankIndex:
+    """
+    טבלה מוכנה מראש לשאלות הקבועות (questions.csv + integrity_questions.csv):
+    טקסט נקי, סט trigrams, וטבלה דלילה של זוגות דומים מעל הסף.
+    כל שאלה מזוהה ע"י id רץ לפי הטקסט שלה.
+    """
+
+    def __init__(self, texts, threshold=0.30, content_hash=None):
+        self.threshold = threshold
+        self.content_hash = content_hash
+        self.ids = {}
+        self.texts = []
+        for text in texts:
+            text = str(text)
+            if text not in self.ids:
+                self.ids[text] = len(self.texts)
+                self.texts.append(text)
+        self.cleaned = [clean_for_trigrams(t) for t in self.texts]
+        index = TrigramIndex(self.texts, threshold=threshold)
+        self.sets = index.sets
+        # {id: {other_id: similarity}} — סימטרי
+        self.neighbors = defaultdict(dict)
+        for (i, j), sim in index.similar_pairs().items():
+            self.neighbors[i][j] = sim
+            self.neighbors[j][i] = sim
+        self.neighbors = dict(self.neighbors)
+
+    def to_state(self):
+        """מצב JSON (רשימות ומספרים בלבד) לשמירה בדיסק. זוגות: [i, j, similarity] עם i < j."""
+        return {
+            'version': BANK_INDEX_VERSION,
+            'threshold': self.threshold,
+            'content_hash': self.content_hash,
+            'texts': self.texts,
+            'cleaned': self.cleaned,
+            'sets': [sorted(s) for s in self.sets],
+            'pairs': [[i, j, sim] for i, others in sorted(self.neighbors.items())
+                      for j, sim in sorted(others.items()) if i < j],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        bank = cls.__new__(cls)
+        bank.threshold = float(state['threshold'])
+        bank.content_hash = state['content_hash']
+        bank.texts = [str(t) for t in state['texts']]
+        bank.ids = {t: i for i, t in enumerate(bank.texts)}
+        bank.cleaned = [str(t) for t in state['cleaned']]
+        bank.sets = [set(s) for s in state['sets']]
+        neighbors = defaultdict(dict)
+        for i, j, sim in state['pairs']:
+            neighbors[int(i)][int(j)] = neighbors[int(j)][int(i)] = float(sim)
+        bank.neighbors = dict(neighbors)
+        return bank
+
+    def question_id(self, text):
+        return self.ids.get(str(text))
+
+    def similar_pairs_for(self, texts, threshold=None):
+        """
+        כמו TrigramIndex.similar_pairs — אבל שאלות מהמאגר נבדקות מול הטבלה המוכנה.
+        רק טקסטים שלא במאגר (וידאו, שאלות חדשות) מחושבים בזמן ריצה.
+        מחזיר dict של {(i, j): similarity} לפי המיקום ב-texts.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if threshold < self.threshold:
+            # הטבלה לא מכילה זוגות מתחת לסף שלה
+            return TrigramIndex(texts, threshold=threshold).similar_pairs()
+
+        texts = [str(t) for t in texts]
+        positions = defaultdict(list)  # bank id -> מיקומים ב-texts
+        unknown = []                   # (מיקום, סט) לטקסטים שלא במאגר
+        sets = []
+        for pos, text in enumerate(texts):
+            qid = self.ids.get(text)
+            if qid is None:
+                grams = trigrams(text)
+                unknown.append((pos, grams))
+                sets.append(grams)
+            else:
+                positions[qid].append(pos)
+                sets.append(self.sets[qid])
+
+        pairs = {}
+        for qid, own in positions.items():
+            # אותה שאלה שנענתה יותר מפעם אחת
+            if len(own) > 1 and self.sets[qid]:
+                for a in range(len(own)):
+                    for b in range(a + 1, len(own)):
+                        pairs[(own[a], own[b])] = 1.0
+            for other, sim in self.neighbors.get(qid, {}).items():
+                if other <= qid or sim < threshold or other not in positions:
+                    continue
+                for i in own:
+                    for j in positions[other]:
+                        pairs[(min(i, j), max(i, j))] = sim
+
+        for pos, grams in unknown:
+            for other in range(len(texts)):
+                if other == pos:
+                    continue
+                key = (min(pos, other), max(pos, other))
+                if key in pairs:
+                    continue
+                sim = jaccard(grams, sets[other])
+                if sim >= threshold:
+                    pairs[key] = sim
+        return pairs
+
+
+def _read_bank_texts(paths):
+    import csv
+    texts = []
+    for path in paths:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                text = row.get('q') or row.get('question') or ''
+                if text:
+                    texts.append(text)
+    return texts
+
+
+def load_bank_index(paths=BANK_CSV_FILES, threshold=0.30, cache_dir=None):
+    """
+    טוען את טבלת הדמיון של המאגרים מה-cache בדיסק, או בונה אותה מחדש
+    אם תוכן ה-CSV השתנה. אם אין הרשאת כתיבה — פשוט מחזיר את הטבלה מהזיכרון.
+    """
+    content_hash = csv_content_hash(paths)
+    cache_dir = cache_dir or _default_cache_dir()
+    cache_path = os.path.join(
+        cache_dir, f"bank_index_v{BANK_INDEX_VERSION}_{threshold:.2f}_{content_hash[:16]}.json")
+
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if (state.get('version') == BANK_INDEX_VERSION
+                and state.get('content_hash') == content_hash):
+            return QuestionBankIndex.from_state(state)
+    except Exception:
+        pass
+
+    bank = QuestionBankIndex(_read_bank_texts(paths), threshold=threshold,
+                             content_hash=content_hash)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # מוחקים גרסאות ישנות של הטבלה (CSV שהשתנה)
+        for name in os.listdir(cache_dir):
+            if name.startswith("bank_index_") and name.endswith((".pkl", ".json")):
+                os.remove(os.path.join(cache_dir, name))
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(bank.to_state(), f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        pass
+    return bank
+
+
+if __name__ == "__main__":
+    # שלב build: python -m similarity
+    _bank = load_bank_index()
+    _n_pairs = sum(len(v) for v in _bank.neighbors.values()) // 2
+    print(f"bank index: {len(_bank.texts)} questions, {_n_pairs} similar pairs "
+          f"(threshold {_bank.threshold:.2f}, hash {_bank.content_hash[:16]})")